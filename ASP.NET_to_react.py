@@ -1,13 +1,50 @@
 import os
-import google.generativeai as genai
 import re
+import sys
 from pathlib import Path
-
-# Set your  API key (or set key as an environment variable)
-genai.configure(api_key="key")
+from conversion_journal import ConversionJournal
+from conversion_manifest import ConversionManifest, hash_text
+from llm_backends import GeminiBackend
+from llm_cache import ResponseCache
+from llm_dispatch import CHARS_PER_TOKEN, RateLimiter, dispatch, estimate_tokens, plan_batches
+from llm_retry import EmptyResponseError, RetryPolicy
+from output_validation import validate_files
+from output_writer import OutputWriter
+from prompt_compaction import compact_csharp
+from run_report import REPORT_NAME, RunReport
+from sharding import load_shard_units, merge_unit, select_shard
+from stream_extract import TaggedSectionStreamParser
+from structured_output import ResponseFormat, parse_files
+from watch import SKIPPED_DIRS, create_watcher, normalize_path, recorded_inputs, touches, watch
 
 # Model to use
-model = genai.GenerativeModel('gemini-2.5-flash')
+MODEL_NAME = 'gemini-2.5-flash'
+
+# Backend that answers prompts. The SDK is only configured on the first real call,
+# and tests/benchmarks can swap in llm_backends.StubBackend.
+# Set your API key in GeminiBackend(api_key=...) or the GOOGLE_API_KEY environment variable.
+backend = GeminiBackend(MODEL_NAME)
+
+# Timings, token counts and retries of the current run; process_forms restarts it and writes it out
+report = RunReport()
+
+# Retries, backoff and the circuit breaker, shared by every model call (and worker) of a run
+retry_policy = RetryPolicy(report=report)
+
+# Atomic writes that leave unchanged files untouched; process_forms resets its counts
+writer = OutputWriter()
+
+# Tag or JSON responses, and how often parsing them failed; process_forms selects the format and resets the counts
+response_format = ResponseFormat()
+
+# File of each tagged section in a structured (JSON) response, e.g. LoginForm.routes.js for ROUTES
+SECTION_FILES = {"JSX": "jsx", "CSS": "css", "ROUTES": "routes.js"}
+
+# Forms estimated at up to this many prompt tokens are small enough to share a batched prompt
+SMALL_FORM_TOKENS = 2000
+
+# Source files whose changes watch mode reconverts (code-behind and designer files)
+WATCHED_EXTENSIONS = (".cs",)
 
 # Step 1: Find all WinForms groups (.cs + .Designer.cs + .resx)
 def find_winforms_forms(project_path):
@@ -65,7 +102,31 @@ Please output the result as:
 
 Do not add explanation or markdown. Only raw code blocks between those tags.
 
-Requirements:
+{conversion_requirements(f"/{form_name.lower()}")}{response_format.instructions(structured_paths(form_name))}"""
+
+# How a structured response names the files of a form's sections
+def structured_paths(form_name, tags=("JSX", "CSS", "ROUTES")):
+    paths = ", ".join(f"`{form_name}.{SECTION_FILES[tag]}` for the {tag} section" for tag in tags)
+    return f'Use as "path" {paths}.'
+
+# Split the files of a structured response into {form_name: {tag: content}}; unknown files are ignored
+def file_sections(files):
+    forms = {}
+    for path, content in files:
+        form_name, _, suffix = path.replace("\\", "/").rsplit("/", 1)[-1].partition(".")
+        tag = next((tag for tag, file_suffix in SECTION_FILES.items() if suffix.lower() == file_suffix), None)
+        if tag:
+            # Like the tag format, only the first section of each tag is used
+            forms.setdefault(form_name, {}).setdefault(tag, content)
+    return forms
+
+# Format {tag: content} as tagged sections, the format extract_parts reads
+def serialize_sections(sections):
+    return "".join(f"[BEGIN_{tag}]\n{content}\n[END_{tag}]\n" for tag, content in sections.items() if content)
+
+# Requirements shared by single-form and batched prompts
+def conversion_requirements(route_path):
+    return f"""Requirements:
 - Use functional React components and hooks.
 - Translate layout from Designer.cs to semantic HTML + React.
 - Translate basic controls (Button, Label, TextBox, etc) to react/HTML/css equivalents
@@ -77,105 +138,667 @@ Requirements:
 - For routing:
   - Export the component as default.
   - Provide a route snippet that registers this component with React Router.
-  - Use the route path as `/{form_name.lower()}` (e.g. `/loginform`).
+  - Use the route path as `{route_path}` (e.g. `/loginform`).
 - Make reasonable assumptions where needed.
 
 """
 
+# Create one prompt converting several small forms, so the instructions and round-trip are paid once
+# Each form's output is wrapped in [BEGIN_FORM:name]...[END_FORM:name] so it can be split back per form
+def create_batch_prompt(forms):
+    sources = "\n---\n".join(f"""
+📄 Form {form_name}:
+- The logic file ({form_name}.aspx.cs)
+[BEGIN_CS]
+{code_cs}
+[END_CS]
+- The UI layout and control declarations ({form_name}.aspx.Designer.cs)
+[BEGIN_DESIGNER]
+{code_designer}
+[END_DESIGNER]
+""" for form_name, code_cs, code_designer in forms)
+    return f"""
+You are an expert software developer helping convert legacy ASP .NET applications into modern ReactJS apps using functional components and hooks.
+
+I have {len(forms)} WinForms forms, each with a logic file and a designer file. Convert every form independently.
+
+---
+{sources}
+---
+Please output the result of every form wrapped between `[BEGIN_FORM:<form name>]` and `[END_FORM:<form name>]`, containing:
+1. A `.jsx` component — wrapped between `[BEGIN_JSX]` and `[END_JSX]`
+2. A corresponding `.css` file — wrapped between `[BEGIN_CSS]` and `[END_CSS]`
+3. A route configuration snippet — wrapped between `[BEGIN_ROUTES]` and `[END_ROUTES]`
+
+Do not add explanation or markdown. Only raw code blocks between those tags.
+
+{conversion_requirements("/<form name in lowercase>")}{response_format.instructions(structured_paths("<form name>"))}"""
+
+# Split a batched response into {form_name: response text in the single-form format}
+def split_batch_response(llm_response):
+    structured_files = parse_files(llm_response)
+    if structured_files:
+        return {form_name: serialize_sections(sections)
+                for form_name, sections in file_sections(structured_files).items()}
+    return {
+        match.group(1): match.group(2).strip()
+        for match in re.finditer(r"\[BEGIN_FORM:(\w+)\](.*?)\[END_FORM:\1\]", llm_response, re.DOTALL)
+    }
+
 # Step 3: Send the prompt to LLM and get a response
-def call_llm(prompt, form_name):
-    try:
-        response = model.generate_content(prompt)
+# Returns the response text, or None if the call failed; failed attempts are retried per `retry_policy`
+def call_llm(prompt, form_name, rate_limiter=None, cache=None):
+    if cache:
+        cached = cache.get(prompt)
+        if cached is not None:
+            print(f"Using cached LLM response for {form_name}.")
+            report.cache_hit()
+            return cached
+
+    def attempt_request(attempt):
+        if rate_limiter:
+            with report.stage("rate_limit_wait"):
+                rate_limiter.acquire(estimate_tokens(prompt))
+        with report.llm_attempt(estimate_tokens(prompt), retry=attempt > 1) as usage:
+            response_text = backend.generate(prompt)
+            usage["response_tokens"] = estimate_tokens(response_text)
+        if not response_text:
+            raise EmptyResponseError("LLM returned an empty response")
+        response_format.record_response(response_text)
         # --- Process the response ---
         #print("Generated Content:")
-        #print(response.text)
-        return response.text
+        #print(response_text)
+        if rate_limiter:
+            rate_limiter.record_usage(estimate_tokens(response_text))
+        if cache:
+            cache.put(prompt, response_text)
+        return response_text
+
+    return retry_policy.call(attempt_request, form_name)
+
+
+# Streaming variant of call_llm: sections are handed to the parser as soon as they close
+# Each attempt feeds a fresh parser from `new_parser()`, so a retry rewrites the sections from the start
+def stream_llm(prompt, form_name, new_parser, rate_limiter=None, cache=None):
+    if cache:
+        cached = cache.get(prompt)
+        if cached is not None:
+            print(f"Using cached LLM response for {form_name}.")
+            report.cache_hit()
+            parser = new_parser()
+            parser.feed(cached)
+            parser.close()
+            return parser
+
+    def attempt_request(attempt):
+        if rate_limiter:
+            with report.stage("rate_limit_wait"):
+                rate_limiter.acquire(estimate_tokens(prompt))
+        parser = new_parser()
+        # The full text is only kept when it has to be cached
+        pieces = [] if cache else None
+        received = 0
+        with report.llm_attempt(estimate_tokens(prompt), retry=attempt > 1) as usage:
+            for piece in backend.generate_stream(prompt):
+                received += len(piece)
+                parser.feed(piece)
+                if pieces is not None:
+                    pieces.append(piece)
+            usage["response_tokens"] = received // CHARS_PER_TOKEN + 1 if received else 0
+        if not received:
+            raise EmptyResponseError("LLM returned an empty response")
+        parser.close()
+        response_format.record_parser(parser)
+        if rate_limiter:
+            rate_limiter.record_usage(received // CHARS_PER_TOKEN + 1)
+        if cache:
+            cache.put(prompt, "".join(pieces))
+        return parser
+
+    return retry_policy.call(attempt_request, form_name)
+
+# Write one generated file (e.g. the .jsx or .css) for a form, unless it already has this content
+# Returns the saved path (also when unchanged), or None on error
+def save_form_file(output_path, form_name, extension, code):
+    file_path = Path(output_path) / f"{form_name}.{extension}"
+    try:
+        with report.stage("write"):
+            written = writer.write(file_path, code)
+        print(f"{extension.upper()} saved: {file_path}" if written else f"{extension.upper()} unchanged: {file_path}")
+        return file_path
+    except IOError as e:
+        print(f"Error saving file {file_path}: {e}")
+        return None
+
+# Output files written for each tagged section of the response
+SECTION_EXTENSIONS = {"JSX": "jsx", "CSS": "css"}
+
+# Callback writing the .jsx and .css sections of a form as they close; the tags whose file could not
+# be written are added to `unsaved`. A write error is not a model failure, so it never fails the stream
+# (which would retry the request); the caller reports the form as failed instead.
+def section_writer(output_path, form_name, unsaved):
+    def write_section(tag, content):
+        if tag in SECTION_EXTENSIONS and content:
+            if not save_form_file(output_path, form_name, SECTION_EXTENSIONS[tag], content):
+                unsaved.append(tag)
+
+    return write_section
+
+# Report a form whose output files (the sections in `unsaved`) could not be written
+def print_unsaved(form_name, unsaved):
+    print(f"❌ Could not save the {' and '.join(unsaved)} of {form_name}; it will be converted again next run.")
+
+# Parser for a form's streamed response; in a structured run the JSON file entries become its sections
+def new_section_parser(form_name, on_section):
+    sections = TaggedSectionStreamParser(on_section)
+
+    def add_file(path, content):
+        for tag, file_content in file_sections([(path, content)]).get(form_name, {}).items():
+            sections.add(tag, file_content)
+
+    return response_format.stream_parser(sections, add_file)
+
+# Convert a single form; safe to run on worker threads
+# When `stream_to` (the output directory) is given, the response is streamed, the .jsx and .css
+# files are written as soon as their sections close, and the parsed sections are returned.
+def convert_form(form_name, paths, rate_limiter=None, cache=None, stream_to=None):
+    print(f"\n🔄 Converting form: {form_name}")
+    return convert_form_sources(form_name, *read_form_sources(paths), rate_limiter, cache, stream_to)
+
+# Read a form's code-behind and designer, compacted for the prompt
+def read_form_sources(paths):
+    # Read original WinForms files
+    with report.stage("read_sources"):
+        code_cs = read_file(paths["code"])
+        code_designer = read_file(paths["designer"])
+   # code_resx = read_file(paths["resx"])
+
+    # Strip comments, usings, regions and dead code (designer files are mostly doc comments)
+    with report.stage("compact"):
+        return compact_csharp(code_cs), compact_csharp(code_designer)
+
+def convert_form_sources(form_name, code_cs, code_designer, rate_limiter=None, cache=None, stream_to=None):
+    # Create and send prompt
+    with report.stage("build_prompt"):
+        prompt = create_prompt(form_name, code_cs, code_designer)
+    if stream_to:
+        unsaved = []
+
+        def new_parser():
+            # A retry rewrites every section
+            unsaved.clear()
+            return new_section_parser(form_name, section_writer(stream_to, form_name, unsaved))
+
+        parser = stream_llm(prompt, form_name, new_parser, rate_limiter, cache)
+        if parser and unsaved:
+            print_unsaved(form_name, unsaved)
+            return None
+        return parser.sections if parser else None
+    return call_llm(prompt, form_name, rate_limiter, cache)
+
+# Convert several small forms with one batched prompt; safe to run on worker threads
+# Returns [((form_name, paths), result)] with results as returned by convert_form. A form missing
+# from the batched response, or without JSX, is retried on its own so one bad form does not fail the rest.
+# Batched responses are written once complete rather than streamed.
+# With `validate`, each form's output is checked and repaired by check_form_output; `known_forms`
+# are the names of every form of the run, whose components the .jsx may import.
+def convert_form_batch(batch, rate_limiter=None, cache=None, stream_to=None, validate=True, known_forms=()):
+    if len(batch) == 1:
+        with report.unit(batch[0][0]):
+            result = convert_form(*batch[0], rate_limiter, cache, stream_to)
+            if validate:
+                result = check_form_output(batch[0], result, rate_limiter, cache, stream_to, known_forms)
+            return [(batch[0], result)]
+
+    form_names = ", ".join(form_name for form_name, _ in batch)
+    print(f"\n🔄 Converting {len(batch)} forms in one batch: {form_names}")
+    with report.unit(f"batch: {form_names}"):
+        form_sources = {form_name: read_form_sources(paths) for form_name, paths in batch}
+        with report.stage("build_prompt"):
+            prompt = create_batch_prompt([(form_name, *sources) for form_name, sources in form_sources.items()])
+        react_code = call_llm(prompt, f"batch of {len(batch)} forms", rate_limiter, cache)
+        with report.stage("extract"):
+            split_code = split_batch_response(react_code) if react_code else {}
+
+    results = []
+    for form_name, paths in batch:
+        form_code = split_code.get(form_name)
+        if not form_code or "[BEGIN_JSX]" not in form_code:
+            print(f"{form_name} is missing from the batched response; converting it separately.")
+            with report.unit(form_name):
+                result = convert_form_sources(form_name, *form_sources[form_name], rate_limiter, cache, stream_to)
+        elif stream_to:
+            # Same writes and result as a streamed single-form response
+            unsaved = []
+            parser = TaggedSectionStreamParser(section_writer(stream_to, form_name, unsaved))
+            parser.feed(form_code)
+            result = parser.close()
+            if unsaved:
+                print_unsaved(form_name, unsaved)
+                result = None
+        else:
+            result = form_code
+        if validate:
+            with report.unit(form_name):
+                result = check_form_output((form_name, paths), result, rate_limiter, cache, stream_to, known_forms)
+        results.append(((form_name, paths), result))
+    return results
+
+# What each tagged section of a form's output is, for repair prompts
+SECTION_DESCRIPTIONS = {"JSX": "`.jsx` component", "CSS": "`.css` file", "ROUTES": "route configuration snippet"}
+
+# Check a form's sections ({tag: content}) locally: brackets of the .jsx, .css and route snippet,
+# relative imports (the form's own .css, or a converted form's component) and that all three are present
+# Returns {tag: [problems]} for the failing sections
+def validate_form_sections(form_name, sections, known_forms=()):
+    section_files = {"JSX": f"{form_name}.jsx", "CSS": f"{form_name}.css", "ROUTES": "routes.js"}
+    files = {section_files[tag]: sections[tag] for tag in section_files if sections.get(tag)}
+    components = {f"{name}.jsx" for name in known_forms}
+    found = validate_files(files, exists=lambda path: path in components)
+    problems = {tag: found[filename] for tag, filename in section_files.items() if filename in found}
+    for tag in section_files:
+        if not sections.get(tag):
+            problems[tag] = [f"missing: no [BEGIN_{tag}] section"]
+    return problems
+
+# Create a focused prompt regenerating one section of a form that failed validation (or is missing)
+def create_repair_prompt(form_name, code_cs, code_designer, tag, content, problems):
+    description = SECTION_DESCRIPTIONS[tag]
+    if content:
+        current = f"Current {description} (as generated):\n[BEGIN_{tag}]\n{content}\n[END_{tag}]"
+    else:
+        current = f"The {description} was not generated."
+    problem_lines = "\n".join(f"- {problem}" for problem in problems)
+    return f"""
+You are an expert software developer helping convert legacy ASP .NET applications into modern ReactJS apps using functional components and hooks.
+The form below was converted to React as `{form_name}.jsx`, `{form_name}.css` and a route snippet, but one part failed validation.
 
-    except Exception as e:
-        print(f"An error occurred: {e} while converting {form_name}")
-    
+📄 Code-behind ({form_name}.aspx.cs):
+[BEGIN_CS]
+{code_cs}
+[END_CS]
+
+📄 Designer (.Designer.cs):
+[BEGIN_DESIGNER]
+{code_designer}
+[END_DESIGNER]
+
+---
+{current}
+
+Problems found:
+{problem_lines}
+
+Please output only the corrected {description}, complete and with every bracket closed, wrapped between `[BEGIN_{tag}]` and `[END_{tag}]`.
+Relative imports may only refer to `./{form_name}.css` or to the components of other converted forms; inline anything else.
+
+Do not add explanation or markdown. Only raw code between those tags.
+
+{conversion_requirements(f"/{form_name.lower()}")}{response_format.instructions(structured_paths(form_name, (tag,)))}"""
+
+# Validate a converted form and repair only the failing sections; safe to run on worker threads
+# `result` is as returned by convert_form. Each failing section gets its own repair prompt, and a repair
+# is kept if it passes validation. Returns the result with the repaired sections in place (and written,
+# when streaming). Forms without JSX are left to the caller, which reports them as failed.
+def check_form_output(form, result, rate_limiter=None, cache=None, stream_to=None, known_forms=()):
+    form_name, paths = form
+    if not result:
+        return result
+    with report.stage("validate"):
+        if stream_to:
+            sections = dict(result)
+        else:
+            sections = dict(zip(("JSX", "CSS", "ROUTES"), extract_parts(result, form_name)))
+        problems = validate_form_sections(form_name, sections, known_forms) if sections.get("JSX") else {}
+    report.count("files_validated", sum(1 for content in sections.values() if content))
+    if not problems:
+        return result
+    report.count("files_invalid", len(problems))
+    for tag, tag_problems in problems.items():
+        print(f"⚠️ {form_name} {tag} failed validation: {'; '.join(tag_problems)}")
+
+    code_cs, code_designer = read_form_sources(paths)
+    for tag, tag_problems in problems.items():
+        with report.stage("build_prompt"):
+            prompt = create_repair_prompt(form_name, code_cs, code_designer, tag, sections.get(tag), tag_problems)
+        repair_code = call_llm(prompt, f"{form_name} (repair of {tag})", rate_limiter, cache)
+        with report.stage("extract"):
+            repaired = dict(zip(("JSX", "CSS", "ROUTES"), extract_parts(repair_code or "", form_name)))[tag]
+        with report.stage("validate"):
+            valid = repaired and tag not in validate_form_sections(form_name, {**sections, tag: repaired}, known_forms)
+        if not valid:
+            print(f"❌ Could not repair the {tag} of {form_name}; keeping the generated version.")
+            continue
+        sections[tag] = repaired
+        report.count("files_repaired")
+        print(f"🔧 Repaired the {tag} of {form_name}")
+        if stream_to and tag in SECTION_EXTENSIONS:
+            if not save_form_file(stream_to, form_name, SECTION_EXTENSIONS[tag], repaired):
+                print_unsaved(form_name, [f"repaired {tag}"])
+                return None
+    if stream_to:
+        return sections
+    return serialize_sections(sections)
+
+# Estimated prompt tokens of a form, from file sizes so no source is read while planning batches
+def estimate_form_tokens(form):
+    _, paths = form
+    return sum(os.path.getsize(path) for path in paths.values() if os.path.exists(path)) // CHARS_PER_TOKEN + 1
+
+# Fingerprint of the prompt template and model; changing either reconverts every form
+def prompt_template_hash():
+    return hash_text(backend.model_name + create_prompt("{form_name}", "{code_cs}", "{code_designer}"))
+
+# Dry run: what process_forms would convert, without calling the model or writing any file
+# Returns one dict per form with its 'name', source 'files', estimated 'prompt_tokens', 'parts' (always 1),
+# 'status' ('convert', 'up to date' or 'resumed') and, when it would be converted, the 'batch' it is sent in
+# With `shard`, only that shard's forms are listed
+def plan_forms(project_path, output_path, incremental=False, resume=False, batch_token_budget=None, shard=None,
+               structured=False):
+    response_format.reset(structured)
+    forms = dict(select_shard(list(find_winforms_forms(project_path).items()), shard, estimate_form_tokens,
+                              lambda form: form[0]))
+    manifest = ConversionManifest(output_path, prompt_template_hash())
+    journal = ConversionJournal(output_path)
+
+    plan = []
+    pending_forms = []
+    for form_name, paths in forms.items():
+        status = "convert"
+        if resume and journal.completed(form_name):
+            status = "resumed"
+        elif incremental and manifest.is_up_to_date(form_name, manifest.fingerprint(
+                {"code": paths["code"], "designer": paths["designer"]})):
+            status = "up to date"
+        else:
+            pending_forms.append((form_name, paths))
+        plan.append({
+            "name": form_name,
+            "files": [paths["code"], paths["designer"]],
+            "prompt_tokens": estimate_tokens(create_prompt(form_name, *read_form_sources(paths))),
+            "parts": 1,
+            "status": status,
+        })
+
+    # Number the prompts the way process_forms would batch them
+    if batch_token_budget:
+        batches = plan_batches(pending_forms, estimate_form_tokens, batch_token_budget, SMALL_FORM_TOKENS)
+    else:
+        batches = [[form] for form in pending_forms]
+    batch_numbers = {form_name: number for number, batch in enumerate(batches, start=1) for form_name, _ in batch}
+    for entry in plan:
+        if entry["status"] == "convert":
+            entry["batch"] = batch_numbers[entry["name"]]
+    return plan
 
 # Step 4: Process all forms, convert, and save output
-def process_forms(project_path, output_path):
+def process_forms(project_path, output_path, concurrency=1, requests_per_minute=None, tokens_per_minute=None,
+                  cache_dir=None, bypass_cache=False, incremental=False, stream=False, batch_token_budget=None,
+                  report_path=None, trace_path=None, resume=False, validate=True, shard=None, structured=False,
+                  changed_files=None):
     os.makedirs(output_path, exist_ok=True)
-    forms = find_winforms_forms(project_path)
+    # A JSON run report (timings, tokens, retries) is written to report_path, by default
+    # conversion_report.json in output_path; trace_path optionally adds a Chrome trace
+    report.start(trace_path)
+    # Concurrent workers share one in-flight limit, which a worker waiting to retry gives up
+    retry_policy.reset(max_in_flight=concurrency if concurrency > 1 else None)
+    writer.reset()
+    # With `structured`, the model is asked for JSON file lists (use a backend with a response
+    # schema, see structured_output); the tag format remains the fallback
+    response_format.reset(structured)
+    with report.stage("discovery"):
+        forms = find_winforms_forms(project_path)
 
     if not forms:
         print("No valid WinForms forms found in the project.")
+        report.close()
         return
-    all_imports = set()
-    all_route_elements = []
-
+    # Imports of other forms' components are validated against every discovered form
+    known_forms = list(forms)
+    # With shard=(i, n), only the i-th of n shards of the forms, balanced by estimated prompt
+    # size, is converted into output_path (one directory per shard); routes.js then only has
+    # that shard's routes until merge_forms combines the shards' directories
+    if shard:
+        forms = dict(select_shard(list(forms.items()), shard, estimate_form_tokens, lambda form: form[0]))
+        print(f"Shard {shard[0]}/{shard[1]}: converting {len(forms)} form(s).")
+    route_codes = {}
+
+    # In incremental mode, forms whose code-behind, designer and prompt template are
+    # unchanged are skipped; their route snippets are reused from the manifest
+    manifest = ConversionManifest(output_path, prompt_template_hash())
+    # Each completed form and its route snippet is appended to a journal. A resumed run
+    # (resume=True) skips the forms in it and rebuilds routes.js from their snippets;
+    # forms finished by an interrupted run are carried into the manifest either way
+    journal = ConversionJournal(output_path)
+    for form_name, entry in journal.entries.items():
+        manifest.restore(form_name, entry)
+    # A form no longer in the tree (e.g. its code-behind was deleted) loses its output too; other shards' keep theirs
+    for form_name, entry in manifest.retain(forms).items():
+        if form_name not in known_forms:
+            writer.remove_stale(entry.get("outputs"), [])
+    if journal.entries:
+        manifest.save()
+    journal.open(resume)
+    # In watch mode (changed_files), only the forms whose code-behind or designer changed, now or
+    # as recorded by their last conversion, are considered; the others keep their output and route
+    changed = {normalize_path(path) for path in changed_files} if changed_files is not None else None
+    fingerprints = {}
+    pending_forms = []
+    affected = 0
     for form_name, paths in forms.items():
-        print(f"\n🔄 Converting form: {form_name}")
-
-        # Read original WinForms files
-        code_cs = read_file(paths["code"])
-        code_designer = read_file(paths["designer"])
-       # code_resx = read_file(paths["resx"])
-
-        # Create and send prompt
-        prompt = create_prompt(form_name, code_cs, code_designer)
-        react_code = call_llm(prompt, form_name)
-
-        # Save the output
-        if react_code:
-            jsx_code, css_code, route_code = extract_parts(react_code)
-            if jsx_code:
-                jsx_file = Path(output_path) / f"{form_name}.jsx"
-                with open(jsx_file, "w", encoding="utf-8") as f:
-                    f.write(jsx_code)
-                print(f"JSX saved: {jsx_file}")
+        if changed is not None and not touches(changed, [paths["code"], paths["designer"],
+                                                         *recorded_inputs(manifest.get(form_name))]):
+            route_codes[form_name] = (manifest.get(form_name) or {}).get("routes")
+            continue
+        affected += 1
+        fingerprints[form_name] = manifest.fingerprint({"code": paths["code"], "designer": paths["designer"]})
+        if resume and journal.completed(form_name):
+            print(f"Skipping {form_name}: already converted by the interrupted run.")
+            route_codes[form_name] = journal.completed(form_name).get("routes")
+        elif incremental and manifest.is_up_to_date(form_name, fingerprints[form_name]):
+            print(f"Skipping {form_name}: sources unchanged since last conversion.")
+            route_codes[form_name] = manifest.get(form_name).get("routes")
+        else:
+            pending_forms.append((form_name, paths))
+    if changed is not None:
+        print(f"Changed files affect {affected} form(s); {len(pending_forms)} to reconvert.")
+
+    rate_limiter = None
+    if requests_per_minute or tokens_per_minute:
+        rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+    # Unchanged prompts are answered from the on-disk cache instead of the model
+    cache = (ResponseCache(cache_dir, backend.model_name, backend.generation_config, bypass=bypass_cache)
+             if cache_dir else None)
+
+    # Forms are converted up to `concurrency` at a time, but results come back in
+    # discovery order so the files and routes.js are written deterministically
+    # In stream mode the .jsx/.css files are written by the workers while responses arrive
+    stream_to = output_path if stream else None
+    # With a batch token budget, small forms are packed into shared prompts of up to that many tokens
+    if batch_token_budget:
+        batches = plan_batches(pending_forms, estimate_form_tokens, batch_token_budget, SMALL_FORM_TOKENS)
+    else:
+        batches = [[form] for form in pending_forms]
+    # With `validate`, each form's .jsx/.css/routes are checked locally and only failing sections re-requested
+    batch_results = dispatch(batches,
+                             lambda batch: convert_form_batch(batch, rate_limiter, cache, stream_to, validate,
+                                                              known_forms),
+                             concurrency, extra_workers=concurrency)
+    results = (result for _, batch_result in batch_results for result in batch_result)
+    converted_forms = []
+    for (form_name, paths), react_code in results:
+        with report.unit(form_name):
+            # Save the output
+            if react_code:
+                saved_files = []
+                if stream:
+                    jsx_code, css_code, route_code = (react_code.get(tag) for tag in ("JSX", "CSS", "ROUTES"))
+                else:
+                    with report.stage("extract"):
+                        jsx_code, css_code, route_code = extract_parts(react_code, form_name)
+                if jsx_code:
+                    if stream:
+                        saved_files.append(Path(output_path) / f"{form_name}.jsx")
+                    else:
+                        saved_files.append(save_form_file(output_path, form_name, "jsx", jsx_code))
+                else:
+                    print(f"JSX not found in model output for {form_name}")
+                response_format.record_output(bool(jsx_code))
+
+                if css_code:
+                    if stream:
+                        saved_files.append(Path(output_path) / f"{form_name}.css")
+                    else:
+                        saved_files.append(save_form_file(output_path, form_name, "css", css_code))
+                else:
+                    print(f"CSS not found in model output for {form_name}")
+
+                if route_code:
+                    route_codes[form_name] = route_code
+                    print(f"Route config added for {form_name}")
+                else:
+                    print(f"Route config not found for {form_name}")
+
+                # Only complete conversions are recorded, so partial ones (or unsaved files) are retried next run
+                if jsx_code and None not in saved_files:
+                    converted_forms.append(form_name)
+                    # e.g. the .css of a form that no longer gets one
+                    previous = manifest.get(form_name)
+                    writer.remove_stale(previous["outputs"] if previous else [], saved_files)
+                    manifest.record(form_name, fingerprints[form_name], saved_files, routes=route_code)
+                    with report.stage("journal"):
+                        journal.record(form_name, manifest.get(form_name))
             else:
-                print(f"JSX not found in model output for {form_name}")
+                print(f"❌ No React code for {form_name}: the LLM call failed or its output could not be saved.")
+    journal.close()
+    manifest.save()
+
+    # After processing all forms, aggregate routes in discovery order; in watch mode only the
+    # entries of the reconverted forms change, and an unchanged routes.js is left untouched
+    write_routes(output_path, [route_codes.get(form_name) for form_name in forms])
+
+    if cache:
+        cache.prune()
+        cache.print_stats()
+    writer.print_stats()
+    response_format.print_stats()
+
+    failed_forms = [form_name for form_name, _ in pending_forms if form_name not in converted_forms]
+    report_path = report_path or Path(output_path) / REPORT_NAME
+    summary = report.write(report_path, forms=len(forms), converted=len(converted_forms),
+                           skipped=len(forms) - len(pending_forms), failed=failed_forms,
+                           cache=cache.stats() if cache else None, retry=retry_policy.stats(),
+                           outputs=writer.stats(), parsing=response_format.stats())
+    print(f"Run report saved: {report_path} ({summary['wall_seconds']:.1f}s, "
+          f"{summary['totals']['llm_attempts']} LLM calls, {summary['totals']['retries']} retries, "
+          f"{len(failed_forms)} failed)")
+    report.print_model_stats(summary)
+    if failed_forms:
+        print(f"❌ Not converted (retried on the next run): {', '.join(failed_forms)}")
+
+# Write the aggregated routes.js from the forms' route snippets, in the given (discovery) order
+def write_routes(output_path, route_codes):
+    all_imports = set()
+    all_route_elements = []
+    for route_code in route_codes:
+        # Split route_code lines into imports and <Route> elements
+        for line in (route_code or "").splitlines():
+            line = line.strip()
+            if line.startswith("import"):
+                all_imports.add(line)
+            elif line.startswith("<Route"):
+                all_route_elements.append(line)
 
-            if css_code:
-                css_file = Path(output_path) / f"{form_name}.css"
-                with open(css_file, "w", encoding="utf-8") as f:
-                    f.write(css_code)
-                print(f"CSS saved: {css_file}")
-            else:
-                print(f"CSS not found in model output for {form_name}")
-
-            if route_code:
-                # Split route_code lines into imports and <Route> elements
-                for line in route_code.splitlines():
-                    line = line.strip()
-                    if line.startswith("import"):
-                        all_imports.add(line)
-                    elif line.startswith("<Route"):
-                        all_route_elements.append(line)
-                print(f"Route config added for {form_name}")
-            else:
-                print(f"Route config not found for {form_name}")
-        # After processing all forms, write the aggregated routes.js file
     # Write aggregated routes.js file
     if all_route_elements:
         routes_file = Path(output_path) / "routes.js"
-        with open(routes_file, "w", encoding="utf-8") as f:
-            f.write("// Auto-generated routes\n")
-            f.write("import React from 'react';\n")
-            f.write("import { BrowserRouter as Router, Route, Routes } from 'react-router-dom';\n")
-            for imp in sorted(all_imports):
-                f.write(f"{imp}\n")
-            f.write("\n")
-            f.write("export default function AppRoutes() {\n")
-            f.write("  return (\n")
-            f.write("    <Router>\n")
-            f.write("      <Routes>\n")
-            for route in all_route_elements:
-                f.write(f"        {route}\n")
-            f.write("      </Routes>\n")
-            f.write("    </Router>\n")
-            f.write("  );\n")
-            f.write("}\n")
-
-        print(f"Aggregated routes.js saved: {routes_file}")
+        lines = ["// Auto-generated routes",
+                 "import React from 'react';",
+                 "import { BrowserRouter as Router, Route, Routes } from 'react-router-dom';"]
+        lines.extend(sorted(all_imports))
+        lines.extend(["",
+                      "export default function AppRoutes() {",
+                      "  return (",
+                      "    <Router>",
+                      "      <Routes>"])
+        lines.extend(f"        {route}" for route in all_route_elements)
+        lines.extend(["      </Routes>",
+                      "    </Router>",
+                      "  );",
+                      "}"])
+        with report.stage("write_routes"):
+            written = writer.write(routes_file, "\n".join(lines) + "\n")
+        print(f"Aggregated routes.js saved: {routes_file}" if written else f"Aggregated routes.js unchanged: {routes_file}")
     else:
         print("No route configs were generated.")
 
-def extract_parts(llm_response):
-    """Extract .jsx and .css content from the LLM response using tag markers."""
+# Step 5: Combine the output directories of sharded runs (process_forms with `shard`)
+# Each form's .jsx/.css are copied from the shard that converted it, one manifest is written for
+# all of them, and routes.js is rebuilt from their recorded route snippets in discovery order
+# Returns the discovered forms that no shard converted
+# `structured` must be that of the shards' runs, since the response format is part of the prompt fingerprint
+def merge_forms(project_path, output_path, shard_paths, structured=False):
+    writer.reset()
+    response_format.reset(structured)
+    forms = find_winforms_forms(project_path)
+    shards = [(shard_path, load_shard_units(shard_path)) for shard_path in shard_paths]
+    manifest = ConversionManifest(output_path, prompt_template_hash())
+
+    route_codes = []
+    missing_forms = []
+    for form_name in forms:
+        previous = manifest.get(form_name)
+        entry = merge_unit(form_name, shards, output_path, manifest, writer)
+        if entry:
+            writer.remove_stale(previous["outputs"] if previous else [], entry["outputs"])
+            route_codes.append(entry.get("routes"))
+        else:
+            missing_forms.append(form_name)
+            # A form converted before, into this directory, keeps its route
+            route_codes.append(previous.get("routes") if previous else None)
+    # Forms no longer in the tree lose their output too
+    for entry in manifest.retain(forms).values():
+        writer.remove_stale(entry.get("outputs"), [])
+    manifest.save()
+    write_routes(output_path, route_codes)
+
+    writer.print_stats()
+    print(f"Merged {len(forms) - len(missing_forms)} of {len(forms)} form(s) "
+          f"from {len(shard_paths)} shard(s) into {output_path}")
+    if missing_forms:
+        print(f"❌ Not converted by any shard: {', '.join(missing_forms)}")
+    return missing_forms
+
+# Step 6: Watch the project and reconvert the forms affected by each burst of saves
+# Brings output_path up to date (an incremental run by default), then waits for .cs files under project_path
+# to change; once saves have stopped for `debounce` seconds, only the forms whose code-behind or
+# designer changed are reconverted (process_forms with `changed_files`) and their routes.js entries
+# updated. Uses filesystem notifications (watchdog) unless `poll_interval` is given or watchdog is
+# missing, in which case the tree is scanned every poll_interval seconds. Runs until Ctrl+C, or for
+# `max_cycles` bursts; `options` are passed to process_forms, and every run after the first is incremental.
+def watch_forms(project_path, output_path, debounce=2.0, poll_interval=None, max_cycles=None, **options):
+    options.setdefault("incremental", True)
+    # Watching starts first, so files saved during the initial run make up the first burst
+    watcher = create_watcher(project_path, WATCHED_EXTENSIONS, SKIPPED_DIRS, poll_interval)
+    process_forms(project_path, output_path, **options)
+    # Every burst is converted incrementally; a resumed initial run has already finished
+    options.update(incremental=True, resume=False)
+    print(f"\n👀 Watching {project_path} for changes (Ctrl+C to stop)...")
+    watch(watcher, lambda changed: process_forms(project_path, output_path, changed_files=changed, **options),
+          debounce, max_cycles)
+
+def extract_parts(llm_response, form_name=None):
+    """
+    Extract .jsx and .css content from the LLM response using tag markers.
+    A structured (JSON file list) response is read first: the files of `form_name`, or of
+    the only form it has files for.
+    """
+    structured_files = parse_files(llm_response)
+    if structured_files:
+        forms = file_sections(structured_files)
+        sections = forms.get(form_name) or (next(iter(forms.values())) if len(forms) == 1 else {})
+        return sections.get("JSX"), sections.get("CSS"), sections.get("ROUTES")
+
     jsx_match = re.search(r"\[BEGIN_JSX\](.*?)\[END_JSX\]", llm_response, re.DOTALL)
     css_match = re.search(r"\[BEGIN_CSS\](.*?)\[END_CSS\]", llm_response, re.DOTALL)
     routes_match = re.search(r"\[BEGIN_ROUTES\](.*?)\[END_ROUTES\]", llm_response, re.DOTALL)
@@ -188,12 +811,9 @@ def extract_parts(llm_response):
     return jsx_code, css_code, route_code
 
 # Entry point
+# Usage: python ASP.NET_to_react.py <project_dir> <output_dir> [--dry-run] [--resume] ...
+# (same as `python convert.py webforms ...`; see convert.py for all options)
 if __name__ == "__main__":
     print("🛠️ WinForms ➡️ ReactJS Converter ")
-
-    #project_dir = input("Enter path to your WinForms project: ").strip()
-    #output_dir = input("Enter path to save React components: ").strip()
-    project_dir = r"C:\Workspaces\Books-ASP.NET-WebForms-WCF-master"
-    output_dir = r"C:\Workspaces\Code\ASP.NET\Books-ASP.NET-WebForms-WCF-master_New"
-
-    process_forms(project_dir, output_dir)
+    from convert import main
+    sys.exit(main(["webforms", *sys.argv[1:]]))
@@ -1,112 +1,319 @@
 import os
-import google.generativeai as genai
 import re
+import sys
 from pathlib import Path
-import time
-
-# Set your  API key (or set key as an environment variable)
-genai.configure(api_key="key")
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from conversion_journal import ConversionJournal
+from conversion_manifest import ConversionManifest, hash_text
+from dependency_context import DependencyContext, enclosing_namespaces, referenced_names
+from llm_backends import GeminiBackend
+from llm_cache import ResponseCache
+from llm_dispatch import CHARS_PER_TOKEN, RateLimiter, dispatch, estimate_tokens, plan_batches
+from llm_retry import EmptyResponseError, RetryPolicy
+from output_validation import validate_files
+from output_writer import OutputWriter
+from prompt_compaction import (block_end, compact_csharp, find_method_spans_by_name, find_operations,
+                                prompt_token_budget, split_by_operations, strip_string_literals)
+from run_report import REPORT_NAME, RunReport
+from sharding import load_shard_units, merge_unit, select_shard
+from shared_models import (SHARED_MODELS_DIR, SHARED_MODELS_FILE, SharedModels, collect_data_contracts,
+                           create_models_prompt, group_data_contracts)
+from stream_extract import CodeBlockStreamParser
+from structured_output import ResponseFormat, parse_files
+from typescript_merge import merge_generated_files
+from watch import SKIPPED_DIRS, create_watcher, normalize_path, recorded_inputs, touches, watch
 
 # Model to use
-model = genai.GenerativeModel('gemini-2.5-flash')
+MODEL_NAME = 'gemini-2.5-flash'
+
+# Backend that answers prompts. The SDK is only configured on the first real call,
+# and tests/benchmarks can swap in llm_backends.StubBackend.
+# Set your API key in GeminiBackend(api_key=...) or the GOOGLE_API_KEY environment variable.
+backend = GeminiBackend(MODEL_NAME)
+
+# Timings, token counts and retries of the current run; process_services restarts it and writes it out
+report = RunReport()
+
+# Retries, backoff and the circuit breaker, shared by every model call (and worker) of a run
+retry_policy = RetryPolicy(report=report)
+
+# Atomic writes that leave unchanged files untouched; process_services resets its counts
+writer = OutputWriter()
+
+# The declarations each service depends on, from the symbol graph; process_services resets it after discovery
+dependency_context = DependencyContext()
+
+# Tag or JSON responses, and how often parsing them failed; process_services selects the format and resets the counts
+response_format = ResponseFormat()
+
+# How the files of a structured (JSON) response are named
+STRUCTURED_PATHS = 'Use as the "path" of each file the name you would have put after `// filename:`.'
+
+# Services estimated at up to this many prompt tokens are small enough to share a batched prompt
+SMALL_SERVICE_TOKENS = 2000
+
+# Matches C# namespace declarations, both block-scoped and file-scoped
+NAMESPACE_RE = re.compile(r'^\s*namespace\s+([A-Za-z_][\w.]*)', re.MULTILINE)
+
+# Matches `using` directives that import a namespace (not aliases or `using static`), e.g.
+#   global using MyApp.Contracts;
+USING_NAMESPACE_RE = re.compile(r'^\s*(?P<global>global\s+)?using\s+(?P<namespace>[A-Za-z_][\w.]*)\s*;', re.MULTILINE)
+
+# Matches class/interface/struct/enum declarations and their base type list, e.g.
+#   public partial class MyService : IMyService, IDisposable {
+TYPE_DECLARATION_RE = re.compile(
+    r'\b(?P<kind>class|interface|struct|enum)\s+(?P<name>[A-Za-z_]\w*)'
+    r'(?:\s*<[^>{]*>)?'
+    r'(?:\s*:\s*(?P<bases>[^{;]+?))?\s*(?:where\b[^{;]*)?\{'
+)
+
+# Source files whose changes watch mode reconverts
+WATCHED_EXTENSIONS = ('.svc', '.cs')
+
+# Step 2a: Build a symbol index over all .cs files
+def new_symbol_index():
+    """Returns an empty symbol index mapping type names to the files declaring them."""
+    return {
+        'classes': {},            # class name -> [.cs paths] (several for partial classes)
+        'interfaces': {},         # interface name -> [.cs paths]
+        'service_contracts': {},  # [ServiceContract] interface name -> [.cs paths]
+        'data_contracts': {},     # [DataContract] class name -> [.cs paths]
+        'base_types': {},         # class name -> [base class / interface names]
+        # The symbol graph: every type (class, interface, struct, enum) by simple name
+        'types': {},              # type name -> [.cs paths]
+        'type_namespaces': {},    # type name -> {.cs path: {namespaces it is declared in there (None: global)}}
+        'references': {},         # type name -> {.cs path: {names used in its declaration there}}; edges
+        'file_types': {},         # .cs path -> [names of the types it declares]
+        'file_scopes': {},        # .cs path -> {namespaces whose types it can use unqualified}
+        'global_usings': set(),   # namespaces imported by `global using` into every file
+    }
+
+
+def summarize_declarations(content):
+    """
+    Reduces a .cs file to the compact symbol summary discovery needs: one
+    (kind, name, namespace, base type names, is contract, referenced names) tuple per type,
+    where a contract is a [ServiceContract] interface or a [DataContract] class, and the
+    referenced names are the identifiers in its declaration that may name other types.
+    `content` should be compacted (compact_csharp), so comments add no references;
+    string literals are emptied here, so their text adds no declarations or references.
+    """
+    content = strip_string_literals(content)
+    namespaces = [(m.start(), m.group(1)) for m in NAMESPACE_RE.finditer(content)]
+    declarations = []
 
-# Step 2: Find all WCF files (.cs + .svc)
-def find_wcf_files(root_dir):
+    for match in TYPE_DECLARATION_RE.finditer(content):
+        # The enclosing namespace is the last one declared before this type
+        namespace = None
+        for position, ns in namespaces:
+            if position > match.start():
+                break
+            namespace = ns
+
+        # Attributes sit between the end of the previous statement or block and the declaration
+        boundary = max(content.rfind(c, 0, match.start()) for c in '{};')
+        attributes = content[boundary + 1:match.start()]
+
+        bases = ()
+        if match.group('kind') == 'class':
+            if match.group('bases'):
+                # Strip generic arguments and namespaces: "Contracts.IFoo<T>" -> "IFoo"
+                bases = tuple(base.split('<')[0].strip().split('.')[-1] for base in match.group('bases').split(','))
+            is_contract = 'DataContract' in attributes
+        else:
+            is_contract = match.group('kind') == 'interface' and 'ServiceContract' in attributes
+
+        # Base types, generic constraints and member types all make edges of the symbol graph
+        references = frozenset(referenced_names(content[match.start():block_end(content, match.end() - 1)]))
+        declarations.append((match.group('kind'), match.group('name'), namespace, bases, is_contract, references))
+    return declarations
+
+
+def summarize_cs_file(filepath):
+    """
+    Reads one .cs file and returns its declaration summary and the namespaces it imports,
+    as (namespace, is global) pairs; the content itself is not kept.
+    """
+    content = read_file(filepath)
+    if not content:
+        return [], []
+    # Read before compacting, which drops the using directives
+    imports = [(m.group('namespace'), bool(m.group('global'))) for m in USING_NAMESPACE_RE.finditer(content)]
+    return summarize_declarations(compact_csharp(content)), imports
+
+
+def add_to_symbol_index(index, filepath, declarations, imports=()):
+    """
+    Records every type declared in a .cs file in the symbol index. Classes and interfaces
+    are registered under both their simple and namespace-qualified names, and partial
+    classes accumulate one entry per file that declares a part. `imports` are the
+    namespaces of the file's using directives, as returned by summarize_cs_file.
+    """
+    scope = index['file_scopes'].setdefault(filepath, set())
+    for namespace, is_global in imports:
+        (index['global_usings'] if is_global else scope).add(namespace)
+
+    for kind, name, namespace, bases, is_contract, references in declarations:
+        names = [name, f"{namespace}.{name}"] if namespace else [name]
+
+        # Symbol graph node and edges, by simple name like the references themselves
+        paths = index['types'].setdefault(name, [])
+        if filepath not in paths:
+            paths.append(filepath)
+            index['file_types'].setdefault(filepath, []).append(name)
+        index['type_namespaces'].setdefault(name, {}).setdefault(filepath, set()).add(namespace)
+        index['references'].setdefault(name, {}).setdefault(filepath, set()).update(references - {name})
+        scope.update(enclosing_namespaces(namespace))
+
+        if kind == 'class':
+            tables = [index['classes']]
+            if is_contract:
+                tables.append(index['data_contracts'])
+            if bases:
+                base_types = index['base_types'].setdefault(name, [])
+                for base in bases:
+                    if base and base not in base_types:
+                        base_types.append(base)
+        elif kind == 'interface':
+            tables = [index['interfaces']]
+            if is_contract:
+                tables.append(index['service_contracts'])
+        else:
+            tables = []
+
+        for table in tables:
+            for key in names:
+                paths = table.setdefault(key, [])
+                if filepath not in paths:
+                    paths.append(filepath)
+
+
+def pick_declaring_file(paths, name):
+    """
+    Chooses the best file among those declaring a type. Files whose name contains
+    the type name are preferred, which keeps the original naming heuristic.
+    """
+    if not paths:
+        return None
+    for path in paths:
+        if name in Path(path).stem:
+            return path
+    return paths[0]
+
+
+def pick_implementation_file(paths, name, interface_name, interface_file):
+    """
+    Chooses the implementation file of a service among the files declaring its class.
+    With a partial class, the part holding the most of the contract's operation methods
+    is linked, then the part declaring the contract as a base, then pick_declaring_file's
+    choice. Only the files of a class with several parts are read.
+    """
+    if not paths or len(paths) == 1:
+        return pick_declaring_file(paths, name)
+    operations = {operation for operation, _, _ in find_operations(compact_csharp(read_file(interface_file)))}
+    preferred = pick_declaring_file(paths, name)
+
+    def rank(path):
+        code = compact_csharp(read_file(path))
+        methods = sum(len(spans) for spans in find_method_spans_by_name(code, operations).values())
+        declares_contract = any(kind == 'class' and type_name == name and interface_name in bases
+                                for kind, type_name, _, bases, _, _ in summarize_declarations(code))
+        return methods, declares_contract, path == preferred
+
+    # max() keeps the first of equally ranked parts, so the choice follows walk order
+    return max(paths, key=rank)
+
+
+# Step 2b: Find all WCF files (.cs + .svc)
+def find_wcf_files(root_dir, scan_workers=8, symbol_index=None):
+    """
+    Links every .svc file to its implementation and [ServiceContract] interface.
+    .cs files are read in parallel by `scan_workers` threads and reduced to a symbol
+    summary right away, so memory stays bounded by the summaries, not the tree size.
+    Pass an empty `symbol_index` (see new_symbol_index) to keep the index for later passes.
+    """
     svc_files = []
-    all_cs_files = {} # Stores content of all .cs files for easier lookup
+    cs_paths = []
+    svc_paths = []
+    if symbol_index is None:
+        symbol_index = new_symbol_index()
 
     print(f"Scanning directory: {root_dir}")
 
-    # First pass: Collect all .cs files and their content for efficient lookup
-    for subdir, _, files in os.walk(root_dir):
+    # Collect the .cs and .svc files, skipping build output and dependency folders
+    for subdir, dirs, files in os.walk(root_dir):
+        dirs[:] = [d for d in dirs if d.lower() not in SKIPPED_DIRS]
         for file in files:
             if file.endswith(".cs"):
-                filepath = os.path.join(subdir, file)
-                content = read_file(filepath)
-                if content:
-                    all_cs_files[filepath] = content
-    
-   # Second pass: Process .svc files and link them to .cs implementation and interface files
-    for subdir, _, files in os.walk(root_dir):
-        for file in files:
-            if file.endswith(".svc"):
-                svc_filepath = os.path.join(subdir, file)
-                svc_content = read_file(svc_filepath)
-
-                if not svc_content:
-                    continue
-
-                # Regex to find the Service attribute in the .svc file
-                # Example: <%@ ServiceHost Language="C#" Debug="true" Service="MyNamespace.MyService" %>
-                match = re.search(r'Service="([^"]+)"', svc_content)
-                if match:
-                    full_service_name = match.group(1)
-                    # Extract simple class name (e.g., "MyService" from "MyNamespace.MyService")
-                    simple_service_name = full_service_name.split('.')[-1]
-
-                    implementation_file = None
-                    interface_file = None
-
-                    # Try to find the implementation .cs file
-                    # Heuristic: Look for a .cs file with the simple service name in its stem
-                    # and containing 'class' followed by the simple service name.
-                    for cs_path, cs_content in all_cs_files.items():
-                        if simple_service_name in Path(cs_path).stem and \
-                           re.search(r'class\s+' + re.escape(simple_service_name) + r'(\s|:)', cs_content):
-                            implementation_file = cs_path
-                            break
-
-                    if implementation_file:
-                        # Now, try to find the interface file from the implementation content
-                        # Heuristic: Look for a class implementing an interface
-                        # Example: public class MyService : IMyService
-                        # This regex looks for the interface name after the colon in a class definition
-                        impl_content = all_cs_files[implementation_file]
-                        interface_match = re.search(
-                            r'class\s+' + re.escape(simple_service_name) + r'\s*:\s*(I[A-Za-z0-9_]+)',
-                            impl_content
-                        )
-
-                        if interface_match:
-                            interface_name = interface_match.group(1)
-                            # Try to find the .cs file for this interface
-                            for cs_path, cs_content in all_cs_files.items():
-                                if interface_name in Path(cs_path).stem and \
-                                   re.search(r'interface\s+' + re.escape(interface_name) + r'(\s|{)', cs_content) and \
-                                   '[ServiceContract]' in cs_content: # Ensure it's a ServiceContract
-                                    interface_file = cs_path
-                                    break
-                        else:
-                            # Fallback: If no explicit interface found via inheritance,
-                            # try to find a .cs file with [ServiceContract] and the IServiceName pattern.
-                            # This handles cases where the interface might be in a separate file
-                            # and not explicitly inherited in the same line as the class definition.
-                            for cs_path, cs_content in all_cs_files.items():
-                                if '[ServiceContract]' in cs_content and \
-                                   f"I{simple_service_name}" in Path(cs_path).stem:
-                                    interface_file = cs_path
-                                    break
-
-
-                    if implementation_file and interface_file:
-                        svc_files.append({
-                            'svc_file': svc_filepath,
-                            'implementation_file': implementation_file,
-                            'interface_file': interface_file,
-                            'service_name': simple_service_name
-                        })
-                        print(f"Found service: {simple_service_name}")
-                        print(f"  .svc: {svc_filepath}")
-                        print(f"  Impl: {implementation_file}")
-                        print(f"  Intf: {interface_file}")
-                    else:
-                        print(f"Could not link .svc file to both implementation and interface: {svc_filepath}")
-                        if not implementation_file:
-                            print("  - Implementation file not found or linked incorrectly.")
-                        if not interface_file:
-                            print("  - Interface file not found or linked incorrectly.")
-                else:
-                    print(f"Could not find 'Service' attribute in {svc_filepath}. Skipping.")
+                cs_paths.append(os.path.join(subdir, file))
+            elif file.endswith(".svc"):
+                svc_paths.append(os.path.join(subdir, file))
+
+    # Summarize the .cs files in parallel; the index is built in walk order so results are stable
+    with ThreadPoolExecutor(max_workers=scan_workers) as executor:
+        for filepath, (declarations, imports) in zip(cs_paths, executor.map(summarize_cs_file, cs_paths)):
+            add_to_symbol_index(symbol_index, filepath, declarations, imports)
+
+    # Link each .svc file to its implementation and interface through the index
+    for svc_filepath in svc_paths:
+        svc_content = read_file(svc_filepath)
+
+        if not svc_content:
+            continue
+
+        # Regex to find the Service attribute in the .svc file
+        # Example: <%@ ServiceHost Language="C#" Debug="true" Service="MyNamespace.MyService" %>
+        match = re.search(r'Service="([^"]+)"', svc_content)
+        if not match:
+            print(f"Could not find 'Service' attribute in {svc_filepath}. Skipping.")
+            continue
+
+        full_service_name = match.group(1)
+        # Extract simple class name (e.g., "MyService" from "MyNamespace.MyService")
+        simple_service_name = full_service_name.split('.')[-1]
+
+        # Prefer the namespace-qualified declaration, then any class with the simple name
+        classes = symbol_index['classes']
+        class_files = classes.get(full_service_name) or classes.get(simple_service_name)
+
+        interface_name = None
+        interface_file = None
+        if class_files:
+            # Look for a [ServiceContract] interface among the class's base types
+            # (collected across all parts of a partial class), e.g.
+            # public class MyService : IMyService
+            contracts = symbol_index['service_contracts']
+            interface_name = next(
+                (base for base in symbol_index['base_types'].get(simple_service_name, [])
+                 if base.startswith('I') and base in contracts),
+                None
+            )
+            if interface_name is None:
+                # Fallback: the interface might not be inherited on the class definition,
+                # so use the conventional IServiceName contract if one exists.
+                interface_name = f"I{simple_service_name}"
+            interface_file = pick_declaring_file(contracts.get(interface_name), interface_name)
+
+        implementation_file = pick_implementation_file(class_files, simple_service_name, interface_name, interface_file)
+        if implementation_file and interface_file:
+            svc_files.append({
+                'svc_file': svc_filepath,
+                'implementation_file': implementation_file,
+                'interface_file': interface_file,
+                'service_name': simple_service_name
+            })
+            print(f"Found service: {simple_service_name}")
+            print(f"  .svc: {svc_filepath}")
+            print(f"  Impl: {implementation_file}")
+            print(f"  Intf: {interface_file}")
+        else:
+            print(f"Could not link .svc file to both implementation and interface: {svc_filepath}")
+            if not implementation_file:
+                print("  - Implementation file not found or linked incorrectly.")
+            if not interface_file:
+                print("  - Interface file not found or linked incorrectly.")
     return svc_files
 
 # Safely read file contents
@@ -119,35 +326,42 @@ def read_file(path):
             print(f"Error reading file {path}: {e}")
     return ""
 
-#  Step 3: Create the prompt to convert WCF to NodeJS
-def create_prompt(service_name, svc_content, implementation_code, interface_code):
+# Lazily loaded contents of the files linked to services
+class LinkedSources:
     """
-    Creates a detailed prompt for the LLM to convert WCF to NestJS.
-    Includes the .svc content, service implementation, and interface definition.
+    Loads each source file linked to a service on first use, exactly once, and keeps it
+    only until every service that needs it (e.g. several sharing an interface) has been
+    released, i.e. converted, validated and repaired; a service may read its files any
+    number of times until then. Safe to use from worker threads.
     """
-    prompt = f"""
-You are a senior developer specializing in WCF to Node.js (NestJS) migration.
-Your task is to convert the following WCF service definition, its C# implementation,
-and its C# interface into equivalent Node.js code using the NestJS framework.
 
-**WCF Service Name:** {service_name}
+    def __init__(self, services):
+        self._remaining = Counter(path for info in services for path in self._paths(info))
+        self._entries = {}
+        self._lock = threading.Lock()
 
-**1. WCF Service (.svc) Configuration:**
-```xml
-{svc_content}
-```
+    @staticmethod
+    def _paths(service_info):
+        return service_info['svc_file'], service_info['implementation_file'], service_info['interface_file']
 
-**2. C# Service Interface Definition (with ServiceContract/OperationContract):**
-```csharp
-{interface_code}
-```
+    def read(self, path):
+        with self._lock:
+            entry = self._entries.setdefault(path, {'lock': threading.Lock(), 'content': None})
+        with entry['lock']:
+            if entry['content'] is None:
+                entry['content'] = read_file(path)
+            return entry['content']
 
-**3. C# Service Implementation:**
-```csharp
-{implementation_code}
-```
+    def release(self, service_info):
+        """Called once per service when it is done; drops the files no other pending service needs."""
+        with self._lock:
+            for path in self._paths(service_info):
+                self._remaining[path] -= 1
+                if self._remaining[path] <= 0:
+                    self._entries.pop(path, None)
 
-**Instructions for Node.js (NestJS) Conversion:**
+# Conversion instructions shared by single-service and batched prompts
+CONVERSION_INSTRUCTIONS = """**Instructions for Node.js (NestJS) Conversion:**
 * Create a NestJS module, service, and controller for this WCF service.
 * Map WCF `ServiceContract` to NestJS `@Controller()` or `@Module()`.
 * Map WCF `OperationContract` methods to NestJS controller methods (e.g., `@Get()`, `@Post()`, `@Put()`, `@Delete()`, `@Patch()`). Use appropriate HTTP verbs based on the WCF operation's likely intent (e.g., `Get` for data retrieval, `Post` for creation, `Put` for updates). If intent is unclear, default to `@Post()`.
@@ -162,49 +376,213 @@ TypeScript
 // ... your code here ...
 This is the only format that will be accepted. Do not include any other markdown headings or conversational text within the output. The response should only be the code blocks themselves.
 """
+
+# The source sections describing one service in a prompt
+def format_service_sources(service_name, svc_content, implementation_code, interface_code):
+    return f"""**WCF Service Name:** {service_name}
+
+**1. WCF Service (.svc) Configuration:**
+```xml
+{svc_content}
+```
+
+**2. C# Service Interface Definition (with ServiceContract/OperationContract):**
+```csharp
+{interface_code}
+```
+
+**3. C# Service Implementation:**
+```csharp
+{implementation_code}
+```
+"""
+
+#  Step 3: Create the prompt to convert WCF to NodeJS
+def create_prompt(service_name, svc_content, implementation_code, interface_code, chunk_instructions="",
+                  shared_models="", dependencies=""):
+    """
+    Creates a detailed prompt for the LLM to convert WCF to NestJS.
+    Includes the .svc content, service implementation, and interface definition.
+    `chunk_instructions` is appended when only part of a large service is being converted.
+    `shared_models` lists the already converted Data Contracts the service should import.
+    `dependencies` holds the declarations from other files the service depends on
+    (DependencyContext.prompt_section).
+    """
+    prompt = f"""
+You are a senior developer specializing in WCF to Node.js (NestJS) migration.
+Your task is to convert the following WCF service definition, its C# implementation,
+and its C# interface into equivalent Node.js code using the NestJS framework.
+
+{format_service_sources(service_name, svc_content, implementation_code, interface_code)}{dependencies}
+{CONVERSION_INSTRUCTIONS}{shared_models}{chunk_instructions}{response_format.instructions(STRUCTURED_PATHS)}"""
     return prompt
 
+
+def create_batch_prompt(services, shared_models="", dependencies=""):
+    """
+    Creates one prompt converting several small services, so the instructions and the
+    request round-trip are paid once. `services` is a list of
+    (service_name, svc_content, implementation_code, interface_code) tuples.
+    Every filename in the response is prefixed with its service name for demultiplexing.
+    """
+    sources = "\n---\n\n".join(format_service_sources(*service) for service in services)
+    example = services[0][0]
+    return f"""
+You are a senior developer specializing in WCF to Node.js (NestJS) migration.
+Your task is to convert each of the following {len(services)} WCF services (service definition, C# implementation
+and C# interface) into equivalent Node.js code using the NestJS framework. Convert every service independently.
+
+{sources}{dependencies}
+{CONVERSION_INSTRUCTIONS}{shared_models}
+**Batched Conversion:**
+* Output the files of every service listed above.
+* Prefix every filename with the WCF Service Name it belongs to, for example:
+// filename: {example}/src/{example.lower()}/{example.lower()}.module.ts
+{response_format.instructions(STRUCTURED_PATHS)}"""
+
+
+def create_chunk_instructions(service_name, operations, part, total_parts):
+    """Extra instructions for one operation group of a service that is converted in parts."""
+    folder = service_name.lower()
+    return f"""
+**Partial Conversion ({part} of {total_parts}):**
+* This service is too large for one request, so only these operations are included: {', '.join(operations)}.
+* Convert only these operations. The other parts are converted separately and merged afterwards.
+* Always use exactly these file names so the parts can be merged:
+  src/{folder}/{folder}.module.ts, src/{folder}/{folder}.service.ts, src/{folder}/{folder}.controller.ts
+"""
+
 # Step 4: Send the prompt to LLM and get a response
-def call_llm(prompt, file_name):
-    """
-    Calls the LLM with the generated prompt and returns the response text.
-    Includes basic error handling and exponential backoff for API calls.
-    """
-    max_retries = 2
-    base_delay = 1 # seconds
-
-    for attempt in range(max_retries):
-        try:
-            print(f"Calling LLM for {file_name} (Attempt {attempt + 1}/{max_retries})...")
-            response = model.generate_content(prompt)
-            #print("Generated response:")
-            # Check if response has text content
-            if response and hasattr(response, 'text') and response.text:
-                #print(response.text)
-                return response.text
-            else:
-                print(f"LLM returned an empty or invalid response for {file_name}.")
-                # If response is empty, retry
-                raise ValueError("Empty LLM response")
+def create_repair_prompt(service_name, svc_content, implementation_code, interface_code, filename, content,
+                         problems, filenames, shared_models="", dependencies=""):
+    """
+    Creates a focused prompt regenerating one generated file that failed validation (or
+    is missing), instead of converting the whole service again.
+    """
+    if content:
+        current = f"**Current `{filename}` (as generated):**\n```typescript\n{content}\n```"
+    else:
+        current = f"**`{filename}` was not generated.**"
+    problem_lines = "\n".join(f"* {problem}" for problem in problems)
+    file_lines = "\n".join(f"* {name}" for name in filenames)
+    return f"""
+You are a senior developer specializing in WCF to Node.js (NestJS) migration.
+The WCF service below was converted to NestJS, but one of the generated files failed validation.
+Your task is to output a corrected, complete version of that file only.
 
-        except Exception as e:
-            print(f"An error occurred while converting {file_name} (Attempt {attempt + 1}): {e}")
-            if attempt < max_retries - 1:
-                delay = base_delay * (2 ** attempt)
-                print(f"Retrying in {delay} seconds...")
-                time.sleep(delay)
-            else:
-                print(f"Max retries reached for {file_name}. Skipping this file.")
-                return None
-    return None # Should not be reached if successful or max retries exhausted
+{format_service_sources(service_name, svc_content, implementation_code, interface_code)}{dependencies}{shared_models}
+**Files generated for this service:**
+{file_lines}
+
+{current}
+
+**Problems found:**
+{problem_lines}
+
+**Instructions:**
+* Output the whole of `{filename}`, with every bracket closed. Do not output any other file.
+* Keep the names it imports and exports consistent with the other generated files.
+* Use relative imports only for the files listed above (or the shared models module, if any); inline anything else or import it from a package.
+* Start the output with exactly this comment:
+// filename: {filename}
+Do not include any other markdown headings or conversational text within the output. The response should only be the code itself.
+{response_format.instructions(STRUCTURED_PATHS)}"""
+
+
+def call_llm(prompt, file_name, rate_limiter=None, cache=None):
+    """
+    Calls the LLM with the generated prompt and returns the response text, or None if
+    the call failed. Failed attempts are retried according to `retry_policy`.
+    When a rate limiter is given, every attempt waits for RPM/TPM quota first.
+    When a response cache is given, an identical earlier prompt is answered from disk.
+    """
+    if cache:
+        cached = cache.get(prompt)
+        if cached is not None:
+            print(f"Using cached LLM response for {file_name}.")
+            report.cache_hit()
+            return cached
+
+    def attempt_request(attempt):
+        if rate_limiter:
+            with report.stage("rate_limit_wait"):
+                rate_limiter.acquire(estimate_tokens(prompt))
+        print(f"Calling LLM for {file_name} (Attempt {attempt}/{retry_policy.max_attempts})...")
+        with report.llm_attempt(estimate_tokens(prompt), retry=attempt > 1) as usage:
+            response_text = backend.generate(prompt)
+            usage["response_tokens"] = estimate_tokens(response_text)
+        #print("Generated response:")
+        # Check if response has text content
+        if not response_text:
+            raise EmptyResponseError("LLM returned an empty or invalid response")
+        #print(response_text)
+        response_format.record_response(response_text)
+        if rate_limiter:
+            rate_limiter.record_usage(estimate_tokens(response_text))
+        if cache:
+            cache.put(prompt, response_text)
+        return response_text
+
+    return retry_policy.call(attempt_request, file_name)
+
+
+def stream_llm(prompt, file_name, new_parser, rate_limiter=None, cache=None):
+    """
+    Streaming variant of call_llm. Every piece of the response is fed to a parser made by
+    `new_parser()` (a fresh one per attempt) as soon as it arrives, so files can be written
+    before the response is complete. The full text is only kept when it has to be cached.
+    Returns the closed parser, or None if every attempt failed.
+    """
+    if cache:
+        cached = cache.get(prompt)
+        if cached is not None:
+            print(f"Using cached LLM response for {file_name}.")
+            report.cache_hit()
+            parser = new_parser()
+            parser.feed(cached)
+            parser.close()
+            return parser
+
+    def attempt_request(attempt):
+        if rate_limiter:
+            with report.stage("rate_limit_wait"):
+                rate_limiter.acquire(estimate_tokens(prompt))
+        print(f"Streaming LLM response for {file_name} (Attempt {attempt}/{retry_policy.max_attempts})...")
+        parser = new_parser()
+        pieces = [] if cache else None
+        received = 0
+        # Extraction and file writes happen inside this attempt, as the pieces arrive
+        with report.llm_attempt(estimate_tokens(prompt), retry=attempt > 1) as usage:
+            for piece in backend.generate_stream(prompt):
+                received += len(piece)
+                parser.feed(piece)
+                if pieces is not None:
+                    pieces.append(piece)
+            usage["response_tokens"] = received // CHARS_PER_TOKEN + 1 if received else 0
+
+        if not received:
+            raise EmptyResponseError("LLM returned an empty or invalid response")
+        parser.close()
+        response_format.record_parser(parser)
+        if rate_limiter:
+            rate_limiter.record_usage(received // CHARS_PER_TOKEN + 1)
+        if cache:
+            cache.put(prompt, "".join(pieces))
+        return parser
+
+    return retry_policy.call(attempt_request, file_name)
 
 
 def extract_code_blocks(llm_output):
     """
     Extracts code blocks from LLM output based on `// filename:` comments.
-    Supports blocks without Markdown fences.
+    Supports blocks without Markdown fences, and structured (JSON file list) responses.
     Returns a dictionary: { filename: code_content }
     """
+    structured_files = parse_files(llm_output)
+    if structured_files:
+        return dict(structured_files)
+
     lines = llm_output.splitlines()
     files = {}
     current_filename = None
@@ -230,6 +608,24 @@ def extract_code_blocks(llm_output):
 
     return files
 
+# Save one generated file below a service's output directory
+def save_code_file(service_output_dir, filename, content):
+    """
+    Writes a single extracted code block, unless the file already has this content.
+    Returns the saved path (also when unchanged), or None on error.
+    """
+    # Construct the full path, including any subdirectories specified in the filename
+    # e.g., 'src/modules/users/users.module.ts' will create 'output_path/service_name/src/modules/users/'
+    file_path = Path(service_output_dir) / filename
+    try:
+        with report.stage("write"):
+            written = writer.write(file_path, content)
+        print(f"Successfully saved: {file_path}" if written else f"Unchanged: {file_path}")
+        return file_path
+    except IOError as e:
+        print(f"Error saving file {file_path}: {e}")
+        return None
+
 # Step 5: Process the LLM output and save it to nodeJs file.
 def save_nodejs_output_to_files(service_name, output_path, node_code):
     """
@@ -241,15 +637,19 @@ def save_nodejs_output_to_files(service_name, output_path, node_code):
         output_path (str): The base directory where service output directories will be created.
         node_code (str): The string containing the LLM's generated Node.js code,
                          expected to have code blocks with filename comments.
+
+    Returns:
+        list: Paths of the files that were saved.
     """
+    saved_files = []
     if node_code:
         # Create a subdirectory for each service's output for better organization
         service_output_dir = Path(output_path) / service_name
-        os.makedirs(service_output_dir, exist_ok=True)
-        print(f"Ensured output directory exists: {service_output_dir}")
 
         # Extract individual files from the LLM's output string
-        extracted_files = extract_code_blocks(node_code)
+        with report.stage("extract"):
+            extracted_files = extract_code_blocks(node_code)
+        response_format.record_output(bool(extracted_files))
 
         if not extracted_files:
             print(f"Warning: No separate code files were extracted for '{service_name}'.")
@@ -260,75 +660,835 @@ def save_nodejs_output_to_files(service_name, output_path, node_code):
             print("```")
             # Fallback: if no specific files are found, save the whole thing as a generic .ts file
             default_file_name = f"{service_name}.ts" # Or .js
-            with open(service_output_dir / default_file_name, "w", encoding="utf-8") as f:
-                f.write(node_code)
+            if not save_code_file(service_output_dir, default_file_name, node_code):
+                return []
             print(f"As a fallback, the entire output was saved to: {service_output_dir / default_file_name}")
-            return
+            return [service_output_dir / default_file_name]
 
-        # Save each extracted code block to its own file
+        # Create all of the service's directories at once, then save each code block to its own file
+        writer.make_directories(service_output_dir / filename for filename in extracted_files)
         for filename, content in extracted_files.items():
-            # Construct the full path, including any subdirectories specified in the filename
-            # e.g., 'src/modules/users/users.module.ts' will create 'output_path/service_name/src/modules/users/'
-            file_path = service_output_dir / filename
-            os.makedirs(file_path.parent, exist_ok=True) # Ensure parent directories exist
-            try:
-                with open(file_path, "w", encoding="utf-8") as f:
-                    f.write(content)
-                print(f"Successfully saved: {file_path}")
-            except IOError as e:
-                print(f"Error saving file {file_path}: {e}")
+            file_path = save_code_file(service_output_dir, filename, content)
+            if file_path:
+                saved_files.append(file_path)
     else:
         print(f"No Node.js code provided for '{service_name}'. LLM response was empty or an error occurred.")
+    return saved_files
+
+
+# Stream one service's response straight to disk
+def stream_nodejs_output_to_files(prompt, service_name, output_path, rate_limiter=None, cache=None):
+    """
+    Streams the LLM response for a service and writes each `// filename:` block (or JSON
+    file entry) as soon as it is complete. Returns the saved paths, or None if the call failed.
+    """
+    service_output_dir = Path(output_path) / service_name
+    saved_files = []
+
+    def write_file(filename, content):
+        file_path = save_code_file(service_output_dir, filename, content)
+        if file_path:
+            saved_files.append(file_path)
+
+    def new_parser():
+        # A retry starts over, rewriting any files of the failed attempt
+        saved_files.clear()
+        return response_format.stream_parser(CodeBlockStreamParser(write_file))
+
+    parser = stream_llm(prompt, service_name, new_parser, rate_limiter, cache)
+    if parser is None:
+        return None
+    if not parser.files:
+        # No `// filename:` blocks: fall back to saving the whole response in one file
+        return save_nodejs_output_to_files(service_name, output_path, "\n".join(parser.preamble))
+    response_format.record_output(True)
+    return saved_files
       
 
+# Convert a single linked service; safe to run on worker threads
+def convert_service(service_info, rate_limiter=None, cache=None, stream_to=None, sources=None, shared_models=None):
+    """
+    Reads one service's source files, builds its prompt and calls the LLM.
+    Returns the generated Node.js code, or None if the service was skipped or failed.
+    When `stream_to` (the output directory) is given, the response is streamed and files are
+    written there as soon as each is complete; the saved paths are returned instead of the code.
+    `sources` (LinkedSources) shares file contents between services; files are read directly without it.
+    `shared_models` (SharedModels) are imported from the shared models module instead of regenerated.
+    """
+    service_name = service_info['service_name']
+    svc_file_path = service_info['svc_file']
+    implementation_file_path = service_info['implementation_file']
+    interface_file_path = service_info['interface_file']
+
+    print(f"\n🔄 Converting service: {service_name}")
+    print(f"  .svc: {svc_file_path}")
+    print(f"  Impl: {implementation_file_path}")
+    print(f"  Intf: {interface_file_path}")
+
+    service_sources = read_service_sources(service_info, sources)
+    if service_sources is None:
+        return None
+    return convert_service_sources(service_name, *service_sources, rate_limiter, cache, stream_to, shared_models,
+                                   service_source_paths(service_info))
+
+
+def read_service_sources(service_info, sources=None):
+    """
+    Reads a service's .svc, implementation and interface files and compacts the C#.
+    Returns (svc_content, implementation_code, interface_code), or None if a file could not be read.
+    """
+    service_name = service_info['service_name']
+
+    # Read original service files' content
+    read = sources.read if sources else read_file
+    with report.stage("read_sources"):
+        svc_content = read(service_info['svc_file'])
+        implementation_code = read(service_info['implementation_file'])
+        interface_code = read(service_info['interface_file'])
+
+    if not (svc_content and implementation_code and interface_code):
+        print(f"Skipping {service_name}: Could not read all required source files. Ensure files exist and are readable.")
+        return None
+
+    # Strip comments, usings, regions and dead code before counting tokens
+    with report.stage("compact"):
+        return svc_content, compact_csharp(implementation_code), compact_csharp(interface_code)
+
+
+def prompt_sections(service_name, shared_models, source_paths, *codes):
+    """
+    The shared models and dependencies sections of a prompt for the given code of a service:
+    only what the code uses, declared in other files. Shared Data Contracts are listed by
+    the first section, so the second leaves them out.
+    """
+    models = shared_models.prompt_section(service_name, *codes) if shared_models else ""
+    dependencies = dependency_context.prompt_section(*codes, exclude=shared_models.declarations if shared_models else (),
+                                                     paths=source_paths)
+    return models, dependencies
+
+
+def service_prompt(service_name, svc_content, implementation_code, interface_code, shared_models=None,
+                   source_paths=()):
+    """
+    Builds the prompt converting a whole service from its compacted sources. Shared Data
+    Contracts are listed as TypeScript, so their C# declarations are left out of the code.
+
+    Returns:
+        tuple: (prompt, shared models section, dependencies section, implementation code,
+               interface code), the code without the shared Data Contracts.
+    """
+    shared_section, dependencies = prompt_sections(service_name, shared_models, source_paths,
+                                                   implementation_code, interface_code)
+    if shared_models:
+        implementation_code = shared_models.strip(implementation_code)
+        interface_code = shared_models.strip(interface_code)
+    prompt = create_prompt(service_name, svc_content, implementation_code, interface_code, "", shared_section,
+                           dependencies)
+    return prompt, shared_section, dependencies, implementation_code, interface_code
+
+
+def split_service(service_name, svc_content, implementation_code, interface_code, shared_section, dependencies,
+                  token_budget):
+    """Splits a service whose prompt exceeds token_budget into operation groups (split_by_operations)."""
+    overhead = estimate_tokens(create_prompt(service_name, svc_content, "", "", create_chunk_instructions(
+        service_name, ["x"], 1, 1), shared_section, dependencies))
+    return split_by_operations(interface_code, implementation_code, token_budget - overhead)
+
+
+def convert_service_sources(service_name, svc_content, implementation_code, interface_code,
+                            rate_limiter=None, cache=None, stream_to=None, shared_models=None, source_paths=()):
+    """
+    Converts one service from its (compacted) sources; see convert_service for the return value.
+    `source_paths` are the service's C# files (service_source_paths), which scope its type references.
+    """
+    with report.stage("build_prompt"):
+        prompt, shared_section, dependencies, implementation_code, interface_code = service_prompt(
+            service_name, svc_content, implementation_code, interface_code, shared_models, source_paths)
+    token_budget = prompt_token_budget(backend.model_name)
+    if estimate_tokens(prompt) <= token_budget:
+        if stream_to:
+            return stream_nodejs_output_to_files(prompt, service_name, stream_to, rate_limiter, cache)
+        return call_llm(prompt, service_name, rate_limiter, cache)
+
+    # Still too large: convert groups of operations separately and merge the generated files
+    chunks = split_service(service_name, svc_content, implementation_code, interface_code, shared_section,
+                           dependencies, token_budget)
+    print(f"{service_name} exceeds the {token_budget}-token prompt budget; converting in {len(chunks)} part(s).")
+
+    chunk_files = []
+    for part, (operations, interface_chunk, implementation_chunk) in enumerate(chunks, start=1):
+        chunk_prompt = create_prompt(service_name, svc_content, implementation_chunk, interface_chunk,
+                                     create_chunk_instructions(service_name, operations, part, len(chunks)),
+                                     *prompt_sections(service_name, shared_models, source_paths,
+                                                      implementation_chunk, interface_chunk))
+        chunk_code = call_llm(chunk_prompt, f"{service_name} (part {part}/{len(chunks)})", rate_limiter, cache)
+        if not chunk_code:
+            print(f"Part {part} of {service_name} failed; the service will not be saved.")
+            return None
+        with report.stage("extract"):
+            chunk_files.append(extract_code_blocks(chunk_code))
+
+    # Re-serialize in the `// filename:` format so saving works exactly as for single responses
+    node_code = serialize_code_blocks(merge_generated_files(chunk_files))
+    if stream_to:
+        return save_nodejs_output_to_files(service_name, stream_to, node_code)
+    return node_code
+
+
+# Convert several small services with one batched prompt; safe to run on worker threads
+def convert_service_batch(batch, rate_limiter=None, cache=None, stream_to=None, sources=None, shared_models=None,
+                          validate=True):
+    """
+    Converts a batch of linked services with a single LLM call and splits the response
+    back into one result per service. A service missing from the batched response (or
+    every service, if the call failed) is retried on its own, so one bad unit does not
+    fail the others. Returns a list of (service_info, result), with results as returned
+    by convert_service. Batched responses are saved once complete rather than streamed.
+    With `validate`, each service's files are checked and repaired (check_service_output).
+    The batch's services are released from `sources` (LinkedSources) once all of this is done.
+    """
+    names = [info['service_name'] for info in batch]
+    try:
+        if len(batch) == 1:
+            with report.unit(names[0]):
+                result = convert_service(batch[0], rate_limiter, cache, stream_to, sources, shared_models)
+                if validate:
+                    result = check_service_output(batch[0], result, rate_limiter, cache, stream_to, sources,
+                                                  shared_models)
+                return [(batch[0], result)]
+
+        with report.unit(f"batch: {', '.join(names)}"):
+            results = _convert_service_batch(batch, rate_limiter, cache, stream_to, sources, shared_models)
+        if validate:
+            for service_info in batch:
+                with report.unit(service_info['service_name']):
+                    results[service_info['service_name']] = check_service_output(
+                        service_info, results[service_info['service_name']], rate_limiter, cache, stream_to, sources,
+                        shared_models)
+        return [(info, results[info['service_name']]) for info in batch]
+    finally:
+        if sources:
+            for service_info in batch:
+                sources.release(service_info)
+
+
+def _convert_service_batch(batch, rate_limiter, cache, stream_to, sources, shared_models):
+    """Does the work of convert_service_batch for two or more services; returns {service_name: result}."""
+    names = [info['service_name'] for info in batch]
+    print(f"\n🔄 Converting {len(batch)} services in one batch: {', '.join(names)}")
+
+    results = {}
+    loaded = []
+    source_paths = {}
+    for service_info in batch:
+        service_sources = read_service_sources(service_info, sources)
+        if service_sources is None:
+            results[service_info['service_name']] = None
+        else:
+            loaded.append((service_info['service_name'], service_sources))
+            source_paths[service_info['service_name']] = service_source_paths(service_info)
+
+    node_code = None
+    if loaded:
+        shared_section = ""
+        batch_sources = [(name, *service_sources) for name, service_sources in loaded]
+        with report.stage("build_prompt"):
+            dependencies = dependency_context.prompt_section(
+                *(code for _, (_, implementation, interface) in loaded for code in (implementation, interface)),
+                exclude=shared_models.declarations if shared_models else (),
+                paths=[path for paths in source_paths.values() for path in paths])
+            if shared_models:
+                shared_section = shared_models.prompt_section(
+                    loaded[0][0], *(code for _, (_, implementation, interface) in loaded for code in (implementation, interface)))
+                batch_sources = [(name, svc, shared_models.strip(implementation), shared_models.strip(interface))
+                                 for name, svc, implementation, interface in batch_sources]
+            prompt = create_batch_prompt(batch_sources, shared_section, dependencies)
+        node_code = call_llm(prompt, f"batch of {len(loaded)} services", rate_limiter, cache)
+    split_code = split_batch_response(node_code, [name for name, _ in loaded]) if node_code else {}
+
+    for service_name, service_sources in loaded:
+        service_code = split_code.get(service_name)
+        if not service_code:
+            # Isolate the failure: only this service is sent again, in a prompt of its own
+            print(f"{service_name} is missing from the batched response; converting it separately.")
+            with report.unit(service_name):
+                results[service_name] = convert_service_sources(service_name, *service_sources,
+                                                                rate_limiter, cache, stream_to, shared_models,
+                                                                source_paths[service_name])
+        elif stream_to:
+            results[service_name] = save_nodejs_output_to_files(service_name, stream_to, service_code)
+        else:
+            results[service_name] = service_code
+    return results
+
+
+def split_batch_response(node_code, service_names):
+    """
+    Demultiplexes a batched response. Every `// filename:` block is assigned to the service
+    named by the first segment of its path, which is then removed. Returns {service_name:
+    response text in the single-service format} for the services that produced any files.
+    """
+    by_name = {name.lower(): name for name in service_names}
+    service_files = {}
+    with report.stage("extract"):
+        extracted_files = extract_code_blocks(node_code)
+    for filename, content in extracted_files.items():
+        first, _, rest = filename.replace("\\", "/").lstrip("./").partition("/")
+        service_name = by_name.get(first.lower())
+        if service_name and rest:
+            service_files.setdefault(service_name, {})[rest] = content
+    return {name: serialize_code_blocks(files) for name, files in service_files.items()}
+
+
+def serialize_code_blocks(files):
+    """Formats {filename: content} as `// filename:` blocks, the format extract_code_blocks reads."""
+    return "\n".join(f"// filename: {filename}\n{content}\n" for filename, content in files.items())
+
+
+# Files every converted service must contain, by suffix
+REQUIRED_NEST_FILES = ("module", "service", "controller")
+
+
+def missing_nest_files(service_name, filenames):
+    """
+    Paths of the NestJS module, service and controller missing from a service's generated
+    files, named like the ones present (src/books/books.module.ts -> src/books/books.controller.ts).
+    """
+    present = {}
+    for filename in filenames:
+        for kind in REQUIRED_NEST_FILES:
+            if filename.endswith(f".{kind}.ts"):
+                present.setdefault(kind, filename)
+    if len(present) == len(REQUIRED_NEST_FILES):
+        return []
+    if present:
+        kind, filename = next(iter(present.items()))
+        prefix = filename[:-len(f"{kind}.ts")]
+    else:
+        folder = service_name.lower()
+        prefix = f"src/{folder}/{folder}."
+    return [f"{prefix}{kind}.ts" for kind in REQUIRED_NEST_FILES if kind not in present]
+
+
+def validate_service_files(service_name, files, shared_models=None):
+    """
+    Checks a service's generated files ({filename: content}, relative to its output
+    directory) locally: bracket balance, relative imports and the module/service/controller
+    set. Returns {filename: [problems]}, including an entry for every missing NestJS file.
+    """
+    shared_path = f"{SHARED_MODELS_DIR}/{SHARED_MODELS_FILE}"
+    tree = {f"{service_name}/{filename}": content for filename, content in files.items()}
+    found = validate_files(tree, exists=lambda path: shared_models is not None and path == shared_path)
+    problems = {path[len(service_name) + 1:]: file_problems for path, file_problems in found.items()}
+    for filename in missing_nest_files(service_name, files):
+        problems[filename] = ["missing: every service needs a NestJS module, service and controller"]
+    return problems
+
+
+# Validate a converted service and repair the failing files; safe to run on worker threads
+def check_service_output(service_info, result, rate_limiter=None, cache=None, stream_to=None, sources=None,
+                         shared_models=None):
+    """
+    Validates a converted service (`result` as returned by convert_service) and re-requests
+    only the files that fail, each with a focused repair prompt. A repair is kept if it
+    passes validation. Returns the result with the repaired files in place: the code in
+    the `// filename:` format, or the saved paths when streaming (repairs are written too).
+    """
+    service_name = service_info['service_name']
+    if not result:
+        return result
+    with report.stage("validate"):
+        if stream_to:
+            service_output_dir = Path(stream_to) / service_name
+            files = {Path(path).relative_to(service_output_dir).as_posix(): read_file(path) for path in result}
+            # The whole-response fallback file of a response without `// filename:` blocks is not checked
+            files.pop(f"{service_name}.ts", None)
+        else:
+            files = extract_code_blocks(result)
+        problems = validate_service_files(service_name, files, shared_models) if files else {}
+    report.count("files_validated", len(files))
+    if not problems:
+        return result
+    report.count("files_invalid", len(problems))
+    for filename, file_problems in problems.items():
+        print(f"⚠️ {service_name}/{filename} failed validation: {'; '.join(file_problems)}")
+
+    service_sources = read_service_sources(service_info, sources)
+    if service_sources is None:
+        return result
+    svc_content, implementation_code, interface_code = service_sources
+    shared_section = ""
+    dependencies = dependency_context.prompt_section(implementation_code, interface_code,
+                                                     exclude=shared_models.declarations if shared_models else (),
+                                                     paths=service_source_paths(service_info))
+    if shared_models:
+        shared_section = shared_models.prompt_section(service_name, implementation_code, interface_code)
+        implementation_code = shared_models.strip(implementation_code)
+        interface_code = shared_models.strip(interface_code)
+
+    for filename, file_problems in problems.items():
+        with report.stage("build_prompt"):
+            prompt = create_repair_prompt(service_name, svc_content, implementation_code, interface_code, filename,
+                                          files.get(filename), file_problems, list(files), shared_section,
+                                          dependencies)
+        repair_code = call_llm(prompt, f"{service_name} (repair of {filename})", rate_limiter, cache)
+        with report.stage("extract"):
+            repaired_files = extract_code_blocks(repair_code) if repair_code else {}
+        repaired = repaired_files.get(filename)
+        if repaired is None and len(repaired_files) == 1:
+            repaired = next(iter(repaired_files.values()))
+        with report.stage("validate"):
+            valid = repaired and not validate_service_files(
+                service_name, {**files, filename: repaired}, shared_models).get(filename)
+        if not valid:
+            print(f"❌ Could not repair {service_name}/{filename}; keeping the generated version.")
+            continue
+        files[filename] = repaired
+        report.count("files_repaired")
+        print(f"🔧 Repaired {service_name}/{filename}")
+        if stream_to:
+            file_path = save_code_file(service_output_dir, filename, repaired)
+            if file_path and file_path not in result:
+                result.append(file_path)
+    return result if stream_to else serialize_code_blocks(files)
+
+
+# Estimated prompt tokens of a service, from file sizes so no source is read while planning batches
+def estimate_service_tokens(service_info):
+    paths = (service_info['svc_file'], service_info['implementation_file'], service_info['interface_file'])
+    return sum(os.path.getsize(path) for path in paths if os.path.exists(path)) // CHARS_PER_TOKEN + 1
+
+
+# The C# files of a service; their namespaces and using directives scope its type references
+def service_source_paths(service_info):
+    return [service_info['implementation_file'], service_info['interface_file']]
+
+
+# Input files of a service, as fingerprinted by the manifest; `shared_contracts` are the names of
+# the Data Contracts converted into the shared models module, which covers the files declaring them
+def service_inputs(service_info, output_path, shared_models=None, shared_contracts=()):
+    inputs = {
+        'svc': service_info['svc_file'],
+        'implementation': service_info['implementation_file'],
+        'interface': service_info['interface_file'],
+    }
+    # The shared models module is an input too, since its types are copied into every prompt
+    if shared_models:
+        inputs['shared_models'] = Path(output_path) / SHARED_MODELS_DIR / SHARED_MODELS_FILE
+    # So are the files declaring the types the service depends on, apart from the shared Data Contracts
+    dependency_files = dependency_context.declaring_files(service_source_paths(service_info),
+                                                          shared_contracts if shared_models else ())
+    for i, path in enumerate(dependency_files):
+        inputs[f'dependency {i}'] = path
+    return inputs
+
+
+# Input files of the shared models module: every file declaring a data contract
+def shared_models_inputs(contract_files):
+    contract_paths = sorted({path for paths in contract_files.values() for path in paths})
+    return {f"contract {i}": path for i, path in enumerate(contract_paths)}
+
+
+# The prompt converting one group of data contracts into the shared models module
+def models_prompt(group, part, total_parts):
+    return create_models_prompt(group, part, total_parts) + response_format.instructions(STRUCTURED_PATHS)
+
+
+# The data contract sources, grouped so that each group's prompt fits the token budget
+def data_contract_groups(contract_files):
+    sources = collect_data_contracts(contract_files, read_file)
+    if not sources:
+        return []
+    token_budget = prompt_token_budget(backend.model_name)
+    return group_data_contracts(sources, token_budget - estimate_tokens(models_prompt({}, 1, 2)))
+
+
+# Step 2c: Convert the Data Contracts once, into a models module shared by all services
+def convert_shared_models(contract_files, output_path, manifest, incremental=False, rate_limiter=None, cache=None):
+    """
+    Converts every [DataContract] class into one TypeScript module, saved under
+    output_path/shared-models, so service prompts can import the types instead of
+    regenerating them. Data contracts that do not fit one prompt are converted in parts
+    and merged. Returns SharedModels, or None if there are none or the conversion failed.
+
+    Args:
+        contract_files (dict): Data contract class name -> [.cs paths declaring it].
+        manifest (ConversionManifest): Records the module like a service, so it is only
+                                       reconverted in incremental mode when a data contract changes.
+    """
+    if not contract_files:
+        return None
+    models_dir = Path(output_path) / SHARED_MODELS_DIR
+    fingerprint = manifest.fingerprint(shared_models_inputs(contract_files))
+    if incremental and manifest.is_up_to_date(SHARED_MODELS_DIR, fingerprint):
+        print("Skipping shared models: data contracts unchanged since last conversion.")
+        return SharedModels(read_file(models_dir / SHARED_MODELS_FILE))
+
+    groups = data_contract_groups(contract_files)
+    if not groups:
+        return None
+    print(f"\n🔄 Converting {sum(map(len, groups))} data contract(s) into the shared models module")
+
+    part_files = []
+    for part, group in enumerate(groups, start=1):
+        label = "shared models" if len(groups) == 1 else f"shared models (part {part}/{len(groups)})"
+        models_code = call_llm(models_prompt(group, part, len(groups)), label, rate_limiter, cache)
+        if not models_code:
+            print("Shared models conversion failed; every service will convert its own Data Contracts.")
+            return None
+        # Everything belongs in the one module, whatever file names the model used
+        part_files.append({SHARED_MODELS_FILE: "\n\n".join(extract_code_blocks(models_code).values()) or models_code})
+
+    models_code = merge_generated_files(part_files)[SHARED_MODELS_FILE]
+    models_path = save_code_file(models_dir, SHARED_MODELS_FILE, models_code)
+    if not models_path:
+        return None
+    manifest.record(SHARED_MODELS_DIR, fingerprint, [models_path])
+    return SharedModels(models_code)
+
+
+# Fingerprint of the prompt template and model; changing either reconverts every service
+def prompt_template_hash():
+    return hash_text(backend.model_name + create_prompt("{service_name}", "{svc}", "{implementation}", "{interface}"))
+
+
+# Dry run: what process_services would convert, without calling the model or writing any file
+def plan_services(project_path, output_path, incremental=False, resume=False, batch_token_budget=None,
+                  share_data_contracts=True, shard=None, structured=False):
+    """
+    Discovers the services and estimates each prompt offline (no SDK or credentials needed).
+
+    Returns:
+        list: One dict per unit in conversion order, the shared models module first, with its
+              'name', source 'files', estimated 'prompt_tokens', number of prompt 'parts'
+              (more than one when it is split), 'status' ('convert', 'up to date', 'resumed'
+              or 'unreadable') and, when it would be converted, the 'batch' it is sent in.
+              With `shard`, only that shard's services (and the shared models) are listed.
+    """
+    response_format.reset(structured)
+    symbol_index = new_symbol_index()
+    linked_wcf_services = select_shard(find_wcf_files(project_path, symbol_index=symbol_index), shard,
+                                       estimate_service_tokens, lambda info: info['service_name'])
+    dependency_context.reset(symbol_index, read_file)
+    manifest = ConversionManifest(output_path, prompt_template_hash())
+    journal = ConversionJournal(output_path)
+    token_budget = prompt_token_budget(backend.model_name)
+
+    def status(unit_name, inputs):
+        if resume and journal.completed(unit_name):
+            return 'resumed'
+        if incremental and manifest.is_up_to_date(unit_name, manifest.fingerprint(inputs)):
+            return 'up to date'
+        return 'convert'
+
+    plan = []
+    shared_models = None
+    contract_files = {name: paths for name, paths in symbol_index['data_contracts'].items() if '.' not in name}
+    groups = data_contract_groups(contract_files) if share_data_contracts else []
+    if groups:
+        # Service prompts list the shared types: those of the module already converted, if any
+        models_code = read_file(Path(output_path) / SHARED_MODELS_DIR / SHARED_MODELS_FILE)
+        shared_models = (SharedModels(models_code) if models_code else
+                         SharedModels.from_contracts(collect_data_contracts(contract_files, read_file)))
+        inputs = shared_models_inputs(contract_files)
+        plan.append({
+            'name': SHARED_MODELS_DIR,
+            'files': list(inputs.values()),
+            'prompt_tokens': sum(estimate_tokens(models_prompt(group, part, len(groups)))
+                                 for part, group in enumerate(groups, start=1)),
+            'parts': len(groups),
+            'status': status(SHARED_MODELS_DIR, inputs),
+        })
+
+    pending_services = []
+    for service_info in linked_wcf_services:
+        service_name = service_info['service_name']
+        entry = {
+            'name': service_name,
+            'files': [service_info['svc_file'], service_info['implementation_file'], service_info['interface_file']],
+            'prompt_tokens': 0,
+            'parts': 1,
+            'status': status(service_name, service_inputs(service_info, output_path, shared_models, contract_files)),
+        }
+        plan.append(entry)
+        service_sources = read_service_sources(service_info)
+        if service_sources is None:
+            entry['status'] = 'unreadable'
+            continue
+        svc_content = service_sources[0]
+        # The same prompt convert_service_sources builds
+        prompt, shared_section, dependencies, implementation_code, interface_code = service_prompt(
+            service_name, *service_sources, shared_models, service_source_paths(service_info))
+        entry['prompt_tokens'] = estimate_tokens(prompt)
+        if entry['prompt_tokens'] > token_budget:
+            entry['parts'] = len(split_service(service_name, svc_content, implementation_code, interface_code,
+                                               shared_section, dependencies, token_budget))
+        if entry['status'] == 'convert':
+            pending_services.append(service_info)
+
+    # Number the prompts the way process_services would batch them
+    if batch_token_budget:
+        batches = plan_batches(pending_services, estimate_service_tokens, batch_token_budget, SMALL_SERVICE_TOKENS)
+    else:
+        batches = [[service_info] for service_info in pending_services]
+    batch_numbers = {info['service_name']: number for number, batch in enumerate(batches, start=1) for info in batch}
+    for entry in plan:
+        if entry['status'] == 'convert':
+            entry['batch'] = batch_numbers.get(entry['name'], 0)
+    return plan
+
+
 # Step 1: Process all files, convert, and save output
-def process_services(project_path, output_path):
+def process_services(project_path, output_path, concurrency=1, requests_per_minute=None, tokens_per_minute=None,
+                     cache_dir=None, bypass_cache=False, incremental=False, stream=False, batch_token_budget=None,
+                     share_data_contracts=True, report_path=None, trace_path=None, resume=False, validate=True,
+                     shard=None, structured=False, changed_files=None):
     """
     Main function to orchestrate finding WCF files, converting them via LLM,
     and saving the generated Node.js code.
+
+    Args:
+        concurrency (int): Number of services converted in parallel (1 = sequential).
+        requests_per_minute (int): Optional RPM quota shared by all workers.
+        tokens_per_minute (int): Optional TPM quota shared by all workers.
+        cache_dir (str): Directory of the persistent LLM response cache (None disables caching).
+        bypass_cache (bool): Ignore cached responses for this run, but refresh the cache.
+        incremental (bool): Skip services whose source files and prompt template are unchanged
+                            since the last run, according to the manifest in output_path.
+        stream (bool): Stream responses and write each generated file as soon as it is complete.
+        batch_token_budget (int): Pack small services into shared prompts of up to this many
+                                  estimated source tokens (None disables batching).
+        share_data_contracts (bool): Convert [DataContract] classes once into a shared models
+                                     module that every service imports, instead of per service.
+        report_path (str): Where to write the JSON run report (default: conversion_report.json
+                           in output_path).
+        trace_path (str): Optional Chrome trace file with every timed stage of the run.
+        resume (bool): Continue an interrupted run: services recorded in the journal in
+                       output_path are skipped instead of converted again.
+        validate (bool): Check the generated files locally (brackets, imports, module/service/
+                         controller set) and re-request only the files that fail.
+        shard (tuple): (i, n) to convert only the i-th of n shards of the services, balanced by
+                       estimated prompt size, into output_path (one directory per shard).
+                       Every shard converts the shared models it needs; merge_services combines
+                       the shards' directories.
+        structured (bool): Ask for JSON file lists (use a backend with a response schema, see
+                           structured_output) instead of `// filename:` blocks, which remain the
+                           fallback. The run report counts the responses that fell back.
+        changed_files (set): Watch mode: only the services whose inputs (as discovered now or
+                             as recorded by their last conversion) include one of these paths
+                             are considered; the others are left as they are.
     """
     os.makedirs(output_path, exist_ok=True)
-    
+    report.start(trace_path)
+    # Concurrent workers share one in-flight limit, which a worker waiting to retry gives up
+    retry_policy.reset(max_in_flight=concurrency if concurrency > 1 else None)
+    writer.reset()
+    response_format.reset(structured)
+
     # Get the linked WCF service components (svc, implementation, interface)
-    linked_wcf_services = find_wcf_files(project_path)
+    symbol_index = new_symbol_index()
+    with report.stage("discovery"):
+        linked_wcf_services = find_wcf_files(project_path, symbol_index=symbol_index)
+    dependency_context.reset(symbol_index, read_file)
 
     if not linked_wcf_services:
         print("No linked WCF service files found in the project. Please check your project path and file structure.")
+        report.close()
         return
+    service_names = [info['service_name'] for info in linked_wcf_services]
+    if shard:
+        linked_wcf_services = select_shard(linked_wcf_services, shard, estimate_service_tokens,
+                                           lambda info: info['service_name'])
+        print(f"Shard {shard[0]}/{shard[1]}: converting {len(linked_wcf_services)} service(s).")
+
+    manifest = ConversionManifest(output_path, prompt_template_hash())
+    # Services finished by an interrupted run are only in the journal; carry them into the manifest
+    journal = ConversionJournal(output_path)
+    for unit_name, entry in journal.entries.items():
+        manifest.restore(unit_name, entry)
+    dropped = manifest.retain([info['service_name'] for info in linked_wcf_services] + [SHARED_MODELS_DIR])
+    # A service no longer in the tree (e.g. its .svc was deleted) loses its output too; other shards' keep theirs
+    for unit_name, entry in dropped.items():
+        if unit_name not in service_names:
+            writer.remove_stale(entry.get("outputs"), [])
+    if journal.entries:
+        manifest.save()
+    journal.open(resume)
 
+    rate_limiter = None
+    if requests_per_minute or tokens_per_minute:
+        rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+
+    cache = (ResponseCache(cache_dir, backend.model_name, backend.generation_config, bypass=bypass_cache)
+             if cache_dir else None)
+
+    # Data Contracts are converted first; services then import them from the shared module
+    shared_models = None
+    contract_files = {}
+    if share_data_contracts:
+        contract_files = {name: paths for name, paths in symbol_index['data_contracts'].items() if '.' not in name}
+        if resume and journal.completed(SHARED_MODELS_DIR):
+            print("Skipping shared models: already converted by the interrupted run.")
+            shared_models = SharedModels(read_file(Path(output_path) / SHARED_MODELS_DIR / SHARED_MODELS_FILE))
+        else:
+            with report.unit(SHARED_MODELS_DIR):
+                shared_models = convert_shared_models(contract_files, output_path, manifest, incremental,
+                                                      rate_limiter, cache)
+            if shared_models and manifest.get(SHARED_MODELS_DIR):
+                journal.record(SHARED_MODELS_DIR, manifest.get(SHARED_MODELS_DIR))
+
+    changed = {normalize_path(path) for path in changed_files} if changed_files is not None else None
+    if changed is not None and share_data_contracts:
+        # A changed data contract may change the shared models module, an input of every service
+        contract_inputs = shared_models_inputs(contract_files).values()
+        if touches(changed, [*contract_inputs, *recorded_inputs(manifest.get(SHARED_MODELS_DIR))]):
+            changed.add(normalize_path(Path(output_path) / SHARED_MODELS_DIR / SHARED_MODELS_FILE))
+
+    # Hash every service's inputs; a shared interface is part of each service linked to it
+    fingerprints = {}
+    pending_services = []
+    affected = 0
     for service_info in linked_wcf_services:
         service_name = service_info['service_name']
-        svc_file_path = service_info['svc_file']
-        implementation_file_path = service_info['implementation_file']
-        interface_file_path = service_info['interface_file']
-
-        print(f"\n🔄 Converting service: {service_name}")
-        print(f"  .svc: {svc_file_path}")
-        print(f"  Impl: {implementation_file_path}")
-        print(f"  Intf: {interface_file_path}")
-
-        # Read original service files' content
-        svc_content = read_file(svc_file_path)
-        implementation_code = read_file(implementation_file_path)
-        interface_code = read_file(interface_file_path)
-
-        if not (svc_content and implementation_code and interface_code):
-            print(f"Skipping {service_name}: Could not read all required source files. Ensure files exist and are readable.")
+        inputs = service_inputs(service_info, output_path, shared_models, contract_files)
+        if changed is not None and not touches(changed, [*inputs.values(),
+                                                         *recorded_inputs(manifest.get(service_name))]):
             continue
+        affected += 1
+        fingerprints[service_name] = manifest.fingerprint(inputs)
+        if resume and journal.completed(service_name):
+            print(f"Skipping {service_name}: already converted by the interrupted run.")
+        elif incremental and manifest.is_up_to_date(service_name, fingerprints[service_name]):
+            print(f"Skipping {service_name}: sources unchanged since last conversion.")
+        else:
+            pending_services.append(service_info)
+    if changed is not None:
+        print(f"Changed files affect {affected} service(s); {len(pending_services)} to reconvert.")
+
+    # Results come back in discovery order, so output is saved deterministically
+    stream_to = output_path if stream else None
+    # Source files are only loaded now, once each, and released after their last service
+    sources = LinkedSources(pending_services)
+    if batch_token_budget:
+        batches = plan_batches(pending_services, estimate_service_tokens, batch_token_budget, SMALL_SERVICE_TOKENS)
+    else:
+        batches = [[service_info] for service_info in pending_services]
+    batch_results = dispatch(batches,
+                             lambda batch: convert_service_batch(batch, rate_limiter, cache, stream_to, sources,
+                                                                 shared_models, validate),
+                             concurrency, extra_workers=concurrency)
+    results = (result for _, batch_result in batch_results for result in batch_result)
+    failed_services = []
+    for service_info, result in results:
+        service_name = service_info['service_name']
+        with report.unit(service_name):
+            if stream:
+                # Files were already written while the response streamed in
+                saved_files = result or []
+            else:
+                # Save the LLM's output
+                saved_files = save_nodejs_output_to_files(service_name, output_path, result)
+            if saved_files:
+                # Files the previous conversion generated but this one did not are deleted
+                previous = manifest.get(service_name)
+                writer.remove_stale(previous["outputs"] if previous else [], saved_files)
+                # The journal append is the checkpoint; the manifest is rewritten once at the end
+                manifest.record(service_name, fingerprints[service_name], saved_files)
+                with report.stage("journal"):
+                    journal.record(service_name, manifest.get(service_name))
+            else:
+                failed_services.append(service_name)
+    journal.close()
+    manifest.save()
 
-        # Create and send prompt to the LLM
-        prompt = create_prompt(service_name, svc_content, implementation_code, interface_code)
-        node_code = call_llm(prompt, service_name)
+    if cache:
+        cache.prune()
+        cache.print_stats()
+    writer.print_stats()
+    response_format.print_stats()
+
+    report_path = report_path or Path(output_path) / REPORT_NAME
+    summary = report.write(report_path, services=len(linked_wcf_services),
+                           converted=len(pending_services) - len(failed_services),
+                           skipped=len(linked_wcf_services) - len(pending_services), failed=failed_services,
+                           cache=cache.stats() if cache else None, retry=retry_policy.stats(),
+                           outputs=writer.stats(), parsing=response_format.stats())
+    print(f"Run report saved: {report_path} ({summary['wall_seconds']:.1f}s, "
+          f"{summary['totals']['llm_attempts']} LLM calls, {summary['totals']['retries']} retries, "
+          f"{len(failed_services)} failed)")
+    report.print_model_stats(summary)
+
+
+# Step 6: Combine the output directories of sharded runs
+def merge_services(project_path, output_path, shard_paths, structured=False):
+    """
+    Merges the outputs of process_services runs with `shard` into output_path: each
+    service's files are copied from the shard that converted it (the shared models from the
+    first shard that has them) and one manifest is written for all of them, so the merged
+    output can be updated incrementally like the output of an unsharded run (with the same
+    `structured` setting as the shards).
+
+    Returns:
+        list: The discovered services that no shard converted.
+    """
+    writer.reset()
+    response_format.reset(structured)
+    linked_wcf_services = find_wcf_files(project_path)
+    unit_names = [SHARED_MODELS_DIR] + [info['service_name'] for info in linked_wcf_services]
+    shards = [(shard_path, load_shard_units(shard_path)) for shard_path in shard_paths]
+    manifest = ConversionManifest(output_path, prompt_template_hash())
+
+    missing_services = []
+    for unit_name in unit_names:
+        previous = manifest.get(unit_name)
+        entry = merge_unit(unit_name, shards, output_path, manifest, writer)
+        if entry:
+            writer.remove_stale(previous["outputs"] if previous else [], entry["outputs"])
+        elif unit_name != SHARED_MODELS_DIR:
+            missing_services.append(unit_name)
+    # Services no longer in the tree lose their output too
+    for entry in manifest.retain(unit_names).values():
+        writer.remove_stale(entry.get("outputs"), [])
+    manifest.save()
+
+    writer.print_stats()
+    print(f"Merged {len(linked_wcf_services) - len(missing_services)} of {len(linked_wcf_services)} service(s) "
+          f"from {len(shard_paths)} shard(s) into {output_path}")
+    if missing_services:
+        print(f"❌ Not converted by any shard: {', '.join(missing_services)}")
+    return missing_services
+
+
+# Step 7: Watch the project and reconvert the services affected by each burst of saves
+def watch_services(project_path, output_path, debounce=2.0, poll_interval=None, max_cycles=None, **options):
+    """
+    Watch mode: brings output_path up to date (an incremental run by default), then waits for
+    .svc/.cs files under project_path to change. Once saves have stopped for `debounce`
+    seconds, only the services whose inputs include a changed file are reconverted
+    (process_services with `changed_files`). Runs until interrupted with Ctrl+C.
+
+    Args:
+        poll_interval (float): Scan the tree every this many seconds instead of using
+                               filesystem notifications (watchdog; polled if not installed).
+        max_cycles (int): Stop after this many bursts of changes (None: run until interrupted).
+        options: Passed to process_services (concurrency, cache_dir, stream, ...); every run
+                 after the first is incremental.
+    """
+    options.setdefault("incremental", True)
+    # Watching starts first, so files saved during the initial run make up the first burst
+    watcher = create_watcher(project_path, WATCHED_EXTENSIONS, SKIPPED_DIRS, poll_interval)
+    process_services(project_path, output_path, **options)
+    # Every burst is converted incrementally; a resumed initial run has already finished
+    options.update(incremental=True, resume=False)
+    print(f"\n👀 Watching {project_path} for changes (Ctrl+C to stop)...")
+    watch(watcher, lambda changed: process_services(project_path, output_path, changed_files=changed, **options),
+          debounce, max_cycles)
 
-        # Save the LLM's output
-        save_nodejs_output_to_files(service_name, output_path, node_code)
 
-    
 # Entry point
+# Usage: python WCF_to_NodeJS.py <project_dir> <output_dir> [--dry-run] [--resume] ...
+# (same as `python convert.py wcf ...`; see convert.py for all options)
 if __name__ == "__main__":
     print("🛠️ WCF ➡️ NodeJS Converter ")
-
-    project_dir = r"C:\Workspaces\Books-ASP.NET-WebForms-WCF-master"
-    output_dir = r"C:\Workspaces\Code\ASP.NET_WCF\Books-ASP.NET-WebForms-WCF-master"
-
-    process_services(project_dir, output_dir)
+    from convert import main
+    sys.exit(main(["wcf", *sys.argv[1:]]))
@@ -0,0 +1,457 @@
+"""
+Offline benchmark suite for the WCF -> NestJS and WebForms -> React converters.
+
+Builds synthetic legacy trees of increasing size and times each pipeline stage
+(start-up, discovery, prompt building, extraction, file writing, end-to-end) against
+llm_backends.StubBackend, so no API access is needed. The checked-in BooksService
+and BooksService_ExpressJs outputs and the BookServiceUI.zip pages are used as golden
+fixtures: converting a service or form whose model response replays them must
+reproduce every file (up to leading/trailing whitespace).
+
+Usage:
+    python benchmark.py [--sizes 10 100 1000 10000 20000] [--latency 0.0] [--concurrency 1] [--stream]
+                        [--batch-token-budget N] [--json results.json]
+"""
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+from llm_backends import GeminiBackend, StubBackend
+from llm_cache import ResponseCache
+from llm_routing import RoutingBackend
+from output_validation import check_brackets
+from structured_output import STRUCTURED_GENERATION_CONFIG
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+REPO_DIR = Path(__file__).resolve().parent
+GOLDEN_FIXTURES = ["BooksService", "BooksService_ExpressJs"]
+# Archive of the converted WebForms pages, and the directory of the pages' .jsx/.css inside it
+# (its routes.js was edited by hand, so it is not compared)
+GOLDEN_FORMS_ARCHIVE = "BookServiceUI.zip"
+GOLDEN_FORMS_DIR = "BookServiceUI/src/Books-ASP.NET-WebForms-WCF-master/"
+
+# (code, balanced) pairs for check_brackets: a '/' after an identifier ending in a keyword
+# (`Login`, `Join`), a property or a JSX expression's '}' is a division or a JSX tag end, not a regex
+BRACKET_CASES = [
+    ("const routes = [{ path: '/login', element: <Login /> }];", True),
+    ("<Route path=\"/join\" element={<Join />} />", True),
+    ("const half = total.in / 2 + (count.do / 4);", True),
+    ("if (x) { return /[{(]/.test(s); }", True),
+    ("const kind = typeof /}/;", True),
+    ('<Route path="/" element={<Login />} /> {/* Default route to Login */}', True),
+    ("<ul><Item v={v} /> {items.map(i => <li key={i}>{i}</li>)}</ul>", True),
+    ("const routes = [{ element: <Login /> };", False),
+]
+
+
+def load_module(filename, name):
+    """Imports a converter script by path (ASP.NET_to_react.py is not a valid module name)."""
+    spec = importlib.util.spec_from_file_location(name, REPO_DIR / filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+wcf = load_module("WCF_to_NodeJS.py", "WCF_to_NodeJS")
+webforms = load_module("ASP.NET_to_react.py", "ASP_NET_to_react")
+
+
+def make_synthetic_tree(root, n_files):
+    """
+    Writes a legacy solution of roughly n_files files: one WCF service (svc, interface,
+    implementation) and one WebForms page (code-behind, designer) per 50 files, a file of
+    data contracts shared by the services, the rest being unrelated .cs files.
+    Returns (service count, form count).
+    """
+    n_units = max(1, n_files // 50)
+    n_filler = max(0, n_files - 5 * n_units - 1)
+
+    models_dir = Path(root) / "Services" / "Models"
+    models_dir.mkdir(parents=True, exist_ok=True)
+    (models_dir / "Book.cs").write_text(
+        "using System.Runtime.Serialization;\n\nnamespace App.Services\n{\n"
+        "    [DataContract]\n    public class Book\n    {\n"
+        "        [DataMember]\n        public string ISBN { get; set; }\n\n"
+        "        [DataMember]\n        public Author Author { get; set; }\n    }\n\n"
+        "    [DataContract]\n    public class Author\n    {\n"
+        "        [DataMember]\n        public string Name { get; set; }\n    }\n}\n")
+
+    for i in range(n_units):
+        service_dir = Path(root) / "Services" / f"Svc{i}"
+        service_dir.mkdir(parents=True, exist_ok=True)
+        (service_dir / f"Service{i}.svc").write_text(
+            f'<%@ ServiceHost Language="C#" Debug="true" Service="App.Services.Service{i}" CodeBehind="Service{i}.svc.cs" %>')
+        (service_dir / f"IService{i}.cs").write_text(
+            "using System.ServiceModel;\n\nnamespace App.Services\n{\n    [ServiceContract]\n"
+            f"    public interface IService{i}\n    {{\n        [OperationContract]\n        Book GetBook(string isbn);\n\n"
+            "        [OperationContract]\n        void AddBook(Book book);\n    }\n}\n")
+        (service_dir / f"Service{i}.svc.cs").write_text(
+            "using System;\n\nnamespace App.Services\n{\n"
+            f"    public class Service{i} : IService{i}\n    {{\n"
+            "        public Book GetBook(string isbn) { return new Book { ISBN = isbn }; }\n\n"
+            "        public void AddBook(Book book) { Db.Execute(\"INSERT INTO Book VALUES (@isbn)\", book.ISBN); }\n"
+            "    }\n}\n")
+
+        page_dir = Path(root) / "Web" / f"Page{i}"
+        page_dir.mkdir(parents=True, exist_ok=True)
+        (page_dir / f"Page{i}.aspx.cs").write_text(
+            "using System;\n\nnamespace App.Web\n{\n"
+            f"    public partial class Page{i} : System.Web.UI.Page\n    {{\n"
+            "        protected void Page_Load(object sender, EventArgs e) { }\n\n"
+            "        protected void btnSave_Click(object sender, EventArgs e) { lblStatus.Text = txtTitle.Text; }\n"
+            "    }\n}\n")
+        (page_dir / f"Page{i}.aspx.designer.cs").write_text(
+            "namespace App.Web\n{\n"
+            f"    public partial class Page{i}\n    {{\n"
+            "        protected global::System.Web.UI.WebControls.TextBox txtTitle;\n"
+            "        protected global::System.Web.UI.WebControls.Button btnSave;\n"
+            "        protected global::System.Web.UI.WebControls.Label lblStatus;\n"
+            "    }\n}\n")
+
+    for j in range(n_filler):
+        lib_dir = Path(root) / "Lib" / f"Part{j % 100}"
+        lib_dir.mkdir(parents=True, exist_ok=True)
+        (lib_dir / f"Helper{j}.cs").write_text(
+            "using System;\nusing System.Collections.Generic;\n\nnamespace App.Lib\n{\n"
+            "    // Helper used by several pages; the class keyword in this comment must not confuse discovery\n"
+            f"    public sealed class Helper{j} : IDisposable\n    {{\n"
+            "        public List<int> Values { get; } = new List<int>();\n\n"
+            "        public void Dispose() { Values.Clear(); }\n    }\n}\n")
+
+    return n_units, n_units
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silences the converters' progress output while a stage is timed."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def timed(results, stage, func, *args, **kwargs):
+    start = time.perf_counter()
+    with quiet():
+        value = func(*args, **kwargs)
+    results[stage] = time.perf_counter() - start
+    return value
+
+
+def build_service_prompts(services):
+    return [
+        wcf.create_prompt(
+            info["service_name"],
+            wcf.read_file(info["svc_file"]),
+            wcf.read_file(info["implementation_file"]),
+            wcf.read_file(info["interface_file"]),
+        )
+        for info in services
+    ]
+
+
+def build_form_prompts(forms):
+    return [
+        webforms.create_prompt(name, webforms.read_file(paths["code"]), webforms.read_file(paths["designer"]))
+        for name, paths in forms.items()
+    ]
+
+
+def measure_cold_start(results, project_dir, output_dir):
+    """
+    Times fresh interpreter processes: a bare start, importing the CLI and a converter, and
+    a full `convert.py wcf --dry-run`. Also records whether the Gemini SDK got imported,
+    which must only happen on the first real model call.
+    """
+    convert_script = str(REPO_DIR / "convert.py")
+    commands = {
+        "cold_start_interpreter": ["-c", "pass"],
+        "cold_start_import": ["-c", "import sys, convert; convert.load_converter('wcf'); "
+                                    "print('google.generativeai' in sys.modules)"],
+        "cold_start_dry_run": [convert_script, "wcf", project_dir, output_dir, "--dry-run"],
+    }
+    for stage, command in commands.items():
+        start = time.perf_counter()
+        completed = subprocess.run([sys.executable, *command], cwd=REPO_DIR, capture_output=True, text=True)
+        results[stage] = time.perf_counter() - start
+        if stage == "cold_start_import":
+            results["sdk_imported_at_startup"] = completed.stdout.strip() == "True"
+
+
+def benchmark_size(n_files, latency, concurrency, stream=False, batch_token_budget=None):
+    """Runs every stage on a fresh synthetic tree of n_files files and returns stage timings."""
+    work_dir = tempfile.mkdtemp(prefix="convbench-")
+    try:
+        project_dir = os.path.join(work_dir, "project")
+        results = {"files": n_files}
+        timed(results, "generate_tree", make_synthetic_tree, project_dir, n_files)
+
+        services = timed(results, "discover_services", wcf.find_wcf_files, project_dir)
+        forms = timed(results, "discover_forms", webforms.find_winforms_forms, project_dir)
+        results["services"] = len(services)
+        results["forms"] = len(forms)
+        measure_cold_start(results, project_dir, os.path.join(work_dir, "nest"))
+
+        service_prompts = timed(results, "build_service_prompts", build_service_prompts, services)
+        form_prompts = timed(results, "build_form_prompts", build_form_prompts, forms)
+
+        stub = StubBackend()
+        service_responses = [stub.generate(p) for p in service_prompts]
+        form_responses = [stub.generate(p) for p in form_prompts]
+        timed(results, "extract_services", lambda: [wcf.extract_code_blocks(r) for r in service_responses])
+        timed(results, "extract_forms", lambda: [webforms.extract_parts(r) for r in form_responses])
+
+        write_dir = os.path.join(work_dir, "written")
+        timed(results, "write_services", lambda: [
+            wcf.save_nodejs_output_to_files(info["service_name"], write_dir, response)
+            for info, response in zip(services, service_responses)
+        ])
+
+        # End to end, through call_llm, against a stub with the requested latency
+        stub = wcf.backend = webforms.backend = StubBackend(latency=latency, seed=0)
+        timed(results, "end_to_end_services", wcf.process_services,
+              project_dir, os.path.join(work_dir, "nest"), concurrency=concurrency, stream=stream,
+              batch_token_budget=batch_token_budget)
+        timed(results, "end_to_end_forms", webforms.process_forms,
+              project_dir, os.path.join(work_dir, "react"), concurrency=concurrency, stream=stream,
+              batch_token_budget=batch_token_budget)
+        results["model_calls"] = stub.calls
+        if resource:
+            # Peak resident set size of the whole process so far (KiB on Linux)
+            results["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        return results
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def write_legacy_service(root, name):
+    """Writes a minimal WCF service `name` (.svc, interface, implementation) under root."""
+    service_dir = Path(root) / name
+    service_dir.mkdir(parents=True, exist_ok=True)
+    (service_dir / f"{name}.svc").write_text(
+        f'<%@ ServiceHost Language="C#" Service="App.Services.{name}" CodeBehind="{name}.svc.cs" %>')
+    (service_dir / f"I{name}.cs").write_text(
+        "using System.ServiceModel;\n\nnamespace App.Services\n{\n    [ServiceContract]\n"
+        f"    public interface I{name}\n    {{\n        [OperationContract]\n        string GetBook(string isbn);\n    }}\n}}\n")
+    (service_dir / f"{name}.svc.cs").write_text(
+        f"namespace App.Services\n{{\n    public class {name} : I{name}\n    {{\n"
+        "        public string GetBook(string isbn) { return isbn; }\n    }\n}\n")
+
+
+def write_legacy_form(root, name):
+    """Writes a minimal WebForms page `name` (code-behind and designer) under root."""
+    (Path(root) / f"{name}.aspx.cs").write_text(
+        f"namespace App.Web\n{{\n    public partial class {name} : System.Web.UI.Page\n    {{\n"
+        "        protected void Page_Load(object sender, EventArgs e) { }\n    }\n}\n")
+    (Path(root) / f"{name}.aspx.designer.cs").write_text(
+        f"namespace App.Web\n{{\n    public partial class {name}\n    {{\n"
+        "        protected global::System.Web.UI.WebControls.Label lblStatus;\n    }\n}\n")
+
+
+def compare_outputs(label, expected, out_dir):
+    """Compares the files under out_dir with `expected` (relative path -> content). Returns the mismatches."""
+    failures = []
+    for name, content in expected.items():
+        written = Path(out_dir) / name
+        if not written.exists():
+            failures.append(f"{label}/{name}: not written")
+        elif written.read_text(encoding="utf-8").strip() != content.strip():
+            failures.append(f"{label}/{name}: content differs")
+    return failures
+
+
+def check_golden_fixtures():
+    """
+    Converts a minimal legacy service per checked-in output tree, and a minimal page per
+    golden form, through process_services and process_forms against a stub replaying the
+    golden files as the model's response, and checks that the written files match them.
+    Returns a list of mismatches.
+    """
+    failures = []
+    backends = wcf.backend, webforms.backend
+    work_dir = tempfile.mkdtemp(prefix="convgolden-")
+    try:
+        for fixture in GOLDEN_FIXTURES:
+            fixture_dir = REPO_DIR / fixture
+            expected = {path.relative_to(fixture_dir).as_posix(): path.read_text(encoding="utf-8")
+                        for path in sorted(fixture_dir.glob("src/**/*.ts"))}
+            response = "\n".join(f"// filename: {name}\n{content}" for name, content in expected.items())
+
+            project_dir = Path(work_dir, fixture, "project")
+            out_dir = Path(work_dir, fixture, "nest")
+            write_legacy_service(project_dir, fixture)
+            wcf.backend = StubBackend(synthesize=lambda prompt: response)
+            with quiet():
+                wcf.process_services(project_dir, out_dir)
+            failures += compare_outputs(fixture, expected, out_dir / fixture)
+            print(f"Golden fixture {fixture}: {len(expected)} files checked")
+
+        with zipfile.ZipFile(REPO_DIR / GOLDEN_FORMS_ARCHIVE) as archive:
+            # Read as text, like the checked-in fixtures, so line endings are normalized
+            expected = {name[len(GOLDEN_FORMS_DIR):]: io.TextIOWrapper(archive.open(name), encoding="utf-8").read()
+                        for name in archive.namelist()
+                        if name.startswith(GOLDEN_FORMS_DIR) and name.endswith((".jsx", ".css"))}
+        forms = sorted({Path(name).stem for name in expected})
+        project_dir = Path(work_dir, "forms", "project")
+        out_dir = Path(work_dir, "forms", "react")
+        project_dir.mkdir(parents=True)
+        for form_name in forms:
+            write_legacy_form(project_dir, form_name)
+
+        def replay_form(prompt):
+            form_name = re.search(r"\((\w+)\.aspx\.cs\)", prompt).group(1)
+            return (f"[BEGIN_JSX]\n{expected[form_name + '.jsx']}\n[END_JSX]\n"
+                    f"[BEGIN_CSS]\n{expected[form_name + '.css']}\n[END_CSS]\n"
+                    f"[BEGIN_ROUTES]\nimport {form_name} from './{form_name}';\n"
+                    f"<Route path=\"/{form_name.lower()}\" element={{<{form_name} />}} />\n[END_ROUTES]\n")
+
+        webforms.backend = StubBackend(synthesize=replay_form)
+        with quiet():
+            webforms.process_forms(project_dir, out_dir)
+        failures += compare_outputs(GOLDEN_FORMS_ARCHIVE, expected, out_dir)
+        print(f"Golden fixture {GOLDEN_FORMS_ARCHIVE}: {len(expected)} files of {len(forms)} forms checked")
+    finally:
+        wcf.backend, webforms.backend = backends
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return failures
+
+
+def synthesize_chunk_imports(prompt):
+    """
+    Stub response for a service converted in parts: each part imports the shared decorators
+    plus its own, as a model would, so merging has to combine the imports per module.
+    """
+    part = re.search(r"\*\*Partial Conversion \((\d+) of \d+\):\*\*", prompt)
+    name = re.search(r"\*\*WCF Service Name:\*\* *(\w+)", prompt).group(1)
+    folder = name.lower()
+    suffix = part.group(1) if part else ""
+    return "\n".join(
+        f"// filename: src/{folder}/{folder}.{kind}.ts\n"
+        f"import {{ Controller, Injectable, Get{suffix} }} from '@nestjs/common';\n"
+        f"import {{ Book }} from '../models/book';\n\n"
+        f"export class {name}{kind.capitalize()} {{\n  op{suffix}() {{}}\n}}\n"
+        for kind in ("module", "service", "controller")
+    )
+
+
+def check_chunk_imports():
+    """
+    Converts a service too large for one prompt (the budget is lowered so it is split by
+    operation) and checks that every module is imported by exactly one statement in each
+    merged file. Returns a list of the files importing a module twice.
+    """
+    work_dir = tempfile.mkdtemp(prefix="convchunks-")
+    budget, backend = wcf.prompt_token_budget, wcf.backend
+    try:
+        project_dir = os.path.join(work_dir, "project")
+        make_synthetic_tree(project_dir, 5)
+        with quiet():
+            service = wcf.find_wcf_files(project_dir)[0]
+        full_prompt = wcf.create_prompt(service["service_name"], wcf.read_file(service["svc_file"]),
+                                        wcf.read_file(service["implementation_file"]),
+                                        wcf.read_file(service["interface_file"]))
+        wcf.prompt_token_budget = lambda model_name: wcf.estimate_tokens(full_prompt) - 1
+        wcf.backend = stub = StubBackend(synthesize=synthesize_chunk_imports)
+        with quiet():
+            wcf.process_services(project_dir, os.path.join(work_dir, "nest"))
+
+        failures = []
+        written = sorted(Path(work_dir, "nest").glob("**/*.ts"))
+        for path in written:
+            sources = re.findall(r"^import\b[^;]*?from\s*['\"]([^'\"]+)['\"]", path.read_text(encoding="utf-8"),
+                                 re.MULTILINE)
+            failures += [f"{path.name}: {source} imported {sources.count(source)} times"
+                         for source in sorted(set(sources)) if sources.count(source) != 1]
+        if stub.calls < 2 or not written:
+            failures.append(f"chunked conversion: {stub.calls} model calls, {len(written)} files written")
+    finally:
+        wcf.prompt_token_budget, wcf.backend = budget, backend
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print(f"Chunk imports: {len(written)} merged files checked")
+    return failures
+
+
+def check_bracket_cases():
+    """Runs check_brackets over BRACKET_CASES. Returns a list of the cases it gets wrong."""
+    failures = []
+    for code, balanced in BRACKET_CASES:
+        if (not check_brackets(code)) != balanced:
+            failures.append(f"brackets {'flagged' if balanced else 'missed'}: {code}")
+    print(f"Bracket cases: {len(BRACKET_CASES)} checked")
+    return failures
+
+
+def check_cache_keys():
+    """
+    Checks that the cache keys of the backends the converters build differ whenever the
+    model or its generation settings do. Returns a list of the colliding backends.
+    """
+    backends = {
+        "plain": RoutingBackend(GeminiBackend("gemini-2.5-flash")),
+        "structured": RoutingBackend(GeminiBackend("gemini-2.5-flash", generation_config=STRUCTURED_GENERATION_CONFIG)),
+        "structured tier": RoutingBackend(
+            GeminiBackend("gemini-2.5-flash"),
+            [(2000, GeminiBackend("gemini-2.5-flash-lite", generation_config=STRUCTURED_GENERATION_CONFIG))]),
+        "plain tier": RoutingBackend(GeminiBackend("gemini-2.5-flash"), [(2000, GeminiBackend("gemini-2.5-flash-lite"))]),
+    }
+    cache_dir = tempfile.mkdtemp(prefix="convcache-")
+    try:
+        keys = {}
+        for label, backend in backends.items():
+            key = ResponseCache(cache_dir, backend.model_name, backend.generation_config).key("prompt")
+            keys.setdefault(key, []).append(label)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    print(f"Cache keys: {len(backends)} backends checked")
+    return [f"cache key shared by: {', '.join(labels)}" for labels in keys.values() if len(labels) > 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the converters offline against a stub backend.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000, 20000],
+                        help="Synthetic tree sizes, in files.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated seconds per model call.")
+    parser.add_argument("--concurrency", type=int, default=1, help="Concurrent model calls in end-to-end runs.")
+    parser.add_argument("--stream", action="store_true", help="Stream responses in end-to-end runs.")
+    parser.add_argument("--batch-token-budget", type=int,
+                        help="Pack small units into batched prompts of up to this many tokens in end-to-end runs.")
+    parser.add_argument("--json", help="Write the results to this JSON file.")
+    args = parser.parse_args()
+
+    failures = check_golden_fixtures() + check_chunk_imports() + check_bracket_cases() + check_cache_keys()
+    for failure in failures:
+        print(f"  GOLDEN MISMATCH: {failure}")
+
+    all_results = []
+    for n_files in args.sizes:
+        results = benchmark_size(n_files, args.latency, args.concurrency, args.stream, args.batch_token_budget)
+        all_results.append(results)
+        stages = ", ".join(f"{stage}={seconds:.3f}s" for stage, seconds in results.items()
+                           if isinstance(seconds, float) and stage != "peak_rss_mb")
+        peak_rss = f", peak RSS {results['peak_rss_mb']:.0f} MB" if "peak_rss_mb" in results else ""
+        print(f"{n_files:>6} files ({results['services']} services, {results['forms']} forms, "
+              f"{results['model_calls']} model calls): {stages}{peak_rss}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"golden_failures": failures, "runs": all_results}, f, indent=2)
+        print(f"Results written to {args.json}")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+import json
+import os
+import threading
+from pathlib import Path
+
+
+# Written next to the generated output
+JOURNAL_NAME = ".conversion_journal.jsonl"
+
+
+class ConversionJournal:
+    """
+    Append-only checkpoint log of the units (services or forms) completed by a run.
+
+    Each completed unit is appended as one JSON line and flushed to disk right away,
+    so an interrupted run (crash, network drop, Ctrl-C) loses at most the unit in
+    flight. A line cut short by the interruption is ignored when the journal is read.
+    A resumed run skips the units in the journal and reuses what they recorded (e.g.
+    route snippets); a fresh run starts a new journal.
+    """
+
+    def __init__(self, output_path):
+        self.path = Path(output_path) / JOURNAL_NAME
+        self.entries = {}
+        self._file = None
+        self._lock = threading.Lock()
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        self.entries[record["unit"]] = record["entry"]
+                    except (ValueError, KeyError, TypeError):
+                        continue
+
+    def completed(self, unit_name):
+        """Returns the journal entry of a finished unit whose output files all still exist, else None."""
+        entry = self.entries.get(unit_name)
+        if entry and all(os.path.exists(path) for path in entry.get("outputs", [])):
+            return entry
+        return None
+
+    def open(self, resume=False):
+        """Starts appending. Without `resume`, the previous run's entries are discarded."""
+        os.makedirs(self.path.parent, exist_ok=True)
+        if not resume:
+            self.entries = {}
+        self._file = open(self.path, "a" if resume else "w", encoding="utf-8")
+        if resume and self._file.tell() > 0:
+            # Start on a fresh line in case the interrupted run's last write was cut short
+            self._file.write("\n")
+
+    def record(self, unit_name, entry):
+        """Appends a completed unit (its manifest entry) and forces it to disk."""
+        line = json.dumps({"unit": unit_name, "entry": entry}, sort_keys=True)
+        with self._lock:
+            self.entries[unit_name] = entry
+            self._file.write(line + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
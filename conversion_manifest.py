@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+
+# Written next to the generated output
+MANIFEST_NAME = ".conversion_manifest.json"
+
+
+def hash_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def hash_file(path):
+    """Returns the SHA-256 of a file's bytes, or None if it cannot be read."""
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+class ConversionManifest:
+    """
+    Records, per converted unit (service or form), the content hashes of its source
+    files, the prompt template it was converted with and the files it produced.
+    A unit is up to date when all of these still match, so reruns can skip it.
+
+    Because each unit records every file it was built from, a shared file (e.g. an
+    interface linked to several services) invalidates every unit that depends on it.
+    """
+
+    def __init__(self, output_path, template_hash):
+        """
+        Args:
+            output_path (str): Output directory; the manifest is stored inside it.
+            template_hash (str): Fingerprint of the prompt template and model.
+        """
+        self.path = Path(output_path) / MANIFEST_NAME
+        self.template_hash = template_hash
+        self.units = {}
+        if self.path.exists():
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.units = json.load(f).get("units", {})
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable manifest {self.path}: {e}")
+
+    def fingerprint(self, inputs):
+        """Hashes a unit's input files. `inputs` maps a role (e.g. 'interface') to a path."""
+        return {role: {"path": str(path), "sha256": hash_file(path)} for role, path in inputs.items()}
+
+    def is_up_to_date(self, unit_name, fingerprint):
+        """True if the unit was converted from exactly these inputs and template, and its output still exists."""
+        entry = self.units.get(unit_name)
+        if not entry or entry.get("template") != self.template_hash:
+            return False
+        if entry.get("inputs") != fingerprint:
+            return False
+        if any(hashes["sha256"] is None for hashes in fingerprint.values()):
+            return False
+        return all(os.path.exists(path) for path in entry.get("outputs", []))
+
+    def get(self, unit_name):
+        return self.units.get(unit_name)
+
+    def record(self, unit_name, fingerprint, outputs, **extra):
+        """Marks a unit as converted from `fingerprint`, producing `outputs` (file paths)."""
+        self.units[unit_name] = {
+            "template": self.template_hash,
+            "inputs": fingerprint,
+            "outputs": [str(path) for path in outputs],
+            **extra,
+        }
+
+    def restore(self, unit_name, entry):
+        """Re-adds an entry saved elsewhere (e.g. in the journal) if it was made with the current template."""
+        if entry.get("template") == self.template_hash:
+            self.units[unit_name] = entry
+
+    def retain(self, unit_names):
+        """
+        Drops entries for units that no longer exist in the source tree. Returns the dropped
+        entries (unit name -> entry), whose outputs the caller may delete.
+        """
+        unit_names = set(unit_names)
+        dropped = {name: entry for name, entry in self.units.items() if name not in unit_names}
+        self.units = {name: entry for name, entry in self.units.items() if name in unit_names}
+        return dropped
+
+    def save(self):
+        """Writes the manifest atomically (temp file + rename)."""
+        os.makedirs(self.path.parent, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"units": self.units}, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,211 @@
+"""
+Command line entry point for both converters.
+
+    python convert.py wcf      <project_dir> <output_dir> [options]   # WCF services -> NestJS
+    python convert.py webforms <project_dir> <output_dir> [options]   # WebForms pages -> React
+
+Only the selected converter is imported, and the Gemini SDK is only imported and
+configured on the first real model call. --dry-run therefore needs neither the SDK
+nor credentials: it lists what would be converted, with estimated prompt tokens and
+model calls, without writing anything.
+
+Small prompts can go to a cheaper, faster model and slow requests can be hedged:
+
+    python convert.py wcf <project_dir> <output_dir> --model gemini-2.5-pro \
+        --tier gemini-2.5-flash-lite:2000 --tier gemini-2.5-flash:12000 --hedge-after 30
+
+With --structured, the models answer with JSON file lists constrained by a response
+schema instead of the converters' `// filename:` / `[BEGIN_JSX]` formats, which remain
+the fallback; the run report counts the responses that fell back (under 'parsing').
+
+Large solutions can be split over several machines or processes: each runs one shard
+with --shard i/n into its own output directory, then --merge combines them:
+
+    python convert.py webforms <project_dir> out/1 --shard 1/2
+    python convert.py webforms <project_dir> out/2 --shard 2/2
+    python convert.py webforms <project_dir> out --merge out/1 out/2
+
+During a migration sprint, --watch keeps the output up to date: after an incremental run
+it waits for sources to change and, once saves stop for --debounce seconds, reconverts
+only the affected units (and their routes.js entries). It uses filesystem notifications
+when the watchdog package is installed and polls the tree otherwise (or with --poll-interval).
+"""
+import argparse
+import contextlib
+import functools
+import importlib.util
+import io
+import sys
+from collections import Counter
+from pathlib import Path
+
+from llm_backends import GeminiBackend
+from llm_dispatch import CHARS_PER_TOKEN
+from llm_routing import RoutingBackend, parse_tier
+from sharding import parse_shard
+from structured_output import STRUCTURED_GENERATION_CONFIG
+
+REPO_DIR = Path(__file__).resolve().parent
+
+# Converter name -> (script, module name); ASP.NET_to_react.py is not a valid module name
+CONVERTERS = {
+    "wcf": ("WCF_to_NodeJS.py", "WCF_to_NodeJS"),
+    "webforms": ("ASP.NET_to_react.py", "ASP_NET_to_react"),
+}
+
+
+def load_converter(name):
+    """Imports one converter script by path."""
+    filename, module_name = CONVERTERS[name]
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    spec = importlib.util.spec_from_file_location(module_name, REPO_DIR / filename)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def shard_spec(text):
+    try:
+        return parse_shard(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def tier_spec(text):
+    try:
+        return parse_tier(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Convert legacy .NET code with an LLM.")
+    converters = parser.add_subparsers(dest="converter", required=True)
+    for name, help_text in (("wcf", "WCF services to NestJS"), ("webforms", "ASP.NET WebForms pages to React")):
+        sub = converters.add_parser(name, help=help_text, description=f"Convert {help_text}.")
+        sub.add_argument("project_dir", help="Root of the legacy solution.")
+        sub.add_argument("output_dir", help="Directory the converted code is written to.")
+        sub.add_argument("--dry-run", action="store_true",
+                         help="Print the conversion plan with estimated tokens; call no model, write nothing.")
+        sub.add_argument("--verbose", action="store_true", help="Show discovery output in dry runs.")
+        sub.add_argument("--model", help="Gemini model to use (default: the converter's MODEL_NAME); "
+                                          "with --tier, the model for prompts larger than every tier.")
+        sub.add_argument("--tier", type=tier_spec, action="append", default=[], metavar="MODEL:MAX_TOKENS",
+                         help="Send prompts of up to MAX_TOKENS estimated tokens to MODEL (repeatable).")
+        sub.add_argument("--hedge-after", type=float, metavar="SECONDS",
+                         help="Send a duplicate request when a response takes longer; the first answer wins.")
+        sub.add_argument("--structured", action="store_true",
+                         help="Ask for JSON file lists (response schema) instead of the tag format.")
+        sub.add_argument("--concurrency", type=int, default=1, help="Units converted in parallel.")
+        sub.add_argument("--rpm", type=int, help="Requests-per-minute quota.")
+        sub.add_argument("--tpm", type=int, help="Tokens-per-minute quota.")
+        sub.add_argument("--cache-dir", default=".llm_cache", help="LLM response cache directory.")
+        sub.add_argument("--no-cache", action="store_true", help="Do not use the response cache.")
+        sub.add_argument("--refresh-cache", action="store_true",
+                         help="Ignore cached responses, but store the fresh ones.")
+        sub.add_argument("--full", action="store_true",
+                         help="Reconvert every unit, even those unchanged since the last run.")
+        sub.add_argument("--resume", action="store_true",
+                         help="Continue an interrupted run, skipping the units recorded in its journal.")
+        sub.add_argument("--max-attempts", type=int,
+                         help="Attempts per model call before a unit is given up (default: 4).")
+        sub.add_argument("--no-validate", action="store_true",
+                         help="Skip the local checks of the generated files and the repair prompts.")
+        sub.add_argument("--stream", action="store_true", help="Write files while responses stream in.")
+        sub.add_argument("--batch-token-budget", type=int,
+                         help="Pack small units into shared prompts of up to this many tokens.")
+        sub.add_argument("--report", help="Run report path (default: conversion_report.json in output_dir).")
+        sub.add_argument("--trace", help="Also write a Chrome trace of every stage to this file.")
+        sub.add_argument("--shard", type=shard_spec, metavar="I/N",
+                         help="Convert only shard I of N (balanced by estimated prompt size) into output_dir.")
+        sub.add_argument("--merge", nargs="+", metavar="SHARD_DIR",
+                         help="Combine the output directories of sharded runs into output_dir; call no model.")
+        sub.add_argument("--watch", action="store_true",
+                         help="Keep running and reconvert the units affected by every change to the sources.")
+        sub.add_argument("--debounce", type=float, default=2.0, metavar="SECONDS",
+                         help="With --watch, wait until no file has changed for this long (default: 2).")
+        sub.add_argument("--poll-interval", type=float, metavar="SECONDS",
+                         help="With --watch, scan the tree this often instead of using filesystem notifications.")
+        if name == "wcf":
+            sub.add_argument("--no-shared-models", action="store_true",
+                             help="Let every service convert its own Data Contracts.")
+    return parser
+
+
+def estimated_calls(entries):
+    """Model calls needed for the planned units: one per batch, plus one per extra part."""
+    batches = {entry["batch"] for entry in entries if entry.get("batch")}
+    return len(batches) + sum(entry["parts"] - (1 if entry.get("batch") else 0) for entry in entries)
+
+
+def print_plan(plan, model_name, route=None):
+    """`route` (RoutingBackend.route) adds the model each unit's prompt would be sent to."""
+    width = max([len(entry["name"]) for entry in plan] + [4])
+    batch_sizes = Counter(entry.get("batch") for entry in plan)
+    for entry in plan:
+        notes = []
+        if route and entry["status"] == "convert":
+            notes.append(route(entry["prompt_tokens"] // entry["parts"]).model_name)
+        if entry["parts"] > 1:
+            notes.append(f"{entry['parts']} parts")
+        if entry.get("batch") and batch_sizes[entry["batch"]] > 1:
+            notes.append(f"batched in prompt {entry['batch']}")
+        print(f"  {entry['name']:<{width}}  {entry['status']:<10}  ~{entry['prompt_tokens']:>8,} tokens  "
+              f"{', '.join(notes)}".rstrip())
+
+    pending = [entry for entry in plan if entry["status"] == "convert"]
+    print(f"\n{len(plan)} unit(s), {len(pending)} to convert with {model_name}: "
+          f"~{sum(entry['prompt_tokens'] for entry in pending):,} prompt tokens in ~{estimated_calls(pending)} "
+          f"model call(s) (estimated at {CHARS_PER_TOKEN} characters per token)")
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    converter = load_converter(args.converter)
+    # Every request is recorded per model in the run report, tiered or not
+    default = converter.backend.default if isinstance(converter.backend, RoutingBackend) else converter.backend
+    generation_config = STRUCTURED_GENERATION_CONFIG if args.structured else None
+    if args.model or (generation_config and isinstance(default, GeminiBackend)):
+        default = GeminiBackend(args.model or default.model_name, generation_config=generation_config)
+    tiers = [(max_tokens, GeminiBackend(model_name, generation_config=generation_config))
+             for model_name, max_tokens in args.tier]
+    converter.backend = RoutingBackend(default, tiers, hedge_after=args.hedge_after, report=converter.report)
+    if args.max_attempts:
+        converter.retry_policy.max_attempts = args.max_attempts
+
+    options = {"incremental": not args.full, "resume": args.resume, "batch_token_budget": args.batch_token_budget,
+               "structured": args.structured}
+    if args.converter == "wcf":
+        options["share_data_contracts"] = not args.no_shared_models
+        plan_units, process_units = converter.plan_services, converter.process_services
+        merge_units, watch_units = converter.merge_services, converter.watch_services
+    else:
+        plan_units, process_units = converter.plan_forms, converter.process_forms
+        merge_units, watch_units = converter.merge_forms, converter.watch_forms
+
+    if args.merge:
+        missing = merge_units(args.project_dir, args.output_dir, args.merge, structured=args.structured)
+        return 1 if missing else 0
+
+    options["shard"] = args.shard
+    if args.dry_run:
+        discovery_output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        with discovery_output:
+            plan = plan_units(args.project_dir, args.output_dir, **options)
+        print_plan(plan, converter.backend.model_name, converter.backend.route if args.tier else None)
+        return 0
+
+    if args.watch:
+        process_units = functools.partial(watch_units, debounce=args.debounce, poll_interval=args.poll_interval)
+    process_units(args.project_dir, args.output_dir, concurrency=args.concurrency,
+                  requests_per_minute=args.rpm, tokens_per_minute=args.tpm,
+                  cache_dir=None if args.no_cache else args.cache_dir, bypass_cache=args.refresh_cache,
+                  stream=args.stream, report_path=args.report, trace_path=args.trace,
+                  validate=not args.no_validate, **options)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
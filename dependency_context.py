@@ -0,0 +1,206 @@
+import re
+import threading
+
+from llm_dispatch import estimate_tokens
+from prompt_compaction import compact_csharp, find_type_spans, strip_string_literals
+
+
+# Type declarations a service prompt can need from other files
+TYPE_KINDS = ("class", "struct", "interface", "enum")
+DECLARED_TYPE_RE = re.compile(r'\b(?:class|struct|interface|enum)\s+([A-Za-z_]\w*)')
+
+# Identifiers that may name a type; only those declared in the solution are kept. The parts
+# after a '.' are members or qualified names, matched with their qualifier below.
+TYPE_NAME_RE = re.compile(r'(?<![\w.])[A-Z]\w*')
+# Dotted names that may qualify a type with its namespace, e.g. Contracts.Orders.Order.Create
+QUALIFIED_NAME_RE = re.compile(r'\b[A-Z]\w*(?:\.[A-Za-z_]\w*)+')
+
+# Declarations added to a service prompt, at most; the types used directly come first
+DEPENDENCY_TOKEN_BUDGET = 4000
+
+
+def referenced_names(code):
+    """
+    Capitalized identifiers used by C# code, the candidate names of the types it refers to,
+    and the qualified names among them, e.g. Contracts.Order for `new Contracts.Order()`.
+    """
+    names = set(TYPE_NAME_RE.findall(code or ""))
+    for qualified in QUALIFIED_NAME_RE.findall(code or ""):
+        parts = qualified.split(".")
+        names.update(".".join(parts[:i + 1]) for i in range(1, len(parts)) if parts[i][:1].isupper())
+    return names
+
+
+def enclosing_namespaces(namespace):
+    """A namespace and the namespaces it is nested in, whose types its code can use unqualified."""
+    parts = namespace.split(".") if namespace else []
+    return {".".join(parts[:i]) for i in range(1, len(parts) + 1)}
+
+
+class DependencyContext:
+    """
+    The C# symbol graph of a solution, built during discovery (see the 'types',
+    'type_namespaces', 'references', 'file_scopes' and 'file_types' tables of the symbol
+    index), used to give each service prompt exactly the declarations its code depends on:
+    the types its interface and implementation refer to that are declared in other files,
+    then the types those refer to, and so on. Framework types are not in the graph, so they
+    are never included.
+
+    A name is resolved like the compiler would: to the declarations in a namespace that
+    the referring file is in (or nested in) or imports with `using`, or in the namespace
+    it is qualified with, so same-named types of unrelated namespaces are not pulled in.
+    An unqualified name none of whose declarations is visible (e.g. imported by a project-
+    level <Using> item, which discovery does not see) resolves to all of them.
+    Declarations are read and compacted on first use. Safe to use from worker threads.
+    """
+
+    def __init__(self, token_budget=DEPENDENCY_TOKEN_BUDGET):
+        self.token_budget = token_budget
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self, symbol_index=None, read=None):
+        """
+        Starts a new run with the symbol index built by discovery.
+
+        Args:
+            symbol_index (dict): Index filled by find_wcf_files (None: no dependencies).
+            read (callable): Returns a file's content.
+        """
+        with self._lock:
+            self._types = symbol_index['types'] if symbol_index else {}
+            self._namespaces = symbol_index['type_namespaces'] if symbol_index else {}
+            self._references = symbol_index['references'] if symbol_index else {}
+            self._scopes = symbol_index['file_scopes'] if symbol_index else {}
+            self._global_usings = symbol_index['global_usings'] if symbol_index else set()
+            self._file_types = symbol_index['file_types'] if symbol_index else {}
+            self._read = read
+            self._declarations = {}
+
+    def scope(self, paths):
+        """
+        Namespaces whose types code in the files `paths` can name unqualified, or None
+        (every namespace) when no files are given.
+        """
+        if not paths:
+            return None
+        return set(self._global_usings).union(*(self._scopes.get(path, ()) for path in paths))
+
+    def resolve(self, reference, scope):
+        """
+        Files declaring the type a (possibly qualified) name refers to from code whose
+        `scope` is given, as (type name, [paths]), or None if it names no type of the solution.
+        """
+        qualifier, _, name = reference.rpartition(".")
+        declared = self._namespaces.get(name)
+        if not declared:
+            return None
+        if qualifier:
+            # A qualifier is a namespace, or the end of one the code is in, e.g. Models for App.Models
+            def visible(namespace):
+                return namespace is not None and (namespace == qualifier or namespace.endswith("." + qualifier))
+        else:
+            def visible(namespace):
+                return scope is None or namespace is None or namespace in scope
+        paths = [path for path in self._types.get(name, []) if any(visible(ns) for ns in declared.get(path, ()))]
+        if not paths and not qualifier:
+            paths = list(self._types.get(name, []))
+        return (name, paths) if paths else None
+
+    def closure(self, roots, declared=(), paths=()):
+        """
+        The solution's types reachable from the names in `roots`, used by code in the files
+        `paths`, closest first, as (type name, [declaring paths]): the types referred to
+        directly, then those their declarations refer to, and so on. The `declared` types
+        (already in the prompt) are neither returned nor followed.
+        """
+        excluded = set(declared)
+        seen = set()  # (type name, path) of every declaration reached
+        order = []
+
+        def reached(references, scope):
+            found = {}
+            for reference in references:
+                match = self.resolve(reference, scope)
+                if match and match[0] not in excluded:
+                    found.setdefault(match[0], set()).update(path for path in match[1] if (match[0], path) not in seen)
+            return found
+
+        layer = reached(roots, self.scope(paths))
+        while layer:
+            current = []
+            for name in sorted(layer):
+                files = [path for path in self._types[name] if path in layer[name]]
+                if files:
+                    seen.update((name, path) for path in files)
+                    current.append((name, files))
+            order.extend(current)
+            layer = {}
+            for name, files in current:
+                for path in files:
+                    for found_name, found_paths in reached(self._references[name].get(path, ()),
+                                                           self.scope([path])).items():
+                        layer.setdefault(found_name, set()).update(found_paths)
+        return order
+
+    def declaring_files(self, paths, exclude=()):
+        """
+        Files declaring the types that the types declared in `paths` depend on, outside
+        `paths` and other than the `exclude`d types (as in prompt_section). A change to one
+        of them changes the service's prompt, so it is an input.
+        """
+        declared = {name for path in paths for name in self._file_types.get(path, ())}
+        roots = set().union(*(self._references[name].get(path, ())
+                              for path in paths for name in self._file_types.get(path, ())))
+        closure = self.closure(roots, declared | set(exclude), paths)
+        return sorted({path for _, files in closure for path in files} - set(paths))
+
+    def declaration(self, name, paths=None):
+        """The compacted C# declaration of a type (all its parts in `paths`, default: every file), or ""."""
+        paths = tuple(self._types.get(name, []) if paths is None else paths)
+        with self._lock:
+            if (name, paths) in self._declarations:
+                return self._declarations[(name, paths)]
+        parts = []
+        for path in paths:
+            code = compact_csharp(self._read(path))
+            parts.extend(code[start:end] for start, end in find_type_spans(code, name, TYPE_KINDS))
+        source = "\n".join(parts)
+        with self._lock:
+            self._declarations[(name, paths)] = source
+        return source
+
+    def prompt_section(self, *codes, exclude=(), paths=()):
+        """
+        Prompt section with the declarations the given (service) code depends on, or "" if
+        there are none. `paths` are the files the code comes from; their namespaces and
+        `using` directives decide which types its names refer to. Types declared in the code
+        itself and `exclude`d ones (e.g. the shared models, which are listed as TypeScript)
+        are left out. Past the token budget, the remaining (most distant) types are only
+        listed by name.
+        """
+        declared = {name for code in codes for name in DECLARED_TYPE_RE.findall(code or "")} | set(exclude)
+        roots = set().union(*(referenced_names(strip_string_literals(code)) for code in codes))
+        declarations = []
+        omitted = []
+        tokens = 0
+        for name, files in self.closure(roots, declared, paths):
+            source = self.declaration(name, files)
+            if not source:
+                continue
+            if tokens + estimate_tokens(source) > self.token_budget:
+                omitted.append(name)
+                continue
+            declarations.append(source)
+            tokens += estimate_tokens(source)
+        if not declarations and not omitted:
+            return ""
+        section = """
+**Referenced C# Types (declared elsewhere in the solution):**
+* The code above depends on these types. Translate the ones the service needs into TypeScript in its own files, keeping their names.
+"""
+        if declarations:
+            section += "```csharp\n" + "\n\n".join(declarations) + "\n```\n"
+        if omitted:
+            section += f"* Also referenced (declarations not shown): {', '.join(omitted)}\n"
+        return section
@@ -0,0 +1,255 @@
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+
+from structured_output import STRUCTURED_HEADING
+
+
+class BackendError(Exception):
+    """
+    Raised by a backend when a generation request fails. `status` (an HTTP status) and
+    `retry_after` (seconds) let llm_retry classify the error and honour the server's delay.
+    """
+
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class LLMBackend:
+    """
+    Interface used by call_llm in both converters. A backend turns a prompt into the
+    model's response text and exposes `model_name` and `generation_config`, which are
+    part of the cache key.
+    """
+
+    model_name = None
+    generation_config = None
+
+    def generate(self, prompt):
+        raise NotImplementedError
+
+    def generate_stream(self, prompt):
+        """Yields the response text in pieces as it is produced. Defaults to one piece."""
+        text = self.generate(prompt)
+        if text:
+            yield text
+
+
+class GeminiBackend(LLMBackend):
+    """
+    Google Gemini backend. The SDK is imported and configured on the first request,
+    so importing a converter (or running it against a stub) needs neither the
+    package nor credentials. `generation_config` is passed with every request, e.g.
+    structured_output.STRUCTURED_GENERATION_CONFIG to get JSON file lists.
+    """
+
+    def __init__(self, model_name, api_key=None, generation_config=None):
+        self.model_name = model_name
+        self.api_key = api_key
+        self.generation_config = generation_config
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        with self._lock:
+            if self._model is None:
+                import google.generativeai as genai
+
+                # Set your API key here or in the GOOGLE_API_KEY environment variable
+                genai.configure(api_key=self.api_key or os.environ.get("GOOGLE_API_KEY", "key"))
+                self._model = genai.GenerativeModel(self.model_name)
+            return self._model
+
+    def generate(self, prompt):
+        response = self._get_model().generate_content(prompt, generation_config=self.generation_config)
+        return response.text if response else None
+
+    def generate_stream(self, prompt):
+        for chunk in self._get_model().generate_content(prompt, generation_config=self.generation_config,
+                                                        stream=True):
+            if chunk.text:
+                yield chunk.text
+
+
+def prompt_key(prompt):
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+def synthesize_response(prompt):
+    """
+    Builds a minimal well-formed response in whichever output format the prompt asks for:
+    `[BEGIN_JSX]`-style tags for WebForms prompts, `// filename:` blocks otherwise, or the
+    same files as a JSON file list when the prompt asks for structured output.
+    Batched prompts get one response per unit, in the batch's demultiplexing format.
+    """
+    text = _synthesize_tagged(prompt)
+    if STRUCTURED_HEADING not in prompt:
+        return text
+    if "[BEGIN_JSX]" in prompt:
+        forms = re.findall(r"\[BEGIN_FORM:(\w+)\](.*?)\[END_FORM:\1\]", text, re.DOTALL)
+        if not forms:
+            match = re.search(r"\((\w+)\.aspx\.cs\)", prompt)
+            forms = [(match.group(1) if match else "Component", text)]
+        extensions = {"JSX": "jsx", "CSS": "css", "ROUTES": "routes.js"}
+        files = [{"path": f"{name}.{extensions[tag]}", "content": content.strip()}
+                 for name, body in forms
+                 for tag, content in re.findall(r"\[BEGIN_(\w+)\](.*?)\[END_\1\]", body, re.DOTALL)]
+    else:
+        files = [{"path": path, "content": content.strip()}
+                 for path, content in re.findall(r"^// filename: (\S+)\n(.*?)(?=^// filename: |\Z)", text,
+                                                 re.MULTILINE | re.DOTALL)]
+    return json.dumps({"files": files}, indent=2)
+
+
+def _synthesize_tagged(prompt):
+    if "[BEGIN_FORM:" in prompt:
+        names = dict.fromkeys(re.findall(r"\((\w+)\.aspx\.cs\)", prompt))
+        return "".join(f"[BEGIN_FORM:{name}]\n{_synthesize_form(name)}[END_FORM:{name}]\n" for name in names)
+    if "[BEGIN_JSX]" in prompt:
+        match = re.search(r"\((\w+)\.aspx\.cs\)", prompt)
+        return _synthesize_form(match.group(1) if match else "Component")
+
+    if "**WCF Data Contracts (C#):**" in prompt:
+        filename = re.search(r"^// filename: (\S+)", prompt, re.MULTILINE).group(1)
+        classes = dict.fromkeys(re.findall(r"\bclass\s+(\w+)", prompt))
+        return f"// filename: {filename}\n" + "\n\n".join(f"export interface {name} {{}}" for name in classes) + "\n"
+
+    names = re.findall(r"\*\*WCF Service Name:\*\* (\w+)", prompt)
+    if len(names) > 1:
+        return "\n".join(
+            re.sub(r"(?m)^// filename: ", f"// filename: {name}/", _synthesize_service(name)) for name in names
+        )
+    return _synthesize_service(names[0] if names else "service")
+
+
+def _synthesize_form(name):
+    return (
+        f"[BEGIN_JSX]\nexport default function {name}() {{\n  return <div className=\"{name.lower()}\" />;\n}}\n[END_JSX]\n"
+        f"[BEGIN_CSS]\n.{name.lower()} {{ display: block; }}\n[END_CSS]\n"
+        f"[BEGIN_ROUTES]\nimport {name} from './{name}';\n"
+        f"<Route path=\"/{name.lower()}\" element={{<{name} />}} />\n[END_ROUTES]\n"
+    )
+
+
+def _synthesize_service(name):
+    folder = name.lower()
+    return "\n".join(
+        f"// filename: src/{folder}/{folder}.{part}.ts\nexport class {name}{part.capitalize()} {{}}\n"
+        for part in ("module", "service", "controller")
+    )
+
+
+class StubBackend(LLMBackend):
+    """
+    Offline backend for tests and benchmarks. Replays recorded responses (keyed by a hash
+    of the prompt) and synthesizes a response for anything not recorded. Latency and
+    failures can be simulated to exercise retries, concurrency and rate limiting.
+    """
+
+    def __init__(self, recordings=None, latency=0.0, jitter=0.0, failure_rate=0.0,
+                 seed=None, synthesize=synthesize_response, model_name="stub", stream_chunk_size=256,
+                 failure_status=None):
+        """
+        Args:
+            recordings (dict): Maps prompt_key(prompt) to response text.
+            latency (float): Seconds each request takes.
+            jitter (float): Extra random latency in seconds, uniformly distributed in [0, jitter].
+            failure_rate (float): Probability in [0, 1] that a request raises BackendError.
+            seed (int): Seed for reproducible latency/failure sequences.
+            synthesize (callable): Builds a response for prompts without a recording (None = fail).
+            stream_chunk_size (int): Characters per piece in generate_stream; the latency is
+                                     spread evenly over the pieces.
+            failure_status (int): HTTP status of the simulated failures (e.g. 429 or 503).
+        """
+        self.recordings = recordings or {}
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.synthesize = synthesize
+        self.model_name = model_name
+        self.stream_chunk_size = stream_chunk_size
+        self.failure_status = failure_status
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        """Creates a stub replaying the recordings saved by RecordingBackend."""
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(recordings=json.load(f), **kwargs)
+
+    def _next_request(self):
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            fail = self._random.random() < self.failure_rate
+        return delay, fail
+
+    def generate(self, prompt):
+        delay, fail = self._next_request()
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise BackendError("Simulated backend failure", status=self.failure_status)
+        return self._respond(prompt)
+
+    def generate_stream(self, prompt):
+        delay, fail = self._next_request()
+        if fail:
+            time.sleep(delay / 2)
+            raise BackendError("Simulated backend failure", status=self.failure_status)
+        text = self._respond(prompt)
+        pieces = [text[i:i + self.stream_chunk_size] for i in range(0, len(text), self.stream_chunk_size)]
+        for piece in pieces:
+            if delay:
+                time.sleep(delay / len(pieces))
+            yield piece
+
+    def _respond(self, prompt):
+        recorded = self.recordings.get(prompt_key(prompt))
+        if recorded is not None:
+            return recorded
+        if self.synthesize is None:
+            raise BackendError("No recorded response for prompt")
+        return self.synthesize(prompt)
+
+
+class RecordingBackend(LLMBackend):
+    """Wraps another backend and saves every response to a JSON file for later replay."""
+
+    def __init__(self, backend, path):
+        self.backend = backend
+        self.model_name = backend.model_name
+        self.generation_config = backend.generation_config
+        self.path = path
+        self.recordings = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.recordings = json.load(f)
+        self._lock = threading.Lock()
+
+    def generate(self, prompt):
+        text = self.backend.generate(prompt)
+        self._record(prompt, text)
+        return text
+
+    def generate_stream(self, prompt):
+        pieces = []
+        for piece in self.backend.generate_stream(prompt):
+            pieces.append(piece)
+            yield piece
+        self._record(prompt, "".join(pieces))
+
+    def _record(self, prompt, text):
+        if text:
+            with self._lock:
+                self.recordings[prompt_key(prompt)] = text
+                with open(self.path, "w", encoding="utf-8") as f:
+                    json.dump(self.recordings, f, indent=2)
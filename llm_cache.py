@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+
+class ResponseCache:
+    """
+    Persistent, content-addressed cache of LLM responses.
+
+    Entries are keyed by a SHA-256 of the model name, the generation settings and the
+    prompt text, so any change to the prompt (or model/settings) is a guaranteed miss
+    while an unchanged unit is answered from disk. Each entry is a small JSON file under
+    `cache_dir/<first two hex chars>/<hash>.json`. Old entries are evicted by age, and
+    the least recently used ones are evicted once the cache grows past `max_size_mb`.
+    """
+
+    def __init__(self, cache_dir, model_name, generation_config=None,
+                 max_age_days=30, max_size_mb=512, bypass=False):
+        """
+        Args:
+            cache_dir (str): Directory holding the cache entries (created if missing).
+            model_name (str): Model identifier, part of every key.
+            generation_config (dict): Generation settings, part of every key.
+            max_age_days (float): Entries older than this are treated as misses and evicted.
+            max_size_mb (float): Size limit enforced by prune().
+            bypass (bool): Skip lookups (always call the model) but still store fresh responses.
+        """
+        self.cache_dir = Path(cache_dir)
+        self.model_name = model_name
+        self.generation_config = generation_config or {}
+        self.max_age_seconds = max_age_days * 24 * 3600 if max_age_days else None
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024) if max_size_mb else None
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key(self, prompt):
+        """Returns the content hash identifying a prompt for this model and settings."""
+        digest = hashlib.sha256()
+        digest.update(self.model_name.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(json.dumps(self.generation_config, sort_keys=True).encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(prompt.encode("utf-8"))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, prompt):
+        """Returns the cached response text for a prompt, or None on a miss."""
+        if self.bypass:
+            self._count("misses")
+            return None
+
+        path = self._path(self.key(prompt))
+        try:
+            age = time.time() - path.stat().st_mtime
+            if self.max_age_seconds and age > self.max_age_seconds:
+                path.unlink()
+                self._count("evictions")
+                raise FileNotFoundError(path)
+            with open(path, "r", encoding="utf-8") as f:
+                text = json.load(f)["text"]
+            # Touch the entry so size-based eviction is least-recently-used
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            self._count("misses")
+            return None
+
+        self._count("hits")
+        return text
+
+    def put(self, prompt, text):
+        """Stores a response. Written via a temp file and rename so readers never see partial entries."""
+        if not text:
+            return
+        key = self.key(prompt)
+        path = self._path(key)
+        os.makedirs(path.parent, exist_ok=True)
+        tmp_path = path.with_name(f"{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"model": self.model_name, "created": time.time(), "text": text}, f)
+            os.replace(tmp_path, path)
+            self._count("writes")
+        except OSError as e:
+            print(f"Could not write cache entry {path}: {e}")
+
+    def prune(self):
+        """Evicts expired entries, then least recently used ones until the size limit is met."""
+        entries = []
+        now = time.time()
+        for path in self.cache_dir.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if self.max_age_seconds and now - stat.st_mtime > self.max_age_seconds:
+                path.unlink(missing_ok=True)
+                self._count("evictions")
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        if self.max_size_bytes:
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_size_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+                self._count("evictions")
+
+    def stats(self):
+        """Returns hit/miss counters for this run."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def print_stats(self):
+        stats = self.stats()
+        print(f"LLM cache: {stats['hits']} hits, {stats['misses']} misses "
+              f"({stats['hit_rate']:.0%} hit rate), {stats['writes']} writes, "
+              f"{stats['evictions']} evictions")
@@ -0,0 +1,126 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Rough characters-per-token ratio for source code and English prose
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    """Cheap token estimate used for rate limiting and budgeting (no tokenizer call)."""
+    if not text:
+        return 0
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+class RateLimiter:
+    """
+    Token-bucket limiter for requests per minute (RPM) and tokens per minute (TPM).
+    Both buckets start full and refill continuously, so short bursts are allowed
+    while the sustained rate stays under the quota. A limit of None disables that bucket.
+    Safe to share between worker threads.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute or 0)
+        self._tokens = float(tokens_per_minute or 0)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        if self.requests_per_minute:
+            self._requests = min(self.requests_per_minute,
+                                 self._requests + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute:
+            self._tokens = min(self.tokens_per_minute,
+                               self._tokens + elapsed * self.tokens_per_minute / 60)
+
+    def acquire(self, tokens=0):
+        """
+        Blocks until one request and `tokens` tokens are available, then consumes them.
+        Requests larger than the whole TPM budget wait for a full bucket instead of forever.
+        """
+        if self.tokens_per_minute:
+            tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            with self._lock:
+                self._refill()
+                wait = 0.0
+                if self.requests_per_minute and self._requests < 1:
+                    wait = max(wait, (1 - self._requests) * 60 / self.requests_per_minute)
+                if self.tokens_per_minute and self._tokens < tokens:
+                    wait = max(wait, (tokens - self._tokens) * 60 / self.tokens_per_minute)
+                if wait == 0.0:
+                    if self.requests_per_minute:
+                        self._requests -= 1
+                    if self.tokens_per_minute:
+                        self._tokens -= tokens
+                    return
+            time.sleep(wait)
+
+    def record_usage(self, tokens):
+        """Charges tokens only known after the call (e.g. response tokens) against the TPM bucket."""
+        if self.tokens_per_minute and tokens:
+            with self._lock:
+                self._refill()
+                self._tokens -= tokens
+
+
+def plan_batches(units, unit_tokens, token_budget, small_unit_tokens, max_batch_size=8):
+    """
+    Groups units into work items for batched prompts. Units estimated at no more than
+    `small_unit_tokens` are packed, in order, into batches of at most `max_batch_size`
+    units and `token_budget` tokens; larger units get a work item of their own.
+    Returns a list of unit lists, ordered by each item's first unit.
+
+    Args:
+        unit_tokens (callable): Returns the estimated prompt tokens of one unit.
+    """
+    items = []
+    batch = []
+    batch_tokens = 0
+    for unit in units:
+        tokens = unit_tokens(unit)
+        if tokens > small_unit_tokens:
+            items.append([unit])
+            continue
+        if batch and (batch_tokens + tokens > token_budget or len(batch) >= max_batch_size):
+            batch = []
+        if not batch:
+            items.append(batch)
+            batch_tokens = 0
+        batch.append(unit)
+        batch_tokens += tokens
+    return items
+
+
+def dispatch(units, worker, concurrency=1, extra_workers=0):
+    """
+    Runs `worker(unit)` for every unit, with up to `concurrency` calls in flight.
+    Yields (unit, result) pairs in input order as soon as each one and all earlier
+    ones are done, so callers can save output deterministically while later units
+    are still being converted. If the caller stops early (an exception, Ctrl-C),
+    units that have not started yet are cancelled instead of being run.
+
+    When running concurrently, `extra_workers` more units are started than `concurrency`;
+    the worker then has to cap its own requests in flight (llm_retry.RetryPolicy does), so
+    that units waiting to retry do not keep the others from being sent.
+    """
+    units = list(units)
+    if concurrency <= 1:
+        for unit in units:
+            yield unit, worker(unit)
+        return
+
+    executor = ThreadPoolExecutor(max_workers=concurrency + extra_workers)
+    try:
+        for unit, result in zip(units, executor.map(worker, units)):
+            yield unit, result
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
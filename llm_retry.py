@@ -0,0 +1,270 @@
+import contextlib
+import email.utils
+import random
+import re
+import threading
+import time
+
+
+# Error classes, from classify_error()
+RATE_LIMITED = "rate_limited"  # 429 / quota exhausted: retry after the server's delay
+SERVER_ERROR = "server_error"  # 5xx / overloaded / deadline exceeded: retry with backoff
+TRANSIENT = "transient"        # network errors, empty responses, anything unrecognised: retry
+FATAL = "fatal"                # other 4xx (bad request, auth, blocked prompt): retrying cannot help
+
+# Errors that count towards opening the circuit breaker
+THROTTLING_ERRORS = (RATE_LIMITED, SERVER_ERROR)
+
+_RATE_LIMITED_NAMES = {"ResourceExhausted", "TooManyRequests"}
+_SERVER_ERROR_NAMES = {"InternalServerError", "ServiceUnavailable", "BadGateway", "GatewayTimeout",
+                       "DeadlineExceeded"}
+_FATAL_NAMES = {"InvalidArgument", "BadRequest", "Unauthenticated", "Unauthorized", "PermissionDenied",
+                "Forbidden", "NotFound", "FailedPrecondition", "BlockedPromptException"}
+
+# "Please retry in 27.3s." / "retry_delay { seconds: 27 }" in Gemini quota errors
+_RETRY_DELAY_RES = [
+    re.compile(r"retry in (\d+(?:\.\d+)?)\s*s\b", re.IGNORECASE),
+    re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)", re.IGNORECASE),
+]
+
+
+class EmptyResponseError(ValueError):
+    """Raised when the model answers with no text; retried like a transient error."""
+
+
+def _status_code(error):
+    """HTTP status of an API error (google.api_core exceptions, HTTP client errors), or None."""
+    for holder in (error, getattr(error, "response", None)):
+        for attribute in ("code", "status_code", "status"):
+            value = getattr(holder, attribute, None)
+            if isinstance(value, int) and 100 <= value < 600:
+                return int(value)
+    return None
+
+
+def classify_error(error):
+    """Returns RATE_LIMITED, SERVER_ERROR, TRANSIENT or FATAL for an exception raised by a model call."""
+    status = _status_code(error)
+    name = type(error).__name__
+    if status == 429 or name in _RATE_LIMITED_NAMES:
+        return RATE_LIMITED
+    if (status and status >= 500) or name in _SERVER_ERROR_NAMES:
+        return SERVER_ERROR
+    if status in (408, 409):  # request timeout, aborted
+        return TRANSIENT
+    if (status and 400 <= status < 500) or name in _FATAL_NAMES:
+        return FATAL
+    return TRANSIENT
+
+
+def retry_after(error):
+    """
+    Delay in seconds the server asked for before retrying, or None. Read from a
+    `retry_after` attribute, a Retry-After header (seconds or HTTP date), a google.rpc
+    RetryInfo detail, or the delay quoted in the error message.
+    """
+    value = getattr(error, "retry_after", None)
+    if value is not None:
+        return max(0.0, float(value))
+
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    header = headers.get("Retry-After") if headers else None
+    if header:
+        try:
+            return max(0.0, float(header))
+        except ValueError:
+            try:
+                return max(0.0, email.utils.parsedate_to_datetime(header).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+
+    details = getattr(error, "details", None)
+    if isinstance(details, (list, tuple)):
+        for detail in details:
+            delay = getattr(detail, "retry_delay", None)
+            if delay is not None:
+                return delay.seconds + delay.nanos / 1e9
+
+    message = str(error)
+    for pattern in _RETRY_DELAY_RES:
+        match = pattern.search(message)
+        if match:
+            return float(match.group(1))
+    return None
+
+
+class CircuitBreaker:
+    """
+    Pauses every worker while the endpoint is throttling or failing. After
+    `failure_threshold` consecutive rate-limit or server errors (from any thread) the
+    circuit opens: no request is sent for `cooldown` seconds, or longer if the server asked
+    for it. Then a single probe request is let through; if it succeeds the circuit closes
+    and everyone resumes, if it is throttled again the circuit reopens for twice as long
+    (up to `max_cooldown`).
+    """
+
+    def __init__(self, failure_threshold=3, cooldown=15.0, max_cooldown=240.0):
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._condition = threading.Condition()
+        self.reset()
+
+    def reset(self):
+        with self._condition:
+            self._failures = 0
+            self._cooldown = self.base_cooldown
+            self._open_until = None
+            self._probing = False
+            self.trips = 0
+            self._condition.notify_all()
+
+    def wait(self):
+        """Blocks while the circuit is open or another thread's probe is in flight. Returns seconds waited."""
+        start = time.monotonic()
+        with self._condition:
+            while True:
+                if self._open_until is None:
+                    return time.monotonic() - start
+                remaining = self._open_until - time.monotonic()
+                if remaining <= 0 and not self._probing:
+                    # Half-open: this request is the probe, the others keep waiting for its outcome
+                    self._probing = True
+                    return time.monotonic() - start
+                self._condition.wait(remaining if remaining > 0 else None)
+
+    def record_success(self):
+        with self._condition:
+            self._failures = 0
+            self._cooldown = self.base_cooldown
+            if self._open_until is not None:
+                print("Circuit breaker closed; resuming requests.")
+            self._open_until = None
+            self._probing = False
+            self._condition.notify_all()
+
+    def record_failure(self, kind, delay=None):
+        """Counts a failed request of class `kind`, with the server's retry delay if it gave one."""
+        with self._condition:
+            if kind not in THROTTLING_ERRORS:
+                # The endpoint answered; the request itself was the problem
+                if self._probing:
+                    self._open_until = None
+                    self._probing = False
+                    self._condition.notify_all()
+                return
+            if self._open_until is not None and not self._probing:
+                # Sent before the circuit opened; the pause already accounts for it
+                return
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                pause = max(self._cooldown, delay or 0.0)
+                self._open_until = time.monotonic() + pause
+                self._cooldown = min(self.max_cooldown, self._cooldown * 2)
+                self._failures = 0
+                self._probing = False
+                self.trips += 1
+                print(f"Circuit breaker open after repeated {kind.replace('_', ' ')} errors: "
+                      f"pausing all requests for {pause:.0f} seconds.")
+                self._condition.notify_all()
+
+
+class RetryPolicy:
+    """
+    Retry policy shared by every model call of a converter, including calls made
+    concurrently by worker threads.
+
+    Failed attempts are classified (classify_error): fatal errors are not retried, others
+    are retried up to `max_attempts` in total. The wait before a retry is the server's
+    Retry-After delay when it gives one, or exponential backoff, plus random jitter so
+    workers do not retry in lockstep. Rate-limit and server errors feed a CircuitBreaker
+    that pauses all workers during sustained throttling.
+
+    With `max_in_flight`, at most that many attempts run at once. The limit is only held
+    during an attempt, not during backoff, so a worker waiting to retry leaves its slot to
+    workers with other units (see llm_dispatch.dispatch's `extra_workers`).
+    """
+
+    def __init__(self, max_attempts=4, base_delay=1.0, max_delay=120.0, breaker=None, report=None, seed=None):
+        """
+        Args:
+            max_attempts (int): Attempts per call, including the first.
+            base_delay (float): Backoff before the first retry, doubled for every further one.
+            max_delay (float): Longest backoff; a longer server-requested delay (e.g. an
+                               exhausted daily quota) is not waited for and the call fails.
+            breaker (CircuitBreaker): Shared breaker (default: a new one).
+            report (RunReport): Times waits as 'retry_wait' and 'circuit_open_wait' stages.
+            seed (int): Seed for reproducible jitter.
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker or CircuitBreaker()
+        self.report = report
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self, max_in_flight=None):
+        """Starts a new run: clears the statistics and the breaker, and sets the in-flight limit."""
+        with self._lock:
+            self._slots = threading.BoundedSemaphore(max_in_flight) if max_in_flight else None
+            self.errors = {}
+            self.retries = 0
+            self.gave_up = 0
+        self.breaker.reset()
+
+    def _stage(self, name, **details):
+        return self.report.stage(name, **details) if self.report else contextlib.nullcontext()
+
+    def backoff(self, attempt, delay=None):
+        """Seconds to wait after failed attempt number `attempt` (1-based), jitter included."""
+        with self._lock:
+            if delay is not None:
+                return delay + self._random.uniform(0, self.base_delay)
+            ceiling = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+            return ceiling / 2 + self._random.uniform(0, ceiling / 2)
+
+    def call(self, attempt_request, label):
+        """
+        Runs `attempt_request(attempt)` (attempt numbers start at 1) until it returns, and
+        returns its result. Returns None once the error is fatal or every attempt failed.
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            with self._stage("circuit_open_wait"):
+                self.breaker.wait()
+            try:
+                with self._slots or contextlib.nullcontext():
+                    result = attempt_request(attempt)
+            except Exception as e:
+                kind = classify_error(e)
+                delay = retry_after(e)
+                self.breaker.record_failure(kind, delay)
+                with self._lock:
+                    self.errors[kind] = self.errors.get(kind, 0) + 1
+                print(f"An error occurred while converting {label} (Attempt {attempt}, {kind.replace('_', ' ')}): {e}")
+                if kind == FATAL:
+                    print(f"Not retrying {label}: the request was rejected. Skipping this file.")
+                elif delay is not None and delay > self.max_delay:
+                    print(f"Not retrying {label}: the server asked to wait {delay:.0f} seconds. Skipping this file.")
+                elif attempt < self.max_attempts:
+                    wait = self.backoff(attempt, delay)
+                    print(f"Retrying in {wait:.1f} seconds...")
+                    with self._lock:
+                        self.retries += 1
+                    with self._stage("retry_wait", error=kind):
+                        time.sleep(wait)
+                    continue
+                else:
+                    print(f"Max retries reached for {label}. Skipping this file.")
+                with self._lock:
+                    self.gave_up += 1
+                return None
+            self.breaker.record_success()
+            return result
+        return None
+
+    def stats(self):
+        with self._lock:
+            return {"errors": dict(self.errors), "retries": self.retries, "gave_up": self.gave_up,
+                    "circuit_breaker_trips": self.breaker.trips}
@@ -0,0 +1,210 @@
+import queue
+import threading
+import time
+
+from llm_backends import LLMBackend
+from llm_dispatch import CHARS_PER_TOKEN, estimate_tokens
+
+
+# USD per million prompt / response tokens, for the cost estimates in the run report
+MODEL_PRICES = {
+    'gemini-2.5-flash-lite': (0.10, 0.40),
+    'gemini-2.5-flash': (0.30, 2.50),
+    'gemini-2.5-pro': (1.25, 10.00),
+}
+
+# Separates the tiers in a tiered model name, e.g. "gemini-2.5-flash-lite@2000,gemini-2.5-pro"
+TIER_SEPARATOR = ","
+
+
+def parse_tier(text):
+    """Parses a tier spec 'MODEL:MAX_PROMPT_TOKENS' into (model name, max tokens). Raises ValueError."""
+    model_name, _, max_tokens = text.rpartition(":")
+    try:
+        max_tokens = int(max_tokens)
+    except ValueError:
+        max_tokens = 0
+    if not model_name or max_tokens <= 0:
+        raise ValueError(f"invalid tier '{text}': expected MODEL:MAX_PROMPT_TOKENS, e.g. gemini-2.5-flash-lite:2000")
+    return model_name, max_tokens
+
+
+def estimate_cost(model_name, prompt_tokens, response_tokens):
+    """Estimated USD cost of one request (0 for models without a known price)."""
+    prompt_price, response_price = MODEL_PRICES.get(model_name, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + response_tokens * response_price) / 1e6
+
+
+class RoutingBackend(LLMBackend):
+    """
+    Sends each prompt to the model tier for its size and records every request per model
+    (latency, tokens, estimated cost) in the run report.
+
+    Tiers are (max prompt tokens, backend) pairs: a prompt goes to the first tier whose
+    bound it fits, and prompts larger than every bound go to the default backend, so small
+    services and forms can use a cheaper, faster model and large ones a stronger one.
+
+    With `hedge_after`, a request still unanswered after that many seconds is sent a second
+    time to the same model and whichever answers first is used; for streamed responses the
+    duplicate is sent if the first piece has not arrived by then. A blocking request cannot
+    be cancelled, so the losing one runs to completion in the background (and is billed);
+    a losing stream is closed. Hedges bypass the rate limiter and in-flight limit, so keep
+    the threshold around the p90-p99 latency (see 'models' in the run report).
+    """
+
+    def __init__(self, default, tiers=(), hedge_after=None, report=None):
+        """
+        Args:
+            default (LLMBackend): Backend for prompts larger than every tier.
+            tiers (list): (max prompt tokens, LLMBackend) pairs, in any order.
+            hedge_after (float): Seconds before a slow request is duplicated (None: never).
+            report (RunReport): Receives one model_request() per request sent.
+        """
+        self.default = default
+        self.tiers = sorted(tiers, key=lambda tier: tier[0])
+        self.hedge_after = hedge_after
+        self.report = report
+        # Identifies the routing in cache keys and prompt fingerprints; the default model comes last
+        self.model_name = TIER_SEPARATOR.join(
+            [f"{backend.model_name}@{max_tokens}" for max_tokens, backend in self.tiers] + [default.model_name])
+        # The settings of each model, in the same order, for cache keys (None when no model has any)
+        configs = [backend.generation_config for _, backend in self.tiers] + [default.generation_config]
+        self.generation_config = configs if any(configs) else None
+
+    def route(self, prompt_tokens):
+        """The backend a prompt of `prompt_tokens` estimated tokens is sent to."""
+        for max_tokens, backend in self.tiers:
+            if prompt_tokens <= max_tokens:
+                return backend
+        return self.default
+
+    def _record(self, backend, seconds, prompt_tokens, response_tokens, failed=False, hedge=False, won=False):
+        if self.report:
+            self.report.model_request(backend.model_name, seconds, prompt_tokens, response_tokens,
+                                      estimate_cost(backend.model_name, prompt_tokens, response_tokens),
+                                      failed=failed, hedge=hedge, won=won)
+
+    def generate(self, prompt):
+        prompt_tokens = estimate_tokens(prompt)
+        backend = self.route(prompt_tokens)
+        if not self.hedge_after:
+            start = time.perf_counter()
+            try:
+                text = backend.generate(prompt)
+            except Exception:
+                self._record(backend, time.perf_counter() - start, prompt_tokens, 0, failed=True)
+                raise
+            self._record(backend, time.perf_counter() - start, prompt_tokens, estimate_tokens(text),
+                         failed=not text)
+            return text
+
+        # Both requests report to one queue; the first answer wins
+        answers = queue.Queue()
+        winner = []
+        lock = threading.Lock()
+
+        def request(hedge):
+            start = time.perf_counter()
+            try:
+                text, error = backend.generate(prompt), None
+            except Exception as e:
+                text, error = None, e
+            with lock:
+                won = hedge and bool(text) and not winner
+                if text and not winner:
+                    winner.append(hedge)
+            self._record(backend, time.perf_counter() - start, prompt_tokens, estimate_tokens(text),
+                         failed=not text, hedge=hedge, won=won)
+            answers.put((text, error))
+
+        threading.Thread(target=request, args=(False,), daemon=True).start()
+        hedged = False
+        try:
+            text, error = answers.get(timeout=self.hedge_after)
+        except queue.Empty:
+            print(f"No response from {backend.model_name} after {self.hedge_after:g}s; sending a hedged request.")
+            threading.Thread(target=request, args=(True,), daemon=True).start()
+            hedged = True
+            text, error = answers.get()
+        if not text and hedged:
+            # The first to finish failed; the other may still succeed
+            text, error = answers.get()
+        if error and not text:
+            raise error
+        return text
+
+    def generate_stream(self, prompt):
+        prompt_tokens = estimate_tokens(prompt)
+        backend = self.route(prompt_tokens)
+        if not self.hedge_after:
+            start = time.perf_counter()
+            received = 0
+            try:
+                for piece in backend.generate_stream(prompt):
+                    received += len(piece)
+                    yield piece
+            except Exception:
+                self._record(backend, time.perf_counter() - start, prompt_tokens, received // CHARS_PER_TOKEN,
+                             failed=True)
+                raise
+            self._record(backend, time.perf_counter() - start, prompt_tokens,
+                         received // CHARS_PER_TOKEN + 1 if received else 0, failed=not received)
+            return
+
+        # Each stream runs on its own thread and reports (index, kind, value) events; the
+        # first stream to deliver a piece claims the request and is followed to the end,
+        # and the other one is closed
+        events = queue.Queue()
+        chosen = []
+        lock = threading.Lock()
+
+        def stream(index):
+            start = time.perf_counter()
+            received = 0
+            failed = False
+            cancelled = False
+            try:
+                for piece in backend.generate_stream(prompt):
+                    with lock:
+                        if not chosen:
+                            chosen.append(index)
+                    if chosen[0] != index:
+                        cancelled = True
+                        break
+                    received += len(piece)
+                    events.put((index, "piece", piece))
+                events.put((index, "end", None))
+            except Exception as e:
+                failed = True
+                events.put((index, "error", e))
+            self._record(backend, time.perf_counter() - start, prompt_tokens,
+                         received // CHARS_PER_TOKEN + 1 if received else 0,
+                         failed=failed or not (received or cancelled),
+                         hedge=index == 1, won=index == 1 and chosen == [1])
+
+        threading.Thread(target=stream, args=(0,), daemon=True).start()
+        started = 1
+        finished = set()
+        deadline = time.monotonic() + self.hedge_after
+        while True:
+            timeout = max(0.0, deadline - time.monotonic()) if started == 1 and not chosen else None
+            try:
+                index, kind, value = events.get(timeout=timeout)
+            except queue.Empty:
+                print(f"No response from {backend.model_name} after {self.hedge_after:g}s; sending a hedged request.")
+                threading.Thread(target=stream, args=(1,), daemon=True).start()
+                started = 2
+                continue
+            if chosen and index != chosen[0]:
+                continue
+            if kind == "piece":
+                yield value
+                continue
+            if not chosen:
+                # Ended or failed before its first piece; wait for the other stream if there is one
+                finished.add(index)
+                if started == 2 and len(finished) < 2:
+                    continue
+            if kind == "error":
+                raise value
+            return
@@ -0,0 +1,201 @@
+import posixpath
+import re
+
+
+# Generated files that are checked, by extension; the others (e.g. .json, .md) are left alone
+CODE_EXTENSIONS = {".ts", ".tsx", ".js", ".jsx", ".mjs", ".cjs"}
+STYLE_EXTENSIONS = {".css", ".scss", ".less"}
+
+# Extensions tried, in order, when resolving an extensionless relative import
+RESOLVE_EXTENSIONS = (".ts", ".tsx", ".d.ts", ".js", ".jsx", ".json")
+
+BRACKETS = {"(": ")", "[": "]", "{": "}"}
+CLOSING = {close: open_ for open_, close in BRACKETS.items()}
+
+# Relative module specifiers of import/export ... from, side-effect imports, require() and import()
+RELATIVE_IMPORT_RE = re.compile(r"""(?:\bfrom|\bimport|\brequire\s*\(|\bimport\s*\()\s*(['"])(\.\.?/[^'"\n]*)\1""")
+
+# After one of these characters (or keywords), a '/' starts a regular expression, not a division.
+# Not after '}': in JSX that is the end of an attribute or child expression (`element={<Login />} />`)
+REGEX_PRECEDERS = set("(,=:[!&|?{;+-*%~^")
+# A whole keyword (not the end of an identifier such as `Login` or `Join`, or a property) before the '/'
+REGEX_KEYWORD_RE = re.compile(r'(?<![\w$.])(?:return|typeof|case|do|else|in|of)\s*$')
+
+
+def check_brackets(code, style=False):
+    """
+    Checks that (), [] and {} are balanced and properly nested, ignoring strings,
+    comments, template literal text and regular expression literals. A truncated
+    response typically ends with brackets that are never closed.
+    `style` selects CSS rules (no // comments, regexes or template literals).
+
+    Returns a list of problems (empty if the code is balanced).
+    """
+    problems = []
+    stack = []  # (bracket, line); "`" marks the ${ of a template literal
+    line = 1
+    i = 0
+    n = len(code)
+    previous = ""  # last significant character in code, to tell regexes from divisions
+
+    def skip_template(i, line):
+        """Scans template literal text from i. Returns (index after it or after its '${', line, in_expression)."""
+        while i < n:
+            c = code[i]
+            if c == "\\":
+                i += 2
+                continue
+            if c == "\n":
+                line += 1
+            elif c == "`":
+                return i + 1, line, False
+            elif c == "$" and code.startswith("${", i):
+                return i + 2, line, True
+            i += 1
+        return n, line, None
+
+    while i < n:
+        c = code[i]
+        if c == "\n":
+            line += 1
+            i += 1
+            continue
+        if c in " \t\r":
+            i += 1
+            continue
+
+        if not style and code.startswith("//", i):
+            end = code.find("\n", i)
+            i = n if end < 0 else end
+            continue
+        if code.startswith("/*", i):
+            end = code.find("*/", i + 2)
+            if end < 0:
+                problems.append(f"comment opened on line {line} is never closed")
+                break
+            line += code.count("\n", i, end)
+            i = end + 2
+            continue
+
+        if c in "'\"":
+            # Quoted strings cannot span lines; an unmatched quote is JSX text (e.g. "Don't")
+            j = i + 1
+            while j < n and code[j] not in (c, "\n"):
+                j += 2 if code[j] == "\\" else 1
+            if j < n and code[j] == c:
+                i = j + 1
+                previous = c
+                continue
+            i += 1
+            continue
+
+        if not style and c == "`":
+            start_line = line
+            i, line, in_expression = skip_template(i + 1, line)
+            if in_expression is None:
+                problems.append(f"template literal opened on line {start_line} is never closed")
+                break
+            if in_expression:
+                stack.append(("`", line))
+            previous = "`" if not in_expression else "{"
+            continue
+
+        if not style and c == "/" and (previous in REGEX_PRECEDERS or previous == "" or
+                                       REGEX_KEYWORD_RE.search(code, max(0, i - 16), i)):
+            # Regular expression literal: skip to the closing '/', outside [...] classes
+            j = i + 1
+            in_class = False
+            while j < n and code[j] != "\n":
+                if code[j] == "\\":
+                    j += 2
+                    continue
+                if code[j] == "[":
+                    in_class = True
+                elif code[j] == "]":
+                    in_class = False
+                elif code[j] == "/" and not in_class:
+                    break
+                j += 1
+            if j < n and code[j] == "/":
+                i = j + 1
+                previous = "/"
+                continue
+
+        if c in BRACKETS:
+            stack.append((c, line))
+        elif c in CLOSING:
+            if not stack:
+                problems.append(f"unexpected '{c}' on line {line}")
+            elif c == "}" and stack[-1][0] == "`":
+                # End of a ${...} expression: back into the template literal text
+                stack.pop()
+                start_line = line
+                i, line, in_expression = skip_template(i + 1, line)
+                if in_expression is None:
+                    problems.append(f"template literal continued on line {start_line} is never closed")
+                    break
+                if in_expression:
+                    stack.append(("`", line))
+                previous = "`"
+                continue
+            elif stack[-1][0] != CLOSING[c]:
+                open_, open_line = stack.pop()
+                problems.append(f"'{c}' on line {line} does not close '{open_}' from line {open_line}")
+            else:
+                stack.pop()
+        previous = c
+        i += 1
+
+    for open_, open_line in reversed(stack[-3:]):
+        problems.append(f"'{'${' if open_ == '`' else open_}' opened on line {open_line} is never closed")
+    return problems
+
+
+def relative_imports(code):
+    """Relative module specifiers ('./x', '../y/z') imported or required by JS/TS code."""
+    return [match.group(2) for match in RELATIVE_IMPORT_RE.finditer(code)]
+
+
+def resolve_import(importer, specifier, exists):
+    """
+    Resolves a relative import of the file `importer` (a '/'-separated path) like a bundler
+    would: the exact path, then the path with each of RESOLVE_EXTENSIONS, then an index file.
+    Returns the resolved path, or None if `exists(path)` is false for every candidate.
+    """
+    base = posixpath.normpath(posixpath.join(posixpath.dirname(importer), specifier))
+    if base.startswith("../") or base == "..":
+        return None
+    candidates = [base] + [base + ext for ext in RESOLVE_EXTENSIONS] + \
+                 [f"{base}/index{ext}" for ext in RESOLVE_EXTENSIONS]
+    return next((path for path in candidates if exists(path)), None)
+
+
+def validate_files(files, exists=None):
+    """
+    Checks generated files without calling any tool or model: bracket balance for code
+    and styles, and that every relative import resolves within the generated tree.
+
+    Args:
+        files (dict): '/'-separated path (relative to the output root) -> content.
+        exists (callable): Whether a path outside `files` exists in the generated tree
+                           (e.g. a module generated by another unit). Optional.
+
+    Returns:
+        dict: Path -> list of problems, for the files with problems only.
+    """
+    def in_tree(path):
+        return path in files or bool(exists and exists(path))
+
+    problems = {}
+    for path, content in files.items():
+        extension = posixpath.splitext(path)[1].lower()
+        if extension not in CODE_EXTENSIONS and extension not in STYLE_EXTENSIONS:
+            continue
+        found = check_brackets(content or "", style=extension in STYLE_EXTENSIONS)
+        if extension in CODE_EXTENSIONS:
+            for specifier in relative_imports(content or ""):
+                if not resolve_import(path, specifier, in_tree):
+                    found.append(f"import '{specifier}' does not resolve to a generated file")
+        if found:
+            problems[path] = found
+    return problems
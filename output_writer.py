@@ -0,0 +1,102 @@
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+from conversion_manifest import hash_file
+
+
+class OutputWriter:
+    """
+    Writes generated files for the downstream NestJS/React projects.
+
+    A file whose content is unchanged is left untouched (same bytes, same mtime), so a
+    rerun does not trigger rebuilds or file watchers for code that did not change. Other
+    files are written to a temporary file next to the target and renamed over it, so a
+    crash never leaves a half-written file behind. Directories are created once per run
+    and remembered. Counts of written, unchanged and removed files are kept for the run
+    report. Safe to share between worker threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Clears the counts and the directory cache at the start of a run."""
+        with self._lock:
+            self._directories = set()
+            self.written = 0
+            self.unchanged = 0
+            self.removed = 0
+
+    def make_directories(self, paths):
+        """Creates the parent directories of all `paths` at once, skipping those already created."""
+        parents = {Path(path).parent for path in paths}
+        with self._lock:
+            missing = parents - self._directories
+        for directory in sorted(missing):
+            os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            self._directories |= missing
+
+    def write(self, path, content):
+        """
+        Writes `content` (text) to `path` unless the file already holds exactly that.
+        Returns True if the file was written, False if it was unchanged. Raises OSError.
+        """
+        path = Path(path)
+        # Same bytes as a text-mode write on this platform
+        data = content.replace("\n", os.linesep).encode("utf-8")
+        try:
+            same_size = path.stat().st_size == len(data)
+        except OSError:
+            same_size = False
+        if same_size and hash_file(path) == hashlib.sha256(data).hexdigest():
+            with self._lock:
+                self.unchanged += 1
+            return False
+
+        self.make_directories([path])
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            if tmp_path.exists():
+                tmp_path.unlink()
+            raise
+        with self._lock:
+            self.written += 1
+        return True
+
+    def remove_stale(self, previous_outputs, outputs):
+        """
+        Deletes the files a unit produced last time (`previous_outputs`) but not this time.
+        Returns the number of files removed.
+        """
+        current = {os.path.normpath(str(path)) for path in outputs}
+        removed = 0
+        for path in previous_outputs or []:
+            if os.path.normpath(str(path)) in current:
+                continue
+            try:
+                os.remove(path)
+                removed += 1
+                print(f"Removed stale output: {path}")
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                print(f"Could not remove stale output {path}: {e}")
+        with self._lock:
+            self.removed += removed
+        return removed
+
+    def stats(self):
+        with self._lock:
+            return {"written": self.written, "unchanged": self.unchanged, "removed": self.removed}
+
+    def print_stats(self):
+        stats = self.stats()
+        print(f"Output files: {stats['written']} written, {stats['unchanged']} unchanged, {stats['removed']} removed")
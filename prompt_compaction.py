@@ -0,0 +1,268 @@
+import re
+
+from llm_dispatch import estimate_tokens
+
+
+# Prompt token budgets per model. Past these, latency climbs steeply and long responses
+# start getting truncated, so larger services are split by operation instead.
+PROMPT_TOKEN_BUDGETS = {
+    'gemini-2.5-flash': 24000,
+    'gemini-2.5-flash-lite': 16000,
+    'gemini-2.5-pro': 48000,
+}
+DEFAULT_PROMPT_TOKEN_BUDGET = 16000
+
+# Comments and string/char literals, matched together so comment markers inside strings survive
+CSHARP_TOKEN_RE = re.compile(
+    r'(?P<comment>//[^\n]*|/\*.*?\*/)'
+    r'|(?P<string>@"(?:[^"]|"")*"|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\')',
+    re.DOTALL
+)
+USING_DIRECTIVE_RE = re.compile(r'^\s*(?:global\s+)?using\s+(?:static\s+)?[\w.]+(?:\s*=\s*[\w.<>, ]+)?\s*;\s*$')
+NOISE_DIRECTIVE_RE = re.compile(r'^\s*#\s*(?:region|endregion|pragma)\b')
+CONDITIONAL_DIRECTIVE_RE = re.compile(r'^\s*#\s*(?P<directive>if|elif|else|endif)\b\s*(?P<condition>.*?)\s*$')
+DEAD_CONDITIONS = {'false', '0'}
+OPERATION_RE = re.compile(
+    r'\[\s*OperationContract\b[^\]]*\]\s*(?:\[[^\]]*\]\s*)*'
+    r'[^;{}\[]*?\b(?P<name>[A-Za-z_]\w*)\s*\([^;{}]*\)\s*;'
+)
+MEMBER_MODIFIERS = r'(?:public|private|protected|internal|static|virtual|override|async|sealed|new|extern|unsafe)'
+# A line that may start a method declaration (or a call); the parameter list and body are checked separately
+METHOD_HEADER_RE = re.compile(
+    r'^[ \t]*(?:' + MEMBER_MODIFIERS + r'\s+)*[\w<>\[\],.? ]+?\s+(?:[\w.]+\.)?'
+    r'(?P<name>[A-Za-z_]\w*)\s*(?:<[^>]*>)?\s*\(',
+    re.MULTILINE
+)
+METHOD_BODY_RE = re.compile(r'\s*(?:where\b[^{;]*)?(\{|=>)')
+ATTRIBUTE_LINE_RE = re.compile(r'\s*\[.*\]\s*$')
+
+
+def prompt_token_budget(model_name):
+    # A tiered model name (llm_routing.RoutingBackend) ends with the model that gets the largest prompts
+    return PROMPT_TOKEN_BUDGETS.get(model_name.rsplit(",", 1)[-1], DEFAULT_PROMPT_TOKEN_BUDGET)
+
+
+def compact_csharp(code):
+    """
+    Removes C# content that carries no meaning for the conversion: comments (including
+    XML doc comments), `using` directives, `#region`/`#pragma` lines, `#if false` blocks,
+    trailing whitespace and blank lines. String literals are left untouched.
+    The `#else`/`#elif` branch of an `#if false` block is kept: `#else` and the
+    matching `#endif` are dropped, and an `#elif` becomes the `#if`.
+    """
+    if not code:
+        return code
+    code = CSHARP_TOKEN_RE.sub(lambda m: m.group('string') or ('' if m.group(0).startswith('//') else ' '), code)
+
+    lines = []
+    dead_depth = 0
+    dropped_endifs = []  # for each open #if in live code: whether its #endif is dropped
+    for line in code.splitlines():
+        stripped = line.strip()
+        conditional = CONDITIONAL_DIRECTIVE_RE.match(line)
+        directive = conditional.group('directive') if conditional else None
+        dead_condition = bool(conditional) and conditional.group('condition') in DEAD_CONDITIONS
+        if dead_depth:
+            if directive == 'if':
+                dead_depth += 1
+            elif directive == 'endif':
+                dead_depth -= 1
+            elif dead_depth == 1 and directive == 'else':
+                # The live branch of a dead block: keep its code without the directives
+                dead_depth = 0
+                dropped_endifs.append(True)
+            elif dead_depth == 1 and directive == 'elif' and not dead_condition:
+                dead_depth = 0
+                dropped_endifs.append(False)
+                lines.append(line.replace('elif', 'if', 1).rstrip())
+            continue
+        if directive == 'if' and dead_condition:
+            dead_depth = 1
+            continue
+        if directive == 'if':
+            dropped_endifs.append(False)
+        elif directive == 'endif' and dropped_endifs and dropped_endifs.pop():
+            continue
+        if not stripped or USING_DIRECTIVE_RE.match(line) or NOISE_DIRECTIVE_RE.match(line):
+            continue
+        lines.append(line.rstrip())
+    return "\n".join(lines)
+
+
+def strip_string_literals(code):
+    """
+    Empties every string and char literal (and removes comments), so text such as
+    "class Foo {" inside a literal is not mistaken for code when scanning declarations.
+    """
+    return CSHARP_TOKEN_RE.sub(lambda m: '""' if m.group('string') else ' ', code or "")
+
+
+def _skip_literal(code, i):
+    """Returns the index just past the string/char literal starting at code[i]."""
+    quote = code[i]
+    verbatim = quote == '"' and i > 0 and code[i - 1] == '@'
+    i += 1
+    while i < len(code):
+        if code[i] == '\\' and not verbatim:
+            i += 2
+            continue
+        if code[i] == quote:
+            if verbatim and code[i + 1:i + 2] == '"':
+                i += 2
+                continue
+            return i + 1
+        i += 1
+    return i
+
+
+def _matching_bracket(code, open_index, opening='{', closing='}'):
+    """Returns the index of the bracket closing the one at code[open_index], skipping literals."""
+    depth = 0
+    i = open_index
+    while i < len(code):
+        char = code[i]
+        if char in '"\'':
+            i = _skip_literal(code, i)
+            continue
+        if char == opening:
+            depth += 1
+        elif char == closing:
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    return len(code) - 1
+
+
+def find_operations(interface_code):
+    """Returns (name, start, end) for every [OperationContract] declaration in an interface."""
+    return [(m.group('name'), m.start(), m.end()) for m in OPERATION_RE.finditer(interface_code)]
+
+
+def find_method_spans(code, name):
+    """
+    Returns (start, end) spans of every method (and overload) called `name` in a C# class,
+    including the attribute lines directly above it. Handles block and expression bodies.
+    """
+    return find_method_spans_by_name(code, {name}).get(name, [])
+
+
+def find_method_spans_by_name(code, names):
+    """
+    Same as find_method_spans for all the method names in `names` at once, in a single scan
+    of `code`. Returns {name: [(start, end)]} for the names that are declared.
+    """
+    spans = {}
+    for match in METHOD_HEADER_RE.finditer(code):
+        name = match.group('name')
+        if name not in names:
+            continue
+        # A declaration's parameter list is followed by a body; a call site is not
+        close_paren = _matching_bracket(code, match.end() - 1, '(', ')')
+        body = METHOD_BODY_RE.match(code, close_paren + 1)
+        if not body:
+            continue
+        if body.group(1) == '{':
+            end = _matching_bracket(code, body.start(1)) + 1
+        else:
+            end = code.find(';', body.end()) + 1 or len(code)
+
+        # Include attribute lines such as [WebGet] that decorate the method
+        start = match.start()
+        while start > 0:
+            previous_start = code.rfind('\n', 0, start - 1) + 1
+            if not ATTRIBUTE_LINE_RE.match(code, previous_start, start - 1):
+                break
+            start = previous_start
+        spans.setdefault(name, []).append((start, end))
+    return spans
+
+
+def block_end(code, open_index):
+    """Returns the index just past the '}' closing the '{' at code[open_index], skipping literals."""
+    return _matching_bracket(code, open_index) + 1
+
+
+def find_type_spans(code, name, kinds=('class',)):
+    """
+    Returns (start, end) spans of every declaration of the class called `name` (one per
+    part of a partial class), including the attributes directly above it, e.g. [DataContract].
+    `kinds` selects other type declarations too, e.g. ('class', 'struct', 'interface', 'enum').
+    A declaration may start a line or follow a brace or semicolon (`namespace X { class Y {...} }`).
+    """
+    declaration = re.compile(
+        r'(?:^|(?<=[{};]))[ \t]*(?:\[[^\]]*\]\s*)*(?:(?:' + MEMBER_MODIFIERS + r'|abstract|partial|readonly|ref)\s+)*'
+        r'(?:' + '|'.join(kinds) + r')\s+' + re.escape(name) + r'\b[^{;]*\{',
+        re.MULTILINE
+    )
+    return [(match.start(), block_end(code, match.end() - 1)) for match in declaration.finditer(code)]
+
+
+def remove_type_declarations(code, names):
+    """Removes the declarations of the classes in `names` (e.g. types already converted elsewhere)."""
+    spans = [span for name in names for span in find_type_spans(code, name)]
+    return _remove_spans(code, spans) if spans else code
+
+
+def _remove_spans(code, spans):
+    # Keeps the text between the spans in one pass (spans may nest or overlap)
+    kept = []
+    position = 0
+    for start, end in sorted(spans):
+        if start > position:
+            kept.append(code[position:start])
+        position = max(position, end)
+    kept.append(code[position:])
+    return "\n".join(line for line in "".join(kept).splitlines() if line.strip())
+
+
+def split_by_operations(interface_code, implementation_code, token_budget):
+    """
+    Splits a service into groups of [OperationContract] operations so that each group's
+    interface and implementation fit in `token_budget` tokens. Members that do not belong
+    to any operation (fields, constructors, private helpers) are kept in every group.
+
+    Returns a list of (operation names, interface chunk, implementation chunk). A service
+    with fewer than two operations cannot be split and is returned as a single group.
+    """
+    operations = find_operations(interface_code)
+    if len(operations) < 2:
+        return [([name for name, _, _ in operations], interface_code, implementation_code)]
+
+    interface_spans = {name: [] for name, _, _ in operations}
+    for name, start, end in operations:
+        interface_spans[name].append((start, end))
+    declared = find_method_spans_by_name(implementation_code, interface_spans)
+    method_spans = {name: declared.get(name, []) for name in interface_spans}
+
+    def span_tokens(code, spans):
+        return sum(estimate_tokens(code[start:end]) for start, end in spans)
+
+    costs = {
+        name: span_tokens(interface_code, interface_spans[name]) + span_tokens(implementation_code, method_spans[name])
+        for name in interface_spans
+    }
+    shared_cost = (
+        estimate_tokens(_remove_spans(interface_code, [s for spans in interface_spans.values() for s in spans]))
+        + estimate_tokens(_remove_spans(implementation_code, [s for spans in method_spans.values() for s in spans]))
+    )
+
+    # Greedily pack operations, in declaration order, into groups that fit the budget
+    groups = [[]]
+    group_cost = shared_cost
+    for name in interface_spans:
+        if groups[-1] and group_cost + costs[name] > token_budget:
+            groups.append([])
+            group_cost = shared_cost
+        groups[-1].append(name)
+        group_cost += costs[name]
+
+    chunks = []
+    for group in groups:
+        excluded = [name for name in interface_spans if name not in group]
+        chunks.append((
+            group,
+            _remove_spans(interface_code, [s for name in excluded for s in interface_spans[name]]),
+            _remove_spans(implementation_code, [s for name in excluded for s in method_spans[name]]),
+        ))
+    return chunks
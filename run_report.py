@@ -0,0 +1,230 @@
+import contextlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+
+# Written next to the generated output unless another path is given
+REPORT_NAME = "conversion_report.json"
+
+
+def percentiles(values, points=(50, 90, 99)):
+    """Nearest-rank percentiles of a list of numbers, plus count, total and max."""
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+    summary = {"count": len(values), "total": sum(values), "max": values[-1]}
+    for point in points:
+        rank = max(1, -(-point * len(values) // 100))  # ceil(point% of n)
+        summary[f"p{point}"] = values[rank - 1]
+    return summary
+
+
+class RunReport:
+    """
+    Instrumentation for one converter run. Code under test wraps its work in
+    `stage(name)` blocks and reports every LLM attempt; everything is attributed to the
+    unit (service or form) set with `unit(name)` on the current thread, so workers can
+    record concurrently. `write()` produces a JSON report with per-stage and per-unit
+    timings, token counts, retry counts and latency percentiles.
+
+    With a trace path, every stage is also appended to a Chrome trace file (open it in
+    chrome://tracing or https://ui.perfetto.dev) as soon as it ends, so a trace survives
+    an interrupted run.
+    """
+
+    def __init__(self, trace_path=None):
+        self.start(trace_path)
+
+    def start(self, trace_path=None):
+        """Clears all measurements and starts timing a new run."""
+        self.started = time.time()
+        self._clock_start = time.perf_counter()
+        self._stages = {}
+        self._units = {}
+        self._llm_latencies = []
+        self._counters = {}
+        self._models = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._trace = None
+        if trace_path:
+            os.makedirs(Path(trace_path).parent, exist_ok=True)
+            self._trace = open(trace_path, "w", encoding="utf-8")
+            self._trace.write("[\n")
+
+    def _unit_entry(self, name):
+        return self._units.setdefault(name, {
+            "seconds": 0.0, "stages": {}, "llm_attempts": 0, "llm_failures": 0, "retries": 0,
+            "cache_hits": 0, "prompt_tokens": 0, "response_tokens": 0, "llm_seconds": 0.0,
+        })
+
+    @property
+    def current_unit(self):
+        return getattr(self._local, "unit", None)
+
+    @contextlib.contextmanager
+    def unit(self, name):
+        """
+        Attributes the stages and LLM attempts recorded on this thread to `name`, and adds
+        the time spent in the block to the unit's total.
+        """
+        previous = self.current_unit
+        self._local.unit = name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self._local.unit = previous
+            with self._lock:
+                self._unit_entry(name)["seconds"] += seconds
+
+    @contextlib.contextmanager
+    def stage(self, name, **details):
+        """Times the enclosed block as one occurrence of stage `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self._record_stage(name, start, end - start, details)
+
+    def _record_stage(self, name, start, seconds, details):
+        unit = self.current_unit
+        with self._lock:
+            self._stages.setdefault(name, []).append(seconds)
+            if unit is not None:
+                stages = self._unit_entry(unit)["stages"]
+                stages[name] = stages.get(name, 0.0) + seconds
+            if self._trace:
+                event = {
+                    "name": name, "cat": "stage", "ph": "X", "pid": os.getpid(),
+                    "tid": threading.get_ident(),
+                    "ts": round((start - self._clock_start) * 1e6), "dur": round(seconds * 1e6),
+                    "args": {"unit": unit, **details},
+                }
+                self._trace.write(json.dumps(event) + ",\n")
+                self._trace.flush()
+
+    @contextlib.contextmanager
+    def llm_attempt(self, prompt_tokens, retry=False):
+        """
+        Times one model request of the current unit as stage 'llm_attempt'. The block sets
+        `usage["response_tokens"]`; an exception or an empty response counts as a failure.
+        `retry` marks attempts after the first.
+        """
+        usage = {"response_tokens": 0}
+        start = time.perf_counter()
+        try:
+            yield usage
+        finally:
+            seconds = time.perf_counter() - start
+            self._record_stage("llm_attempt", start, seconds, {"retry": retry})
+            with self._lock:
+                entry = self._unit_entry(self.current_unit)
+                entry["llm_attempts"] += 1
+                entry["llm_failures"] += int(not usage["response_tokens"])
+                entry["retries"] += int(retry)
+                entry["prompt_tokens"] += prompt_tokens
+                entry["response_tokens"] += usage["response_tokens"]
+                entry["llm_seconds"] += seconds
+                self._llm_latencies.append(seconds)
+
+    def cache_hit(self):
+        """Records a response answered from the cache for the current unit."""
+        with self._lock:
+            self._unit_entry(self.current_unit)["cache_hits"] += 1
+
+    def model_request(self, model_name, seconds, prompt_tokens, response_tokens, cost=0.0, failed=False,
+                      hedge=False, won=False):
+        """
+        Records one request sent to a concrete model (see llm_routing.RoutingBackend),
+        reported per model under 'models'. `hedge` marks a duplicate sent because the first
+        request was slow, `won` a hedge that answered first. Losing requests still count:
+        they are billed.
+        """
+        with self._lock:
+            entry = self._models.setdefault(model_name, {
+                "requests": 0, "failures": 0, "hedges": 0, "hedge_wins": 0,
+                "prompt_tokens": 0, "response_tokens": 0, "cost_usd": 0.0, "latencies": [],
+            })
+            entry["requests"] += 1
+            entry["failures"] += int(failed)
+            entry["hedges"] += int(hedge)
+            entry["hedge_wins"] += int(won)
+            entry["prompt_tokens"] += prompt_tokens
+            entry["response_tokens"] += response_tokens
+            entry["cost_usd"] += cost
+            entry["latencies"].append(seconds)
+
+    def count(self, name, amount=1):
+        """Adds to a run-wide counter (e.g. files that failed validation), reported under 'counters'."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def summary(self, slowest=10, **extra):
+        """Builds the report as a dict. `extra` items (e.g. unit counts) are included as-is."""
+        with self._lock:
+            units = {name: dict(entry) for name, entry in self._units.items() if name is not None}
+            totals = {
+                key: sum(entry[key] for entry in self._units.values())
+                for key in ("llm_attempts", "llm_failures", "retries", "cache_hits",
+                            "prompt_tokens", "response_tokens")
+            }
+            stages = {name: percentiles(values) for name, values in self._stages.items()}
+            llm_latency = percentiles(self._llm_latencies)
+            counters = dict(self._counters)
+            models = {
+                name: {**{key: value for key, value in entry.items() if key != "latencies"},
+                       "cost_usd": round(entry["cost_usd"], 6), "latency": percentiles(entry["latencies"])}
+                for name, entry in self._models.items()
+            }
+
+        return {
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "wall_seconds": time.perf_counter() - self._clock_start,
+            # Token counts are estimates (llm_dispatch.estimate_tokens), not billed usage
+            "totals": totals,
+            "llm_latency": llm_latency,
+            # Requests, latency and estimated cost per concrete model, hedged duplicates included
+            "models": models,
+            "unit_latency": percentiles([entry["seconds"] for entry in units.values()]),
+            "stages": stages,
+            "counters": counters,
+            "slowest_units": sorted(units, key=lambda name: units[name]["seconds"], reverse=True)[:slowest],
+            "units": units,
+            **extra,
+        }
+
+    def write(self, path, **extra):
+        """Writes the JSON report atomically and closes the trace file. Returns the summary."""
+        summary = self.summary(**extra)
+        path = Path(path)
+        os.makedirs(path.parent, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        os.replace(tmp_path, path)
+        self.close()
+        return summary
+
+    @staticmethod
+    def print_model_stats(summary):
+        """Prints one line per model of a summary's 'models': requests, latency and estimated cost."""
+        for model_name, stats in summary.get("models", {}).items():
+            latency = stats["latency"]
+            hedges = f", {stats['hedges']} hedged ({stats['hedge_wins']} won)" if stats["hedges"] else ""
+            print(f"  {model_name}: {stats['requests']} request(s), {stats['failures']} failed{hedges}, "
+                  f"latency p50 {latency.get('p50', 0):.1f}s / p99 {latency.get('p99', 0):.1f}s, "
+                  f"~${stats['cost_usd']:.4f}")
+
+    def close(self):
+        """Finishes the trace file (a valid JSON array) if one is open."""
+        with self._lock:
+            if self._trace:
+                self._trace.write("{}]\n")
+                self._trace.close()
+                self._trace = None
@@ -0,0 +1,98 @@
+import os
+from pathlib import Path
+
+from conversion_journal import ConversionJournal
+from conversion_manifest import ConversionManifest
+
+
+def parse_shard(text):
+    """Parses a shard spec 'i/n' (1 <= i <= n) into (i, n). Raises ValueError."""
+    try:
+        index, count = (int(part) for part in text.split("/"))
+    except ValueError:
+        raise ValueError(f"invalid shard '{text}': expected i/n, e.g. 2/4")
+    if not 1 <= index <= count:
+        raise ValueError(f"invalid shard '{text}': i must be between 1 and n")
+    return index, count
+
+
+def _size_class(tokens):
+    """Rounds an estimate up to a power of two, so small edits do not change the partition."""
+    return 1 << max(0, int(tokens) - 1).bit_length()
+
+
+def select_shard(units, shard, unit_tokens, unit_key):
+    """
+    Returns the units of `shard` ((i, n), 1-based) in their original order.
+
+    Units are spread over the n shards by estimated prompt size: largest first, each to the
+    shard with the least work so far (ties go to the lowest shard and are broken by key).
+    The partition depends only on the units' keys and rounded sizes, so every shard,
+    on any machine, computes the same one independently, and reruns are stable.
+
+    Args:
+        unit_tokens (callable): Returns the estimated prompt tokens of one unit.
+        unit_key (callable): Returns a unit's unique name.
+    """
+    if not shard:
+        return list(units)
+    index, count = shard
+    loads = [0] * count
+    assignment = {}
+    for unit in sorted(units, key=lambda unit: (-_size_class(unit_tokens(unit)), unit_key(unit))):
+        target = min(range(count), key=lambda shard_index: (loads[shard_index], shard_index))
+        loads[target] += _size_class(unit_tokens(unit))
+        assignment[unit_key(unit)] = target
+    return [unit for unit in units if assignment[unit_key(unit)] == index - 1]
+
+
+def load_shard_units(shard_path):
+    """
+    Returns {unit name: manifest entry} for the units converted into a shard's output,
+    including those only recorded in the journal of an interrupted run.
+    """
+    units = dict(ConversionManifest(shard_path, None).units)
+    units.update(ConversionJournal(shard_path).entries)
+    return units
+
+
+def _relocate(path, shard_path, output_path):
+    """Maps a path inside a shard's output directory to the same path in the merged output."""
+    relative = os.path.relpath(os.path.abspath(path), os.path.abspath(shard_path))
+    if relative == ".." or relative.startswith(".." + os.sep):
+        return str(path)
+    return str(Path(output_path) / relative)
+
+
+def merge_unit(unit_name, shards, output_path, manifest, writer):
+    """
+    Copies one unit's output files from the first shard that converted it into output_path
+    (through `writer`, so unchanged files are left untouched) and records the unit in the
+    merged manifest, with paths rewritten to the merged output so incremental runs work there.
+    Returns the merged manifest entry, or None if no shard has the unit.
+
+    Args:
+        shards (list): (shard output path, {unit name: manifest entry}) pairs.
+    """
+    for shard_path, shard_units in shards:
+        entry = shard_units.get(unit_name)
+        if not entry:
+            continue
+        outputs = []
+        for path in entry.get("outputs", []):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    content = f.read()
+            except OSError as e:
+                print(f"Cannot merge {unit_name} from {shard_path}: {e}")
+                break
+            target = _relocate(path, shard_path, output_path)
+            writer.write(target, content)
+            outputs.append(target)
+        else:
+            # e.g. the shared models module, an input of every service, lives in the output directory
+            inputs = {role: {**hashes, "path": _relocate(hashes["path"], shard_path, output_path)}
+                      for role, hashes in entry.get("inputs", {}).items()}
+            manifest.units[unit_name] = {**entry, "inputs": inputs, "outputs": outputs}
+            return manifest.units[unit_name]
+    return None
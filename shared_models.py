@@ -0,0 +1,140 @@
+import re
+
+from llm_dispatch import estimate_tokens
+from prompt_compaction import compact_csharp, find_type_spans, remove_type_declarations
+from typescript_merge import split_declarations
+
+
+# The shared models module is written to <output>/shared-models/src/models/data-contracts.ts.
+# The directory name cannot clash with a service, since C# names never contain a hyphen.
+SHARED_MODELS_DIR = "shared-models"
+SHARED_MODELS_FILE = "src/models/data-contracts.ts"
+
+
+def collect_data_contracts(contract_files, read):
+    """
+    Extracts the C# source of every [DataContract] class, compacted for the prompt.
+
+    Args:
+        contract_files (dict): Data contract class name -> [.cs paths declaring it].
+        read (callable): Returns a file's content.
+
+    Returns:
+        dict: Class name -> C# source (all parts of a partial class), in name order.
+    """
+    contents = {}
+    sources = {}
+    for name in sorted(contract_files):
+        parts = []
+        for path in contract_files[name]:
+            if path not in contents:
+                contents[path] = compact_csharp(read(path))
+            code = contents[path]
+            parts.extend(code[start:end] for start, end in find_type_spans(code, name))
+        if parts:
+            sources[name] = "\n".join(parts)
+    return sources
+
+
+def group_data_contracts(sources, token_budget):
+    """Packs data contract sources, in order, into groups of at most `token_budget` tokens."""
+    groups = [{}]
+    group_tokens = 0
+    for name, source in sources.items():
+        tokens = estimate_tokens(source)
+        if groups[-1] and group_tokens + tokens > token_budget:
+            groups.append({})
+            group_tokens = 0
+        groups[-1][name] = source
+        group_tokens += tokens
+    return groups
+
+
+def create_models_prompt(sources, part=1, total_parts=1):
+    """
+    Creates the prompt converting the data contracts (class name -> C# source) into the
+    shared TypeScript models module. Large sets are converted in parts and merged.
+    """
+    contracts = "\n\n".join(sources.values())
+    partial = ""
+    if total_parts > 1:
+        partial = f"""
+**Partial Conversion ({part} of {total_parts}):**
+* Only some of the Data Contracts are included; the others are converted separately and merged afterwards.
+* Refer to Data Contracts that are not listed by name only; do not define them.
+"""
+    return f"""
+You are a senior developer specializing in WCF to Node.js (NestJS) migration.
+Your task is to convert the following WCF Data Contracts into TypeScript once, as a models
+module shared by every converted service.
+
+**WCF Data Contracts (C#):**
+```csharp
+{contracts}
+```
+
+**Instructions for the shared models module:**
+* Translate every Data Contract into an exported TypeScript interface with exactly the same name.
+* Keep every `DataMember` property with the same name, mapping C# types to TypeScript types (e.g. `int`/`decimal` to `number`, `List<T>` to `T[]`).
+* Refer to other Data Contracts by name instead of repeating their properties.
+* Output a single file, starting with exactly this comment:
+// filename: {SHARED_MODELS_FILE}
+Do not include any other markdown headings or conversational text within the output. The response should only be the code itself.
+{partial}"""
+
+
+class SharedModels:
+    """
+    The TypeScript declarations of the shared models module. Service prompts include only
+    the declarations a service refers to, and ask the model to import them rather than
+    regenerate them; the C# declarations of those types are dropped from the prompt.
+    """
+
+    def __init__(self, models_code, declarations=None):
+        self.declarations = declarations if declarations is not None else split_declarations(models_code or "")
+        self._name_re = None
+        if self.declarations:
+            names = sorted(self.declarations, key=len, reverse=True)
+            self._name_re = re.compile(r'\b(?:' + '|'.join(map(re.escape, names)) + r')\b')
+
+    @classmethod
+    def from_contracts(cls, sources):
+        """
+        Stand-in for a module that is not converted yet (dry runs): the C# sources of the
+        data contracts (class name -> source) take the place of their TypeScript declarations.
+        """
+        return cls("", dict(sources))
+
+    def referenced(self, *codes):
+        """Names of the shared types used by the given code, including the types those refer to."""
+        if not self._name_re:
+            return []
+        names = set()
+        pending = [name for code in codes if code for name in self._name_re.findall(code)]
+        while pending:
+            name = pending.pop()
+            if name not in names:
+                names.add(name)
+                pending.extend(self._name_re.findall(self.declarations[name]))
+        return sorted(names)
+
+    def strip(self, code):
+        """Removes the C# declarations of the shared types from a service's source."""
+        return remove_type_declarations(code, self.declarations) if self.declarations else code
+
+    def prompt_section(self, service_name, *codes):
+        """Prompt instructions for the shared types used by the given code ("" if there are none)."""
+        names = self.referenced(*codes)
+        if not names:
+            return ""
+        folder = service_name.lower()
+        declarations = "\n\n".join(self.declarations[name] for name in names)
+        return f"""
+**Shared Data Contracts:**
+* These Data Contracts are already converted in the shared models module `{SHARED_MODELS_DIR}/{SHARED_MODELS_FILE}`. Do not generate them again.
+* Import them from that module instead, e.g. in `src/{folder}/{folder}.service.ts`:
+import {{ {names[0]} }} from '../../../{SHARED_MODELS_DIR}/{SHARED_MODELS_FILE[:-3]}';
+```typescript
+{declarations}
+```
+"""
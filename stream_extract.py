@@ -0,0 +1,107 @@
+import re
+
+
+FILENAME_LINE_RE = re.compile(r'//\s*filename:\s*(.+)', re.IGNORECASE)
+BEGIN_TAG_RE = re.compile(r'\[BEGIN_(\w+)\]')
+# Longest text that could still turn out to be the start of a [BEGIN_...] tag
+MAX_PARTIAL_TAG = 32
+
+
+class CodeBlockStreamParser:
+    """
+    Incremental, line-oriented version of extract_code_blocks. Feed it response text as
+    it streams in; every `// filename:` block is handed to `on_file(filename, content)`
+    as soon as the next block starts (or the stream ends), so it can be written right
+    away. Only the current block is held in memory, plus any text before the first
+    block, which close() returns for the whole-response fallback.
+    """
+
+    def __init__(self, on_file):
+        self.on_file = on_file
+        self.files = []
+        self.preamble = []
+        self._partial_line = ""
+        self._filename = None
+        self._content = []
+
+    def feed(self, text):
+        lines = (self._partial_line + text).split("\n")
+        # The last piece may be an incomplete line; keep it until more text arrives
+        self._partial_line = lines.pop()
+        for line in lines:
+            self._feed_line(line.rstrip("\r"))
+
+    def _feed_line(self, line):
+        match = FILENAME_LINE_RE.match(line.strip())
+        if match:
+            self._flush()
+            self._filename = match.group(1).strip()
+        elif self._filename:
+            self._content.append(line)
+        else:
+            self.preamble.append(line)
+
+    def _flush(self):
+        if self._filename and self._content:
+            self.add(self._filename, "\n".join(self._content).strip())
+        self._content = []
+
+    def add(self, filename, content):
+        """Records a complete file and hands it to on_file (also used for files parsed from JSON)."""
+        self.files.append(filename)
+        self.on_file(filename, content)
+
+    def close(self):
+        """Flushes the last block. Returns the text seen before the first block."""
+        if self._partial_line:
+            self._feed_line(self._partial_line.rstrip("\r"))
+            self._partial_line = ""
+        self._flush()
+        self._filename = None
+        return "\n".join(self.preamble)
+
+
+class TaggedSectionStreamParser:
+    """
+    Incremental version of the `[BEGIN_X]...[END_X]` parsing in extract_parts. Each
+    section is handed to `on_section(tag, content)` as soon as its end tag arrives; like
+    extract_parts, only the first section of each tag is used.
+    """
+
+    def __init__(self, on_section):
+        self.on_section = on_section
+        self.sections = {}
+        self._buffer = ""
+        self._tag = None
+
+    def feed(self, text):
+        self._buffer += text
+        while True:
+            if self._tag is None:
+                match = BEGIN_TAG_RE.search(self._buffer)
+                if not match:
+                    # Drop text outside sections, except what may be a tag split across chunks
+                    self._buffer = self._buffer[-MAX_PARTIAL_TAG:]
+                    return
+                self._tag = match.group(1)
+                self._buffer = self._buffer[match.end():]
+            else:
+                end_tag = f"[END_{self._tag}]"
+                end = self._buffer.find(end_tag)
+                if end == -1:
+                    return
+                self.add(self._tag, self._buffer[:end].strip())
+                self._buffer = self._buffer[end + len(end_tag):]
+                self._tag = None
+
+    def add(self, tag, content):
+        """Records a complete section, unless one with this tag came first, and hands it to on_section."""
+        if tag not in self.sections:
+            self.sections[tag] = content
+            self.on_section(tag, content)
+
+    def close(self):
+        """Returns {tag: content} for every completed section."""
+        self._buffer = ""
+        self._tag = None
+        return self.sections
@@ -0,0 +1,254 @@
+import json
+import re
+import threading
+
+
+# JSON schema of a structured response: the generated files, each with its path and complete content
+FILES_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "files": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {"path": {"type": "STRING"}, "content": {"type": "STRING"}},
+                "required": ["path", "content"],
+            },
+        },
+    },
+    "required": ["files"],
+}
+
+# Gemini generation config that constrains responses to FILES_SCHEMA (see GeminiBackend)
+STRUCTURED_GENERATION_CONFIG = {"response_mime_type": "application/json", "response_schema": FILES_SCHEMA}
+
+# Appended to every prompt of a structured run; `paths` tells the model how the converter names its files
+STRUCTURED_HEADING = "**Response Format (JSON):**"
+STRUCTURED_INSTRUCTIONS = """
+""" + STRUCTURED_HEADING + """
+* This overrides the output format requested above. Respond with one JSON object and nothing else:
+{{"files": [{{"path": "...", "content": "..."}}]}}
+* Give every file its own entry, with its complete content and without `// filename:` comments, tags or markdown fences.
+* {paths}
+"""
+
+# Optional markdown fence before the JSON object, e.g. ```json
+OPENING_FENCE_RE = re.compile(r'```(?:json)?[ \t]*\r?\n', re.IGNORECASE)
+# Longest text that could still turn out to be an opening fence
+MAX_FENCE = 16
+# Characters of a JSON string up to its next quote or escape
+STRING_RUN_RE = re.compile(r'[^"\\]*')
+
+
+class FileListStreamParser:
+    """
+    Single-pass, incremental parser of a structured response, {"files": [{"path", "content"}]}.
+    Feed it response text as it streams in; each file entry is decoded as soon as its object
+    closes and handed to `on_file(path, content)`, so it can be written right away. Only the
+    entry being read is held in memory.
+
+    A response that does not start with a JSON object (after an optional ```json fence) is
+    handed to `fallback`, one of the tag-format parsers of stream_extract, whose attributes
+    (`files`, `sections`, ...) this parser exposes either way; `on_file` defaults to the
+    fallback's add(). After close(), `structured` tells whether the response was JSON and
+    `truncated` whether it ended before the object closed (the entries read so far are kept).
+    """
+
+    def __init__(self, on_file=None, fallback=None):
+        self.fallback = fallback
+        self.on_file = on_file or (fallback.add if fallback else None)
+        self.entries = []
+        self.structured = False
+        self.truncated = False
+        self._decided = False
+        self._undecided = ""
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._entry = None  # pieces of the file entry being read
+        self._done = False
+
+    def __getattr__(self, name):
+        fallback = self.__dict__.get("fallback")
+        if fallback is None:
+            raise AttributeError(name)
+        return getattr(fallback, name)
+
+    def feed(self, text):
+        if not self._decided:
+            text = self._decide(self._undecided + text)
+            if text is None:
+                return
+        if self.structured:
+            self._scan(text)
+        elif self.fallback:
+            self.fallback.feed(text)
+
+    def _decide(self, text):
+        """Picks the format once the response starts. Returns the text to parse, or None to wait for more."""
+        stripped = text.lstrip()
+        match = OPENING_FENCE_RE.match(stripped)
+        if match:
+            body = stripped[match.end():].lstrip()
+        elif stripped.startswith("`") and "\n" not in stripped and len(stripped) < MAX_FENCE:
+            body = ""
+        else:
+            body = stripped
+        if not body:
+            self._undecided = text
+            return None
+        self._decided = True
+        self._undecided = ""
+        self.structured = body.startswith("{")
+        return body if self.structured else text
+
+    def _scan(self, text):
+        # The entries are the objects at depth 3: {"files": [{...}, ...]}
+        start = 0 if self._entry is not None else None
+        i = 0
+        n = len(text)
+        while i < n and not self._done:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    i += 1
+                    continue
+                i = STRING_RUN_RE.match(text, i).end()
+                if i < n:
+                    if text[i] == "\\":
+                        self._escape = True
+                    else:
+                        self._in_string = False
+                    i += 1
+                continue
+            c = text[i]
+            if c == '"':
+                self._in_string = True
+            elif c in "{[":
+                self._depth += 1
+                if self._depth == 3 and c == "{":
+                    self._entry = []
+                    start = i
+            elif c in "}]":
+                self._depth -= 1
+                if self._depth == 2 and self._entry is not None:
+                    self._entry.append(text[start:i + 1])
+                    self._add_entry("".join(self._entry))
+                    self._entry = None
+                elif self._depth == 0:
+                    self._done = True
+            i += 1
+        if self._entry is not None:
+            self._entry.append(text[start:])
+
+    def _add_entry(self, text):
+        try:
+            entry = json.loads(text)
+        except ValueError:
+            return
+        if not isinstance(entry, dict):
+            return
+        path, content = entry.get("path"), entry.get("content")
+        if not isinstance(path, str) or not isinstance(content, str) or not path.strip() or not content.strip():
+            return
+        self.entries.append((path.strip(), content.strip()))
+        if self.on_file:
+            self.on_file(path.strip(), content.strip())
+
+    def close(self):
+        """Ends the response. Returns what the fallback's close() returns, or the entries without a fallback."""
+        if not self._decided:
+            # Only whitespace or an unfinished fence: not JSON
+            self._decided = True
+            if self.fallback:
+                self.fallback.feed(self._undecided)
+            self._undecided = ""
+        if self.structured:
+            self.truncated = not self._done
+            self._entry = None
+        return self.fallback.close() if self.fallback else self.entries
+
+
+def parse_files(text):
+    """
+    Parses a whole response in one pass. Returns [(path, content)] if it is a JSON file list
+    (the complete entries, if it was truncated), or None for any other text, which the
+    caller then parses in its tag format.
+    """
+    parser = FileListStreamParser()
+    parser.feed(text or "")
+    parser.close()
+    return parser.entries if parser.structured else None
+
+
+class ResponseFormat:
+    """
+    The response format of a run: the converter's tag format, or (structured) a JSON file
+    list enforced by the model's response schema, with the tag format as fallback. Counts
+    the structured responses that fell back to tags and the unit outputs that could not be
+    parsed at all, for the run report. Safe to share between worker threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self, structured=False):
+        """Selects the format of a run and clears the counts."""
+        with self._lock:
+            self.structured = structured
+            self.responses = 0
+            self.json_failures = 0
+            self.outputs = 0
+            self.unparsed = 0
+
+    def instructions(self, paths):
+        """Prompt section asking for the JSON file list ("" unless structured); `paths` says how to name the files."""
+        return STRUCTURED_INSTRUCTIONS.format(paths=paths) if self.structured else ""
+
+    def stream_parser(self, fallback, on_file=None):
+        """Parser for a streamed response: the tag-format `fallback` itself, unless structured."""
+        return FileListStreamParser(on_file, fallback) if self.structured else fallback
+
+    def record_response(self, text):
+        """Counts a fresh (not cached) response of a structured run: a complete JSON file list or not."""
+        if self.structured:
+            parser = FileListStreamParser()
+            parser.feed(text or "")
+            parser.close()
+            self.record_parser(parser)
+
+    def record_parser(self, parser):
+        """Same as record_response, for a response streamed into `parser` (made by stream_parser)."""
+        if not self.structured:
+            return
+        with self._lock:
+            self.responses += 1
+            if not parser.structured or parser.truncated:
+                self.json_failures += 1
+
+    def record_output(self, parsed):
+        """Counts a unit's output: `parsed` is whether its files could be extracted, in either format."""
+        with self._lock:
+            self.outputs += 1
+            if not parsed:
+                self.unparsed += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "mode": "json" if self.structured else "tags",
+                "responses": self.responses,
+                "json_failures": self.json_failures,
+                "json_failure_rate": round(self.json_failures / self.responses, 4) if self.responses else 0.0,
+                "outputs": self.outputs,
+                "unparsed_outputs": self.unparsed,
+                "unparsed_rate": round(self.unparsed / self.outputs, 4) if self.outputs else 0.0,
+            }
+
+    def print_stats(self):
+        stats = self.stats()
+        line = f"Response parsing ({stats['mode']}): {stats['unparsed_outputs']} of {stats['outputs']} output(s) unparsed"
+        if stats["mode"] == "json":
+            line += f", {stats['json_failures']} of {stats['responses']} response(s) fell back to the tag format"
+        print(line)
@@ -0,0 +1,208 @@
+import re
+
+
+IMPORT_RE = re.compile(r'^import\b[^;]*;[ \t]*\n?', re.MULTILINE)
+# Default and/or named imports, e.g. import Foo, { Bar, Baz as Qux } from './foo';
+IMPORT_CLAUSE_RE = re.compile(
+    r'^import\s+(?P<type>type\s+)?(?:(?P<default>[\w$]+)\s*,?\s*)?(?:\{(?P<named>[^}]*)\})?'
+    r'\s*from\s*(?P<quote>[\'"])(?P<source>[^\'"]+)(?P=quote)\s*;$',
+    re.DOTALL
+)
+CLASS_RE = re.compile(r'^export\s+(?:default\s+)?(?:abstract\s+)?class\s+(?P<name>\w+)[^{]*\{', re.MULTILINE)
+DECLARATION_RE = re.compile(
+    r'^export\s+(?:default\s+)?(?:abstract\s+)?(?:interface|class|type|enum|const|function)\s+(?P<name>\w+)',
+    re.MULTILINE
+)
+GAP_RE = re.compile(r'(?:\s+|//[^\n]*|/\*.*?\*/)*', re.DOTALL)
+MEMBER_PREFIX_RE = re.compile(r'^(?:\s*@\w+(?:\([^)]*\))?\s*)*(?:(?:public|private|protected|readonly|static|async|override)\s+)*')
+
+
+def _skip_literal(text, i):
+    """Returns the index just past the string or template literal starting at text[i]."""
+    quote = text[i]
+    i += 1
+    while i < len(text):
+        if text[i] == '\\':
+            i += 2
+            continue
+        if text[i] == quote:
+            return i + 1
+        i += 1
+    return i
+
+
+def _statement_end(text, start):
+    """
+    Returns the index just past the statement or member starting at `start`: either a `;`
+    at nesting depth zero, or a closing brace back to depth zero that is not followed by
+    `;`, `,`, `)` or `.` (so `x = { a: 1 };` is one statement). Literals and comments are skipped.
+    """
+    depth = 0
+    i = start
+    while i < len(text):
+        char = text[i]
+        if char in '"\'`':
+            i = _skip_literal(text, i)
+            continue
+        if text.startswith('//', i):
+            i = text.find('\n', i)
+            if i == -1:
+                return len(text)
+            continue
+        if text.startswith('/*', i):
+            i = text.find('*/', i + 2)
+            if i == -1:
+                return len(text)
+            i += 2
+            continue
+        if char in '{([':
+            depth += 1
+        elif char in '})]':
+            depth -= 1
+            if depth == 0 and char == '}':
+                following = text[i + 1:].lstrip()
+                if not following or following[0] not in ';,).':
+                    return i + 1
+        elif char == ';' and depth == 0:
+            return i + 1
+        i += 1
+    return len(text)
+
+
+def _class_members(body):
+    """Splits a class body into top-level member source strings."""
+    members = []
+    i = 0
+    while True:
+        # Skip whitespace and comments between members
+        i = GAP_RE.match(body, i).end()
+        if i >= len(body):
+            return members
+        end = _statement_end(body, i)
+        members.append(body[i:end])
+        i = end
+
+
+def _member_key(member):
+    """Identifies a member by name (decorators and modifiers ignored), e.g. 'constructor' or 'getBooks'."""
+    match = re.match(r'(?:get\s+|set\s+)?[\w$]+', MEMBER_PREFIX_RE.sub('', member, count=1))
+    return match.group(0) if match else member.strip()
+
+
+def _class_spans(text):
+    """Maps class name -> (body start, closing brace index)."""
+    spans = {}
+    for match in CLASS_RE.finditer(text):
+        close = _statement_end(text, match.end() - 1) - 1
+        spans[match.group('name')] = (match.end(), close)
+    return spans
+
+
+def _local_name(specifier):
+    """The name a named import specifier binds, e.g. 'Qux' for 'Baz as Qux' or 'Foo' for 'type Foo'."""
+    return specifier.split()[-1]
+
+
+def merge_imports(statements):
+    """
+    Merges import statements into one per module source (and kind: `import type` is kept
+    apart), with the union of their default and named specifiers; a name imported twice
+    is kept once. Namespace and side-effect imports are only deduplicated. A statement that
+    gains no specifiers is kept as written.
+    """
+    merged = {}  # key -> [statement, default, {local name: specifier}, changed]
+    for statement in statements:
+        statement = statement.strip()
+        match = IMPORT_CLAUSE_RE.match(statement)
+        if not match or not (match.group('default') or match.group('named') is not None):
+            merged.setdefault(statement, [statement, None, {}, False])
+            continue
+        key = (match.group('source'), bool(match.group('type')))
+        entry = merged.get(key)
+        specifiers = [" ".join(s.split()) for s in (match.group('named') or "").split(",") if s.strip()]
+        if entry is None:
+            merged[key] = [statement, match.group('default'), {_local_name(s): s for s in specifiers}, False]
+            continue
+        default = match.group('default')
+        if default and entry[1] and default != entry[1]:
+            # Two default names for one module cannot share a statement
+            merged.setdefault(statement, [statement, None, {}, False])
+        elif default and not entry[1]:
+            entry[1] = default
+            entry[3] = True
+        for specifier in specifiers:
+            if _local_name(specifier) not in entry[2]:
+                entry[2][_local_name(specifier)] = specifier
+                entry[3] = True
+
+    imports = []
+    for key, (statement, default, named, changed) in merged.items():
+        if not changed:
+            imports.append(statement)
+            continue
+        source, type_only = key
+        quote = IMPORT_CLAUSE_RE.match(statement).group('quote')
+        clauses = [default] if default else []
+        if named:
+            clauses.append("{ " + ", ".join(named.values()) + " }")
+        imports.append(f"import {'type ' if type_only else ''}{', '.join(clauses)} from {quote}{source}{quote};")
+    return imports
+
+
+def merge_typescript_sources(versions):
+    """
+    Merges several generated versions of the same TypeScript file into one. Imports are
+    merged per module (merge_imports), members missing from a class in the first version
+    are appended to it, and top-level declarations missing from the first version are
+    appended to the file.
+    """
+    versions = [version for version in versions if version]
+    if not versions:
+        return ""
+    if all(version == versions[0] for version in versions):
+        return versions[0]
+
+    imports = merge_imports(statement for version in versions for statement in IMPORT_RE.findall(version))
+
+    merged = IMPORT_RE.sub('', versions[0]).strip()
+    for version in versions[1:]:
+        other = IMPORT_RE.sub('', version).strip()
+
+        for name, (body_start, body_end) in _class_spans(other).items():
+            classes = _class_spans(merged)
+            if name not in classes:
+                continue
+            base_start, base_end = classes[name]
+            existing = {_member_key(member) for member in _class_members(merged[base_start:base_end])}
+            additions = [member for member in _class_members(other[body_start:body_end])
+                         if _member_key(member) not in existing]
+            if additions:
+                insertion = "".join(f"\n\n  {member.strip()}" for member in additions)
+                merged = merged[:base_end].rstrip() + insertion + "\n" + merged[base_end:]
+
+        declared = {match.group('name') for match in DECLARATION_RE.finditer(merged)}
+        for match in DECLARATION_RE.finditer(other):
+            if match.group('name') not in declared:
+                merged += "\n\n" + other[match.start():_statement_end(other, match.start())].strip()
+
+    return ("\n".join(imports) + "\n\n" + merged).strip() if imports else merged
+
+
+def split_declarations(text):
+    """Maps the name of every top-level exported declaration in a TypeScript file to its source."""
+    return {
+        match.group('name'): text[match.start():_statement_end(text, match.start())].strip()
+        for match in DECLARATION_RE.finditer(text)
+    }
+
+
+def merge_generated_files(chunk_files):
+    """
+    Combines the files generated for each chunk of a service ({filename: content} dicts)
+    into one set, merging files that several chunks produced. Filenames keep first-seen order.
+    """
+    versions = {}
+    for files in chunk_files:
+        for filename, content in files.items():
+            versions.setdefault(filename, []).append(content)
+    return {filename: merge_typescript_sources(contents) for filename, contents in versions.items()}
@@ -0,0 +1,181 @@
+import os
+import queue
+import time
+
+
+# Seconds between two scans of the tree when polling
+POLL_INTERVAL = 1.0
+
+# Directories holding build output, dependencies or VCS data; never scanned
+SKIPPED_DIRS = {'bin', 'obj', '.git', '.vs', 'node_modules', 'packages'}
+
+# Events that mean a file's content may have changed; watchdog also reports files being opened and read
+CHANGE_EVENTS = {"created", "modified", "deleted", "moved", "closed"}
+
+
+def normalize_path(path):
+    """The form in which changed paths are reported and compared."""
+    return os.path.normcase(os.path.abspath(path))
+
+
+def touches(changed, paths):
+    """Whether any of `paths` is among the `changed` paths (as returned by the watchers)."""
+    return any(normalize_path(path) in changed for path in paths if path)
+
+
+def recorded_inputs(entry):
+    """Input paths of a unit as recorded in its manifest entry (None: no inputs)."""
+    return [hashes["path"] for hashes in (entry or {}).get("inputs", {}).values()]
+
+
+class PollingWatcher:
+    """
+    Detects changes by scanning the tree every `interval` seconds and comparing the
+    modification time and size of each watched file with the previous scan, so added and
+    removed files are seen too. Works everywhere, including on network drives.
+    """
+
+    def __init__(self, root, extensions, skipped_dirs=(), interval=POLL_INTERVAL):
+        """
+        Args:
+            extensions (tuple): Suffixes of the watched files, e.g. (".svc", ".cs").
+            skipped_dirs (set): Lowercase names of directories that are never scanned.
+        """
+        self.root = root
+        self.extensions = tuple(extensions)
+        self.skipped_dirs = set(skipped_dirs)
+        self.interval = interval
+        self._files = self._scan()
+
+    def _scan(self):
+        files = {}
+        for subdir, dirs, names in os.walk(self.root):
+            dirs[:] = [d for d in dirs if d.lower() not in self.skipped_dirs]
+            for name in names:
+                if not name.endswith(self.extensions):
+                    continue
+                path = os.path.join(subdir, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files[normalize_path(path)] = (stat.st_mtime_ns, stat.st_size)
+        return files
+
+    def changes(self, timeout=None):
+        """Waits up to `timeout` seconds (None: until a file changes). Returns the changed paths."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = self.interval if deadline is None else max(0.0, deadline - time.monotonic())
+            time.sleep(min(self.interval, remaining))
+            files = self._scan()
+            changed = {path for path in files.keys() | self._files.keys() if files.get(path) != self._files.get(path)}
+            self._files = files
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed
+
+    def stop(self):
+        pass
+
+
+class NotifyingWatcher:
+    """
+    Receives changes from the operating system (inotify on Linux, FSEvents on macOS,
+    ReadDirectoryChangesW on Windows) through the optional watchdog package, so an idle
+    watch scans nothing. Raises ImportError if watchdog is not installed.
+    """
+
+    def __init__(self, root, extensions, skipped_dirs=()):
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+
+        self.root = root
+        self.extensions = tuple(extensions)
+        self.skipped_dirs = set(skipped_dirs)
+        self._events = queue.Queue()
+        watcher = self
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.is_directory or event.event_type not in CHANGE_EVENTS:
+                    return
+                # A save by rename (write to a temporary file, move it over the original) changes dest_path
+                for path in (event.src_path, getattr(event, "dest_path", None)):
+                    if path and watcher._watched(os.fsdecode(path)):
+                        watcher._events.put(normalize_path(os.fsdecode(path)))
+
+        self._observer = Observer()
+        self._observer.schedule(Handler(), root, recursive=True)
+        self._observer.start()
+
+    def _watched(self, path):
+        directories = os.path.relpath(path, self.root).split(os.sep)[:-1]
+        return path.endswith(self.extensions) and not any(d.lower() in self.skipped_dirs for d in directories)
+
+    def changes(self, timeout=None):
+        """Waits up to `timeout` seconds (None: until a file changes). Returns the changed paths."""
+        try:
+            changed = {self._events.get(timeout=timeout)}
+        except queue.Empty:
+            return set()
+        while True:
+            try:
+                changed.add(self._events.get_nowait())
+            except queue.Empty:
+                return changed
+
+    def stop(self):
+        self._observer.stop()
+        self._observer.join()
+
+
+def create_watcher(root, extensions, skipped_dirs=(), poll_interval=None):
+    """
+    Watches `root` with filesystem notifications, or by polling every `poll_interval`
+    seconds if one is given or watchdog is not installed.
+    """
+    if poll_interval is None:
+        try:
+            return NotifyingWatcher(root, extensions, skipped_dirs)
+        except ImportError:
+            poll_interval = POLL_INTERVAL
+            print(f"watchdog is not installed; polling for changes every {poll_interval:g}s.")
+    return PollingWatcher(root, extensions, skipped_dirs, poll_interval)
+
+
+def wait_for_changes(watcher, debounce):
+    """
+    Blocks until files change, then until none has changed for `debounce` seconds, so a
+    burst of saves (e.g. "save all" or a branch switch) is handled once. Returns the changed paths.
+    """
+    changed = set()
+    while not changed:
+        changed = watcher.changes()
+    while True:
+        more = watcher.changes(debounce)
+        if not more:
+            return changed
+        changed |= more
+
+
+def watch(watcher, on_change, debounce, max_cycles=None):
+    """
+    Calls `on_change(changed paths)` after every debounced burst of changes until
+    interrupted with Ctrl+C, or after `max_cycles` bursts. Changes made while on_change
+    runs make up the next burst. A failing on_change is reported and the watch goes on.
+    """
+    cycles = 0
+    try:
+        while max_cycles is None or cycles < max_cycles:
+            changed = wait_for_changes(watcher, debounce)
+            names = sorted(os.path.basename(path) for path in changed)
+            print(f"\n👀 {len(changed)} file(s) changed: {', '.join(names)}")
+            try:
+                on_change(changed)
+            except Exception as e:
+                print(f"❌ Reconversion failed: {e}; waiting for the next change.")
+            cycles += 1
+    except KeyboardInterrupt:
+        print("\nWatch stopped.")
+    finally:
+        watcher.stop()